@@ -13,6 +13,19 @@ import threading
 from collections import defaultdict
 import math
 import numpy as np
+from indicadores import (pendiente_movil, calcular_rate_velas, VolumeRegressionIncremental,
+                         volume_regression_ultimo, apilar_velas, calcular_metricas_lote,
+                         ATRIncremental, atr_normalizado_lote)
+from velas import archivo_de_sesion, cache_velas, intervalo_a_ms
+from tickers import stream_tickers, snapshot_tickers, almacen_funding
+from instrumentos import cache_instrumentos
+from cuenta import espejo_cuenta
+from eventos_velas import bus_velas
+from simulador import crear_exchange_simulado
+from grabador import grabador_mercado
+from peticiones import SesionAgrupada
+from puertas import evaluar_puertas
+from coinalyze import extraer_tabla_html, tabla_a_dataframe, navegador_coinalyze, cliente_coinalyze, convertir_tabla_coinalyze
 import csv
 import json
 
@@ -108,8 +121,16 @@ BYBIT_CONFIG = {
     "api_key": os.getenv("BYBIT_API_KEY"),
     "api_secret": os.getenv("BYBIT_SECRET_KEY"),
     "testnet": os.getenv("BYBIT_TESTNET", "False").lower() == "true",
+    # Exchange local en proceso para pruebas sin red (ver simulador.py)
+    "simulador": os.getenv("BYBIT_SIMULADOR", "False").lower() == "true",
+    # Segundos que se reutiliza una lectura REST idéntica (0 = solo agrupar las simultáneas)
+    "ttl_lecturas": float(os.getenv("BYBIT_TTL_LECTURAS", "1.0")),
 }
 
+# Grabar tickers, velas y tablas de Coinalyze para reproducirlos offline (ver grabador.py)
+if os.getenv("GRABAR_MERCADO"):
+    grabador_mercado.activar(os.getenv("GRABAR_MERCADO"))
+
 # Estados de operación
 ESTADOS = {
     "SIN_OPERAR": 0,
@@ -136,6 +157,10 @@ bot_salir = False
 ultimo_cierre_vela = {}
 precios_velas_actuales = {}
 
+# Estado incremental de Volume Regression por símbolo (monitoreo)
+estados_volume_regression = {}
+estados_atr = {}
+
 # ========== SISTEMA DE REGISTRO Y ESTADÍSTICAS ==========
 
 estadisticas = {
@@ -330,49 +355,19 @@ def calcular_volume_regression(df, short_len=7, long_len=50, source='close'):
     df = df.copy()
     
     # 1. Regresión de Precio (pendiente) - usando short_len
-    def calcular_slope(series, length):
-        if len(series) < length:
-            return np.nan
-        x = np.arange(len(series))
-        slope = np.polyfit(x, series, 1)[0]
-        return slope
-    
-    # Precio: usamos short_len con la fuente especificada
-    price_source = df[source]
-    df['slope_price'] = price_source.rolling(short_len).apply(
-        lambda x: calcular_slope(x, short_len), raw=True
-    )
-    
-    # 2. Análisis de volumen por lado
-    def calcular_rate(row):
-        try:
-            high, low, open_, close = row['high'], row['low'], row['open'], row['close']
-            tw = high - max(open_, close)  # Top wick
-            bw = min(open_, close) - low   # Bottom wick  
-            body = abs(close - open_)      # Body
-            
-            if open_ <= close:  # Vela verde (compra)
-                ret = 0.5 * (tw + bw + (2 * body)) / (tw + bw + body)
-            else:  # Vela roja (venta)
-                ret = 0.5 * (tw + bw + 0) / (tw + bw + body)
-            
-            return ret if not np.isnan(ret) else 0.5
-        except:
-            return 0.5
+    # Pendiente OLS en forma cerrada (sin np.polyfit por ventana)
+    df['slope_price'] = pendiente_movil(df[source], short_len)
     
-    df['rate'] = df.apply(calcular_rate, axis=1)
+    # 2. Análisis de volumen por lado (vectorizado sobre todas las velas)
+    df['rate'] = calcular_rate_velas(df['open'], df['high'], df['low'], df['close'])
     
     # 3. Volumen por lado
     df['volume_up'] = df['volume'] * df['rate']
     df['volume_down'] = df['volume'] * (1 - df['rate'])
     
     # 4. Regresión de Volumen - usando long_len
-    df['slope_volume_up'] = df['volume_up'].rolling(long_len).apply(
-        lambda x: calcular_slope(x, long_len), raw=True
-    )
-    df['slope_volume_down'] = df['volume_down'].rolling(long_len).apply(
-        lambda x: calcular_slope(x, long_len), raw=True
-    )
+    df['slope_volume_up'] = pendiente_movil(df['volume_up'], long_len)
+    df['slope_volume_down'] = pendiente_movil(df['volume_down'], long_len)
     
     # 5. Señales
     df['vol_up'] = np.where(
@@ -391,65 +386,90 @@ def calcular_volume_regression(df, short_len=7, long_len=50, source='close'):
 
 # ========== SISTEMA DETECCIÓN LATERALIZACIÓN (3 HORAS) ==========
 
+def calcular_metricas_lateralizacion(symbols, periodo='5', horas_analizar=3):
+    """
+    Obtiene las velas de todos los símbolos y calcula sus métricas de lateralización
+    en una sola pasada vectorizada (símbolos × velas). Devuelve {symbol: métricas}
+    solo para los símbolos con datos suficientes.
+    """
+    # Calcular número de velas necesarias para 3 horas
+    if periodo == '5':  # 5 minutos
+        velas_necesarias = (horas_analizar * 60) // 5
+    elif periodo == '15':  # 15 minutos
+        velas_necesarias = (horas_analizar * 60) // 15
+    elif periodo == '1':  # 1 minuto
+        velas_necesarias = horas_analizar * 60
+    else:  # Por defecto 5 minutos
+        velas_necesarias = 36  # 3 horas en velas de 5 min
+    
+    print(f"   🔍 Analizando lateralización de {len(symbols)} activos: {horas_analizar}h en {periodo}m ({velas_necesarias} velas)")
+    
+    # Obtener datos OHLCV
+    datos_por_simbolo = {}
+    for symbol in symbols:
+        datos = obtener_datos_para_volume_regression(symbol, periodo, velas_necesarias)
+        
+        if datos is None or len(datos) < velas_necesarias:
+            print(f"   ⚠️  Datos insuficientes para análisis lateral {symbol}")
+            continue
+        datos_por_simbolo[symbol] = datos
+    
+    if not datos_por_simbolo:
+        return {}
+    
+    # Rango, tendencia de volumen y pendientes de todos los símbolos a la vez
+    metricas = calcular_metricas_lote(**apilar_velas(datos_por_simbolo.values(), velas_necesarias),
+                                      periodo_atr=None)
+    
+    resultado = {}
+    for i, (symbol, datos) in enumerate(datos_por_simbolo.items()):
+        resultado[symbol] = {nombre: float(valores[i]) for nombre, valores in metricas.items()}
+        # ATR normalizado con el estado incremental del símbolo
+        resultado[symbol]['fuerza_tendencia'] = float(calcular_fuerza_tendencia(datos.tail(velas_necesarias), symbol))
+    
+    return resultado
+
+def evaluar_criterios_lateralizacion(symbol, metricas):
+    """Aplica los criterios de lateralización a las métricas de un símbolo"""
+    rango_porcentual = metricas['rango_porcentual']
+    volumen_tendencia = metricas['tendencia_volumen']
+    fuerza_tendencia = metricas['fuerza_tendencia']
+    
+    print(f"   📊 Métricas lateralización {symbol}:")
+    print(f"      📈 Rango precio: {rango_porcentual:.2f}%")
+    print(f"      📉 Tendencia volumen: {volumen_tendencia:.2f}")
+    print(f"      💪 Fuerza tendencia: {fuerza_tendencia:.2f}")
+    
+    # Criterios para considerar lateralización
+    en_rango = rango_porcentual < 2.5  # Menos del 2% de rango
+    volumen_decreciente = volumen_tendencia < -0.1  # Volumen en disminución
+    sin_tendencia_fuerte = fuerza_tendencia < 0.3  # Baja fuerza de tendencia
+    
+    # Está en lateral si cumple al menos 2 de 3 criterios
+    criterios_cumplidos = sum([en_rango, volumen_decreciente, sin_tendencia_fuerte])
+    en_lateralizacion = criterios_cumplidos >= 2
+    
+    if en_lateralizacion:
+        print(f"   🟡 {symbol} EN RANGO LATERAL - {criterios_cumplidos}/3 criterios")
+        print(f"      {'✅' if en_rango else '❌'} Rango <2%: {rango_porcentual:.2f}%")
+        print(f"      {'✅' if volumen_decreciente else '❌'} Volumen ↘: {volumen_tendencia:.2f}")
+        print(f"      {'✅' if sin_tendencia_fuerte else '❌'} Sin tendencia: {fuerza_tendencia:.2f}")
+    else:
+        print(f"   🟢 {symbol} CON TENDENCIA - {criterios_cumplidos}/3 criterios")
+    
+    return en_lateralizacion
+
 def esta_en_rango_lateral(symbol, periodo='5', horas_analizar=3):
     """
     Determina si un activo está en rango lateral en las últimas 3 horas
     """
     try:
-        # Calcular número de velas necesarias para 3 horas
-        if periodo == '5':  # 5 minutos
-            velas_necesarias = (horas_analizar * 60) // 5
-        elif periodo == '15':  # 15 minutos
-            velas_necesarias = (horas_analizar * 60) // 15
-        elif periodo == '1':  # 1 minuto
-            velas_necesarias = horas_analizar * 60
-        else:  # Por defecto 5 minutos
-            velas_necesarias = 36  # 3 horas en velas de 5 min
-        
-        print(f"   🔍 Analizando lateralización {symbol}: {horas_analizar}h en {periodo}m ({velas_necesarias} velas)")
-        
-        # Obtener datos OHLCV
-        datos = obtener_datos_para_volume_regression(symbol, periodo, velas_necesarias)
+        metricas = calcular_metricas_lateralizacion([symbol], periodo, horas_analizar)
         
-        if datos is None or len(datos) < velas_necesarias:
-            print(f"   ⚠️  Datos insuficientes para análisis lateral")
+        if symbol not in metricas:
             return False
         
-        # 1. Calcular rango de precio (máximo vs mínimo)
-        high_max = datos['high'].max()
-        low_min = datos['low'].min()
-        precio_promedio = (high_max + low_min) / 2
-        rango_porcentual = ((high_max - low_min) / precio_promedio) * 100
-        
-        # 2. Calcular tendencia de volumen
-        volumen_tendencia = calcular_tendencia_volumen(datos)
-        
-        # 3. Calcular fuerza de tendencia (usando ATR y volatilidad)
-        fuerza_tendencia = calcular_fuerza_tendencia(datos)
-        
-        print(f"   📊 Métricas lateralización {symbol}:")
-        print(f"      📈 Rango precio: {rango_porcentual:.2f}%")
-        print(f"      📉 Tendencia volumen: {volumen_tendencia:.2f}")
-        print(f"      💪 Fuerza tendencia: {fuerza_tendencia:.2f}")
-        
-        # Criterios para considerar lateralización
-        en_rango = rango_porcentual < 2.5  # Menos del 2% de rango
-        volumen_decreciente = volumen_tendencia < -0.1  # Volumen en disminución
-        sin_tendencia_fuerte = fuerza_tendencia < 0.3  # Baja fuerza de tendencia
-        
-        # Está en lateral si cumple al menos 2 de 3 criterios
-        criterios_cumplidos = sum([en_rango, volumen_decreciente, sin_tendencia_fuerte])
-        en_lateralizacion = criterios_cumplidos >= 2
-        
-        if en_lateralizacion:
-            print(f"   🟡 {symbol} EN RANGO LATERAL - {criterios_cumplidos}/3 criterios")
-            print(f"      {'✅' if en_rango else '❌'} Rango <2%: {rango_porcentual:.2f}%")
-            print(f"      {'✅' if volumen_decreciente else '❌'} Volumen ↘: {volumen_tendencia:.2f}")
-            print(f"      {'✅' if sin_tendencia_fuerte else '❌'} Sin tendencia: {fuerza_tendencia:.2f}")
-        else:
-            print(f"   🟢 {symbol} CON TENDENCIA - {criterios_cumplidos}/3 criterios")
-        
-        return en_lateralizacion
+        return evaluar_criterios_lateralizacion(symbol, metricas[symbol])
         
     except Exception as e:
         print(f"❌ Error en análisis lateralización {symbol}: {e}")
@@ -476,28 +496,41 @@ def calcular_tendencia_volumen(datos):
     tendencia = (volumen_final - volumen_inicial) / volumen_inicial
     return tendencia
 
-def calcular_fuerza_tendencia(datos):
+def calcular_fuerza_tendencia(datos, symbol=None):
     """
-    Calcula la fuerza de la tendencia usando ATR normalizado
+    Calcula la fuerza de la tendencia usando ATR normalizado.
+    Con `symbol` mantiene un ATR incremental por símbolo (O(1) por vela nueva)
     """
     if len(datos) < 14:
         return 0
     
-    # Calcular ATR básico
-    high_low = datos['high'] - datos['low']
-    high_close_prev = abs(datos['high'] - datos['close'].shift(1))
-    low_close_prev = abs(datos['low'] - datos['close'].shift(1))
-    
-    true_range = pd.concat([high_low, high_close_prev, low_close_prev], axis=1).max(axis=1)
-    atr = true_range.rolling(window=14).mean()
-    
-    # Normalizar ATR por el precio
-    atr_normalizado = (atr / datos['close']) * 100
-    
-    # Usar el último ATR como medida de fuerza de tendencia
-    fuerza = atr_normalizado.iloc[-1] if not atr_normalizado.empty else 0
+    # Sin símbolo o sin timestamps (simulación): ATR de las últimas 14 velas, vectorizado
+    if symbol is None or 'timestamp' not in datos:
+        return float(atr_normalizado_lote(datos['high'], datos['low'], datos['close'])[0])
+    
+    # La última fila es la vela en curso: solo se incorporan al estado las cerradas
+    velas_cerradas = datos.iloc[:-1]
+    estado = estados_atr.get(symbol)
+    nuevas = velas_cerradas
+    if estado is not None and estado.ultimo_timestamp is not None:
+        nuevas = velas_cerradas[velas_cerradas['timestamp'] > estado.ultimo_timestamp]
+    
+    # Sin estado, o sin la vela anterior a las nuevas en los datos (hueco): arrancar en frío
+    if estado is None or (len(nuevas) and len(nuevas) == len(velas_cerradas)):
+        estado = ATRIncremental()
+        estado.cargar_historial(velas_cerradas)
+        estados_atr[symbol] = estado
+    else:
+        for vela in nuevas.to_dict('records'):
+            estado.actualizar(vela)
     
-    return fuerza
+    return estado.atr_normalizado(vela_en_curso=datos.iloc[-1])
+
+def podar_estados_atr(symbols):
+    """Descarta el ATR incremental de los símbolos que ya no están entre los candidatos"""
+    for symbol in list(estados_atr):
+        if symbol not in symbols:
+            del estados_atr[symbol]
 
 def filtrar_activos_sin_lateralizacion(activos_disponibles):
     """
@@ -505,13 +538,28 @@ def filtrar_activos_sin_lateralizacion(activos_disponibles):
     """
     print(f"\n🎯 FILTRANDO ACTIVOS SIN LATERALIZACIÓN (3h)...")
     
+    # Métricas de todos los candidatos en una sola pasada
+    symbols = [activo['simbolo_bybit'] for activo in activos_disponibles]
+    podar_estados_atr(symbols)
+    try:
+        metricas = calcular_metricas_lateralizacion(symbols)
+    except Exception as e:
+        print(f"❌ Error en análisis lateralización por lote: {e}")
+        metricas = {}
+    
     activos_filtrados = []
     for activo in activos_disponibles:
         symbol = activo['simbolo_bybit']
         moneda = activo['moneda']
         
-        # Verificar si está en lateralización
-        if not esta_en_rango_lateral(symbol):
+        # Verificar si está en lateralización (sin datos suficientes no se descarta)
+        if symbol in metricas:
+            activo['metricas_lateralizacion'] = metricas[symbol]
+            en_lateral = evaluar_criterios_lateralizacion(symbol, metricas[symbol])
+        else:
+            en_lateral = False
+        
+        if not en_lateral:
             activos_filtrados.append(activo)
             print(f"   ✅ {moneda} ({symbol}): CON TENDENCIA - Apto para operar")
         else:
@@ -520,6 +568,45 @@ def filtrar_activos_sin_lateralizacion(activos_disponibles):
     print(f"📊 Resultado filtro: {len(activos_filtrados)} de {len(activos_disponibles)} activos con tendencia")
     return activos_filtrados
 
+def evaluar_candidatos(activos_disponibles):
+    """
+    Etapa de evaluación de candidatos: descarga las velas de cada símbolo una sola
+    vez y con ellas evalúa todas las puertas de entrada (lateralización, fuerza tendencial y funding).
+    Devuelve un veredicto por activo:
+    {'activo', 'symbol', 'moneda', 'apto', 'motivo', 'metricas', 'funding_rate', 'tiempos'}
+    donde 'tiempos' tiene la duración en ms de cada puerta ('datos' es la descarga por lote).
+    """
+    print(f"\n🎯 EVALUANDO CANDIDATOS (lateralización, fuerza tendencial y funding)...")
+    
+    # Velas y métricas de todos los candidatos en una sola pasada
+    inicio = time.perf_counter()
+    symbols = [activo['simbolo_bybit'] for activo in activos_disponibles]
+    podar_estados_atr(symbols)
+    try:
+        metricas = calcular_metricas_lateralizacion(symbols)
+    except Exception as e:
+        print(f"❌ Error en análisis lateralización por lote: {e}")
+        metricas = {}
+    tiempo_datos = (time.perf_counter() - inicio) * 1000
+    
+    veredictos = []
+    for activo in activos_disponibles:
+        symbol = activo['simbolo_bybit']
+        if symbol in metricas:
+            activo['metricas_lateralizacion'] = metricas[symbol]
+        
+        # Puertas en orden (puertas.evaluar_puertas): la primera que falla descarta
+        veredictos.append(evaluar_puertas(activo, metricas.get(symbol), evaluar_criterios_lateralizacion,
+                                          obtener_funding_rate,
+                                          tendencia_sin_metricas=verificar_fuerza_tendencial_positiva,
+                                          tiempo_datos=tiempo_datos))
+    
+    aptos = sum(1 for veredicto in veredictos if veredicto['apto'])
+    tiempo_puertas = sum(t for veredicto in veredictos for puerta, t in veredicto['tiempos'].items() if puerta != 'datos')
+    print(f"📊 Resultado evaluación: {aptos} de {len(activos_disponibles)} candidatos aptos")
+    print(f"   ⏱️  Datos: {tiempo_datos:.0f} ms | Puertas: {tiempo_puertas:.1f} ms")
+    return veredictos
+
 def obtener_datos_para_volume_regression(symbol, periodo='5', limite=100):
     """Obtiene datos de OHLCV para calcular Volume Regression - CON MÁS DATOS"""
     if not PYBIT_INSTALADO or not bybit_session:
@@ -543,30 +630,9 @@ def obtener_datos_para_volume_regression(symbol, periodo='5', limite=100):
         return pd.DataFrame(data)
     
     try:
-        response = bybit_session.get_kline(
-            category="linear",
-            symbol=symbol,
-            interval=periodo,
-            limit=limite  # ✅ Obtener más datos para long_len=50
-        )
+        # Cache compartida: una descarga por vela sirve a todos los consumidores
+        return cache_velas.obtener(bybit_session, symbol, periodo, limite)
         
-        if response['retCode'] == 0:
-            datos = response['result']['list']
-            # Los datos vienen en orden inverso (más antiguo primero)
-            datos.reverse()
-            df = pd.DataFrame(datos, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'
-            ])
-            
-            # Convertir tipos
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            return df
-        else:
-            print(f"❌ Error obteniendo datos para {symbol}: {response.get('retMsg')}")
-            return None
-            
     except Exception as e:
         print(f"❌ Error en obtener_datos_para_volume_regression: {e}")
         return None
@@ -577,6 +643,47 @@ def obtener_datos_para_volume_regression(symbol, periodo='5', limite=100):
     precios_velas_actuales[symbol]['maximo'] = max(precios_velas_actuales[symbol]['maximo'], precio_actual)
     precios_velas_actuales[symbol]['minimo'] = min(precios_velas_actuales[symbol]['minimo'], precio_actual)
 
+def obtener_señales_volume_regression(symbol, periodo='5', limite=100, vela_en_curso=True):
+    """
+    Señales Volume Regression de la última vela usando el estado incremental del símbolo.
+    Con `vela_en_curso=False` se devuelven las de la última vela CERRADA.
+    """
+    estado = estados_volume_regression.get(symbol)
+    
+    # Con el historial ya cargado basta con las últimas velas (la recién cerrada y la vela en curso)
+    if estado is not None and estado.ultimo_timestamp is not None:
+        datos = obtener_datos_para_volume_regression(symbol, periodo, 3)
+        if datos is None or datos.empty or 'timestamp' not in datos:
+            return None
+        
+        intervalo_ms = int(periodo) * 60 * 1000 if periodo.isdigit() else None
+        velas_cerradas = datos.iloc[:-1].to_dict('records')
+        nuevas = [v for v in velas_cerradas if int(v['timestamp']) > estado.ultimo_timestamp]
+        
+        # Si se saltó alguna vela (hueco), reconstruir el estado desde el historial
+        if nuevas and (intervalo_ms is None or
+                       int(nuevas[0]['timestamp']) != estado.ultimo_timestamp + intervalo_ms):
+            estado = None
+        else:
+            for vela in nuevas:
+                estado.actualizar(vela)
+            return estado.ultimo(vela_en_curso=datos.iloc[-1].to_dict() if vela_en_curso else None)
+    
+    # Sin estado (o con hueco): cargar historial completo una sola vez
+    datos = obtener_datos_para_volume_regression(symbol, periodo, limite)
+    if datos is None or len(datos) < 50:
+        return None
+    
+    # Sin timestamps (simulación) no hay estado que mantener: evaluar solo la última ventana
+    if 'timestamp' not in datos:
+        return volume_regression_ultimo(datos if vela_en_curso else datos.iloc[:-1])
+    
+    estado = VolumeRegressionIncremental()
+    estado.cargar_historial(datos.iloc[:-1])
+    estados_volume_regression[symbol] = estado
+    
+    return estado.ultimo(vela_en_curso=datos.iloc[-1].to_dict() if vela_en_curso else None)
+
 
 # ========== SISTEMA DE PROTECCIÓN +5%/-2% ==========
 
@@ -634,7 +741,7 @@ def cerrar_todas_posiciones():
     
     try:
         # Obtener todas las posiciones abiertas
-        response = bybit_session.get_positions(category="linear", settleCoin="USDT")
+        response = espejo_cuenta.get_positions(category="linear", settleCoin="USDT")
         
         if response['retCode'] == 0:
             for position in response['result']['list']:
@@ -777,7 +884,7 @@ def verificar_estado_posiciones_reales():
     
     try:
         print("🔍 Verificando estado real de posiciones en Bybit...")
-        response = bybit_session.get_positions(category="linear", settleCoin="USDT")
+        response = espejo_cuenta.get_positions(category="linear", settleCoin="USDT")
         
         if response['retCode'] == 0:
             posiciones_reales = {}
@@ -858,6 +965,116 @@ def verificar_estado_posiciones_reales():
     except Exception as e:
         print(f"❌ Error verificando posiciones reales: {e}") 
 
+def salida_volume_regression(symbol, señales):
+    """Muestra la fuerza tendencial y devuelve True si la Volume Regression pide cerrar el LONG"""
+    slope_price = señales['slope_price']
+    print(f"         umbral = -0.000003")
+    
+    if slope_price >= 0:
+        print(f"         🟢 Fuerza Tendencial: {slope_price:.6f}")
+    else:
+        print(f"         🔴 Fuerza Tendencial: {slope_price:.6f}")
+    
+    if slope_price < -0.000003:
+        print(f"         🟥 🚨 Bajo volumen, se cerrara posición")
+        return True
+    return False
+
+def tp_avanzado_alcanzado(symbol, operacion, precio_actual):
+    """Tipo de cierre si el precio alcanzó un TP avanzado (TP_LONG_AVANZADO / TP_SHORT_AVANZADO) o None"""
+    tp_long = operacion.get('tp_long_avanzado')
+    tp_short = operacion.get('tp_short_avanzado')
+    
+    if not (tp_long and tp_short):
+        return None
+    
+    print(f"   🎯 VERIFICANDO TP AVANZADO {symbol}:")
+    print(f"      📊 Precio actual: ${precio_actual:.6f}")
+    print(f"      📈 TP Long: ${tp_long:.6f} (+{((tp_long - operacion['precio_long'])/operacion['precio_long']*100):.2f}%)")
+    print(f"      📉 TP Short: ${tp_short:.6f} (-{((operacion['precio_short'] - tp_short)/operacion['precio_short']*100):.2f}%)")
+    
+    # VERIFICACIÓN TP LONG
+    if precio_actual >= tp_long:
+        print(f"🎯 🟢 TP LONG ACTIVADO: {symbol}")
+        print(f"   📈 Precio actual ${precio_actual:.6f} >= TP Long ${tp_long:.6f}")
+        print(f"   💰 Ganancia LONG: {((precio_actual - operacion['precio_long'])/operacion['precio_long']*100):.2f}%")
+        return "TP_LONG_AVANZADO"
+    
+    # VERIFICACIÓN TP SHORT
+    if precio_actual <= tp_short:
+        print(f"🎯 🔴 TP SHORT ACTIVADO: {symbol}")
+        print(f"   📉 Precio actual ${precio_actual:.6f} <= TP Short ${tp_short:.6f}")
+        print(f"   💰 Ganancia SHORT: {((operacion['precio_short'] - precio_actual)/operacion['precio_short']*100):.2f}%")
+        return "TP_SHORT_AVANZADO"
+    
+    # MONITOREO CONTINUO (sin activación)
+    dist_long_pct = ((tp_long - precio_actual) / precio_actual) * 100
+    dist_short_pct = ((precio_actual - tp_short) / precio_actual) * 100
+    
+    print(f"      📏 Distancia a TP Long: +{dist_long_pct:.2f}%")
+    print(f"      📏 Distancia a TP Short: -{dist_short_pct:.2f}%")
+    return None
+
+# ========== EVENTOS DE CIERRE DE VELA ==========
+
+def actualizar_indicadores_vela(symbol, intervalo, vela):
+    """Incorpora la vela cerrada del stream al estado Volume Regression del símbolo (sin REST)"""
+    estado = estados_volume_regression.get(symbol)
+    if estado is None or estado.ultimo_timestamp is None or intervalo != '5':
+        return
+    
+    if vela['timestamp'] == estado.ultimo_timestamp + intervalo_a_ms(intervalo):
+        estado.actualizar(vela)
+    elif vela['timestamp'] > estado.ultimo_timestamp:
+        # Se perdió alguna vela: el próximo cálculo reconstruye el estado desde el historial
+        del estados_volume_regression[symbol]
+
+def salida_cierre_vela(symbol, operacion, vela):
+    """
+    Motivo de cierre ("Volume Regression" o el tipo de TP avanzado) evaluado con la vela CERRADA, o None.
+    Lo usan el stream de velas y, sin stream, el monitoreo con la última vela
+    cerrada por REST: así la misma posición recibe la misma decisión por ambos caminos.
+    """
+    precio_cierre = vela['close']
+    
+    if operacion['estado'] == ESTADOS["LONG_ABIERTO"]:
+        cambio_actual = ((precio_cierre - operacion['precio_long']) / operacion['precio_long']) * 100
+        if cambio_actual > 1.0:
+            # Señales de la vela cerrada (sin la vela en curso)
+            estado = estados_volume_regression.get(symbol)
+            if estado is not None and estado.ultimo_timestamp == vela.get('timestamp'):
+                señales = estado.ultimo()
+            else:
+                señales = obtener_señales_volume_regression(symbol, vela_en_curso=False)
+            
+            if señales is not None and salida_volume_regression(symbol, señales):
+                return "Volume Regression"
+    
+    elif operacion['estado'] == ESTADOS["AMBOS_ABIERTOS"]:
+        return tp_avanzado_alcanzado(symbol, operacion, precio_cierre)
+    return None
+
+def verificar_salidas_cierre_vela(symbol, intervalo, vela):
+    """Volume Regression y TP avanzado evaluados con el precio de CIERRE de la vela"""
+    operacion = operaciones_activas.get(symbol)
+    if operacion is None or intervalo != '5':
+        return
+    
+    print(f"\n🕯️  Vela {intervalo}m cerrada {symbol}: ${vela['close']:.6f}")
+    motivo = salida_cierre_vela(symbol, operacion, vela)
+    if motivo == "Volume Regression":
+        cerrar_posicion_long_real(symbol, motivo)
+    elif motivo:
+        cerrar_ambas_posiciones_con_registro(symbol, motivo)
+
+def salida_ultima_vela_cerrada(symbol, operacion, intervalo='5'):
+    """Sin stream de velas: salida_cierre_vela con la última vela cerrada descargada por REST"""
+    datos = obtener_datos_para_volume_regression(symbol, intervalo, 3)
+    if datos is None or len(datos) < 2:
+        return None
+    # La última fila es la vela en curso: se evalúa la anterior, igual que el stream
+    return salida_cierre_vela(symbol, operacion, datos.to_dict('records')[-2])
+
 # ========== SISTEMA DE MONITOREO MEJORADO ==========
 
 def monitorear_operaciones():
@@ -872,6 +1089,17 @@ def monitorear_operaciones():
     while monitoreo_activo and not bot_salir:
         ciclo_monitoreo += 1
         try:
+            espejo_cuenta.descartar_cierres()  # Este ciclo ya lee el estado completo
+            
+            # Velas de las operaciones abiertas: suscribir las nuevas y atender los cierres pendientes
+            bus_velas.seguir(list(operaciones_activas), '5')
+            bus_velas.despachar()
+            
+            # Estado Volume Regression solo de las operaciones que siguen abiertas
+            for symbol in list(estados_volume_regression):
+                if symbol not in operaciones_activas:
+                    del estados_volume_regression[symbol]
+            
             # ✅ SOLUCIÓN SIMPLE: Verificar y limpiar operaciones cerradas externamente
             if operaciones_activas and not bot_salir:
                 # Verificar si hay operaciones reales (no simuladas)
@@ -879,7 +1107,7 @@ def monitorear_operaciones():
                 
                 if not operaciones_simuladas and PYBIT_INSTALADO and bybit_session:
                     try:
-                        response = bybit_session.get_positions(category="linear", settleCoin="USDT")
+                        response = espejo_cuenta.get_positions(category="linear", settleCoin="USDT")
                         if response['retCode'] == 0:
                             posiciones_reales = []
                             for position in response['result']['list']:
@@ -918,6 +1146,9 @@ def monitorear_operaciones():
             print(f"\n🔄 [MONITOREO {ciclo_monitoreo}] {datetime.now().strftime('%H:%M:%S')} - {len(operaciones_activas)} operaciones")
             print("=" * 50)
             
+            # Precios de todas las posiciones con una sola llamada
+            actualizar_snapshot_tickers()
+            
             operaciones_cerradas = 0
             
             for symbol, operacion in list(operaciones_activas.items()):
@@ -946,28 +1177,13 @@ def monitorear_operaciones():
                             operaciones_cerradas += 1
                         continue
                     
-                    # 2. ✅ VOLUME REGRESSION (solo en ganancias > +1%)
-                    if cambio_actual > 1.0:
-                        df_datos = obtener_datos_para_volume_regression(symbol)
-                        
-                        if df_datos is not None and len(df_datos) >= 50:
-                            df_volume = calcular_volume_regression(df_datos)
-                            
-                            if not df_volume.empty:
-                                ultima_señal = df_volume['vol_down'].iloc[-1]
-                                slope_price = df_volume['slope_price'].iloc[-1]
-                                print(f"         umbral = -0.000003")
-                                
-                                if slope_price >= 0:
-                                    print(f"         🟢 Fuerza Tendencial: {slope_price:.6f}")
-                                else:
-                                    print(f"         🔴 Fuerza Tendencial: {slope_price:.6f}")
-                                
-                                if slope_price < -0.000003:
-                                    print(f"         🟥 🚨 Bajo volumen, se cerrara posición")
-                                    if cerrar_posicion_long_real(symbol, "Volume Regression"):
-                                        operaciones_cerradas += 1
-                                    continue
+                    # 2. ✅ VOLUME REGRESSION (solo en ganancias > +1%; se evalúa al cierre de vela: con el
+                    #    stream al llegar la vela y, sin stream, aquí con la última vela cerrada)
+                    if not bus_velas.conectado():
+                        if salida_ultima_vela_cerrada(symbol, operacion):
+                            if cerrar_posicion_long_real(symbol, "Volume Regression"):
+                                operaciones_cerradas += 1
+                            continue
                     
                     # 3. ✅ PROTECCIÓN DE GANANCIAS
                     if verificar_proteccion_ganancias(symbol, operacion, precio_actual):
@@ -1078,42 +1294,12 @@ def monitorear_operaciones():
                         else:
                             print(f"❌ ADD FUNDS FALLÓ - No se guardó estado")
 
-                # 6. ✅ VERIFICAR TP AVANZADO (NUEVA IMPLEMENTACIÓN)
-                if operacion['estado'] == ESTADOS["AMBOS_ABIERTOS"]:
-                    tp_long = operacion.get('tp_long_avanzado')
-                    tp_short = operacion.get('tp_short_avanzado')
-                    
-                    if tp_long and tp_short:
-                        print(f"   🎯 VERIFICANDO TP AVANZADO {symbol}:")
-                        print(f"      📊 Precio actual: ${precio_actual:.6f}")
-                        print(f"      📈 TP Long: ${tp_long:.6f} (+{((tp_long - operacion['precio_long'])/operacion['precio_long']*100):.2f}%)")
-                        print(f"      📉 TP Short: ${tp_short:.6f} (-{((operacion['precio_short'] - tp_short)/operacion['precio_short']*100):.2f}%)")
-                        
-                        # VERIFICACIÓN TP LONG
-                        if precio_actual >= tp_long:
-                            print(f"🎯 🟢 TP LONG ACTIVADO: {symbol}")
-                            print(f"   📈 Precio actual ${precio_actual:.6f} >= TP Long ${tp_long:.6f}")
-                            print(f"   💰 Ganancia LONG: {((precio_actual - operacion['precio_long'])/operacion['precio_long']*100):.2f}%")
-                            if cerrar_ambas_posiciones_con_registro(symbol, "TP_LONG_AVANZADO"):
-                                operaciones_cerradas += 1
-                                continue
-                        
-                        # VERIFICACIÓN TP SHORT
-                        elif precio_actual <= tp_short:
-                            print(f"🎯 🔴 TP SHORT ACTIVADO: {symbol}")
-                            print(f"   📉 Precio actual ${precio_actual:.6f} <= TP Short ${tp_short:.6f}")
-                            print(f"   💰 Ganancia SHORT: {((operacion['precio_short'] - precio_actual)/operacion['precio_short']*100):.2f}%")
-                            if cerrar_ambas_posiciones_con_registro(symbol, "TP_SHORT_AVANZADO"):
-                                operaciones_cerradas += 1
-                                continue
-                        
-                        # MONITOREO CONTINUO (sin activación)
-                        else:
-                            dist_long_pct = ((tp_long - precio_actual) / precio_actual) * 100
-                            dist_short_pct = ((precio_actual - tp_short) / precio_actual) * 100
-                            
-                            print(f"      📏 Distancia a TP Long: +{dist_long_pct:.2f}%")
-                            print(f"      📏 Distancia a TP Short: -{dist_short_pct:.2f}%")
+                # 6. ✅ VERIFICAR TP AVANZADO (al cierre de vela; sin stream, con la última vela cerrada)
+                if operacion['estado'] == ESTADOS["AMBOS_ABIERTOS"] and not bus_velas.conectado():
+                    tipo_tp = salida_ultima_vela_cerrada(symbol, operacion)
+                    if tipo_tp and cerrar_ambas_posiciones_con_registro(symbol, tipo_tp):
+                        operaciones_cerradas += 1
+                        continue
 
                 # 7. ✅ VERIFICAR CIERRE AMBAS POSICIONES (precio POR DEBAJO del SHORT después de ADD FUNDS)
                 if (operacion['estado'] == ESTADOS["AMBOS_ABIERTOS"] and 
@@ -1150,13 +1336,15 @@ def monitorear_operaciones():
             if operaciones_cerradas > 0:
                 print(f"📤 Operaciones cerradas en este ciclo: {operaciones_cerradas}")
                 
+            # Copiar el estado bajo el lock y consultar precios fuera de él
             with operaciones_lock:
-                for symbol, op in operaciones_activas.items():
-                    estado_str = list(ESTADOS.keys())[list(ESTADOS.values()).index(op['estado'])]
-                    precio_actual = obtener_precio_actual(symbol)
-                    precio_long = op['precio_long']
-                    cambio = ((precio_actual - precio_long) / precio_long) * 100
-                    print(f"   🟡 {symbol}: {estado_str} | P&L {cambio:+.2f}%")
+                resumen = [(symbol, op['estado'], op['precio_long']) for symbol, op in operaciones_activas.items()]
+            
+            for symbol, estado, precio_long in resumen:
+                estado_str = list(ESTADOS.keys())[list(ESTADOS.values()).index(estado)]
+                precio_actual = obtener_precio_actual(symbol)
+                cambio = ((precio_actual - precio_long) / precio_long) * 100
+                print(f"   🟡 {symbol}: {estado_str} | P&L {cambio:+.2f}%")
             
             # ESPERA 30 SEGUNDOS CON COUNTDOWN
             print(f"\n⏰ Próxima verificación de MONITOREO en:")
@@ -1166,7 +1354,13 @@ def monitorear_operaciones():
                 tiempo_restante = 30 - (time.time() - tiempo_inicio)
                 mins, secs = divmod(int(tiempo_restante), 60)
                 print(f"\r   {mins:02d}:{secs:02d}", end="", flush=True)
-                time.sleep(1)
+                # Los streams avisan al instante si se cierra una posición o una vela seguida
+                if espejo_cuenta.esperar_cierre(0):
+                    print("\r⚡ Cierre de posición detectado - Verificando ya")
+                    break
+                if bus_velas.esperar(1):
+                    print("\r🕯️  Vela cerrada - Evaluando salidas al cierre")
+                    break
             
             if not bot_salir:
                 print("\r✅ ¡Iniciando nueva verificación de MONITOREO!                    ")
@@ -1188,7 +1382,7 @@ def recuperar_estado_desconexion():
         print("🔄 Recuperando estado después de desconexión...")
         
         # 1. Obtener posiciones reales de Bybit
-        response = bybit_session.get_positions(category="linear", settleCoin="USDT")
+        response = espejo_cuenta.get_positions(category="linear", settleCoin="USDT")
         
         if response['retCode'] == 0:
             for position in response['result']['list']:
@@ -1231,7 +1425,7 @@ def verificar_posiciones_cerradas():
     for symbol, operacion in operaciones_activas.items():
         try:
             # Verificar posiciones abiertas en Bybit
-            positions_response = bybit_session.get_positions(
+            positions_response = espejo_cuenta.get_positions(
                 category="linear", 
                 symbol=symbol
             )
@@ -1274,7 +1468,7 @@ def actualizar_estado_operaciones():
     for symbol, operacion in list(operaciones_activas.items()):
         try:
             # Verificar si la posición long sigue abierta
-            positions_response = bybit_session.get_positions(
+            positions_response = espejo_cuenta.get_positions(
                 category="linear", 
                 symbol=symbol
             )
@@ -1383,7 +1577,7 @@ def obtener_cantidad_posicion(symbol, position_idx):
         return "0.001"  # Simulación
     
     try:
-        positions = bybit_session.get_positions(category="linear", symbol=symbol)
+        positions = espejo_cuenta.get_positions(category="linear", symbol=symbol)
         if positions['retCode'] == 0:
             for position in positions['result']['list']:
                 if float(position['size']) > 0:
@@ -1452,25 +1646,25 @@ def obtener_info_symbol(symbol):
             'min_order_value': 5.0,
         }
     
+    # Tabla precargada de instrumentos: el cálculo de órdenes no consulta la red
+    symbol_info = cache_instrumentos.obtener(symbol)
+    
+    if symbol_info:
+        return symbol_info
+    else:
+        print(f"❌ No se pudo obtener info para {symbol}")
+        return None
+
+def actualizar_snapshot_tickers():
+    """Descarga la tabla completa de tickers lineales (una sola llamada por ciclo)"""
+    if not PYBIT_INSTALADO or not bybit_session:
+        return False
+    
     try:
-        response = bybit_session.get_instruments_info(category="linear", symbol=symbol)
-        
-        if response['retCode'] == 0 and response['result']['list']:
-            symbol_info = response['result']['list'][0]
-            lot_size_filter = symbol_info.get('lotSizeFilter', {})
-            
-            return {
-                'min_order_qty': float(lot_size_filter.get('minOrderQty', '0.001')),
-                'qty_step': float(lot_size_filter.get('qtyStep', '0.001')),
-                'min_order_value': float(symbol_info.get('minOrderAmt', '5.0')),
-            }
-        else:
-            print(f"❌ No se pudo obtener info para {symbol}")
-            return None
-            
+        return snapshot_tickers.actualizar(bybit_session)
     except Exception as e:
-        print(f"❌ Error obteniendo info símbolo: {e}")
-        return None
+        print(f"⚠️  Error obteniendo snapshot de tickers: {e}")
+        return False
 
 def obtener_precio_actual(symbol):
     """Obtiene el precio actual del símbolo"""
@@ -1480,10 +1674,11 @@ def obtener_precio_actual(symbol):
         return 100.0 + random.uniform(-5, 5)
     
     try:
-        response = bybit_session.get_tickers(category="linear", symbol=symbol)
+        # Tabla en memoria alimentada por WebSocket; REST solo si el dato está viejo
+        precio = stream_tickers.precio(symbol, bybit_session)
         
-        if response['retCode'] == 0 and response['result']['list']:
-            return float(response['result']['list'][0]['lastPrice'])
+        if precio:
+            return precio
         else:
             print(f"❌ Error obteniendo precio para {symbol}")
             return 0
@@ -1645,16 +1840,11 @@ def abrir_posicion_long(symbol, cantidad_usdt=5.5):
 def obtener_precio_entrada_real(symbol, order_id, side):
     """Obtiene el precio real de ejecución de la orden"""
     try:
-        # Obtener información de la orden ejecutada
-        order_info = bybit_session.get_order_history(
-            category="linear",
-            symbol=symbol,
-            orderId=order_id
-        )
+        # Ejecución real de la orden (evento del stream privado o historial REST)
+        ejecucion = espejo_cuenta.esperar_ejecucion(symbol, order_id=order_id)
         
-        if order_info['retCode'] == 0 and order_info['result']['list']:
-            order_data = order_info['result']['list'][0]
-            avg_price = float(order_data['avgPrice'])
+        if ejecucion and ejecucion['cantidad'] > 0:
+            avg_price = ejecucion['precio']
             print(f"💰 Precio real de ejecución: ${avg_price:.6f}")
             return avg_price
         
@@ -1826,9 +2016,8 @@ def verificar_fuerza_tendencial_positiva(symbol, periodo='5', velas=30):
         if datos is None or len(datos) < velas:
             return False
         
-        # Calcular pendiente del precio (fuerza tendencial)
-        df_volume = calcular_volume_regression(datos)
-        slope_price = df_volume['slope_price'].iloc[-1]
+        # Calcular pendiente del precio (fuerza tendencial) solo de la última ventana
+        slope_price = volume_regression_ultimo(datos)['slope_price']
         
         print(f"   📊 Fuerza tendencial {symbol}: {slope_price:.8f}")
         
@@ -1871,18 +2060,22 @@ def operar_monedas_calificadas(activos_disponibles):
     print(f"📈 Espacios disponibles: {MAX_MONEDAS_SIMULTANEAS - len(operaciones_activas)}")
     print("=" * 60)
     
-    # ✅ APLICAR FILTRO DE LATERALIZACIÓN
-    activos_con_tendencia = filtrar_activos_sin_lateralizacion(activos_disponibles)
+    # Precios y funding de todos los candidatos con una sola llamada
+    actualizar_snapshot_tickers()
+    
+    # ✅ EVALUAR PUERTAS DE ENTRADA (una sola descarga de velas por candidato)
+    veredictos = evaluar_candidatos(activos_disponibles)
+    candidatos_aptos = [veredicto for veredicto in veredictos if veredicto['apto']]
     
-    if not activos_con_tendencia:
-        print("🚫 No hay activos con tendencia clara - Saltando operaciones")
+    if not candidatos_aptos:
+        print("🚫 No hay candidatos aptos - Saltando operaciones")
         return
     
     monedas_operadas = 0
     
-    for activo in activos_con_tendencia:
-        symbol = activo['simbolo_bybit']
-        moneda = activo['moneda']
+    for veredicto in candidatos_aptos:
+        symbol = veredicto['symbol']
+        moneda = veredicto['moneda']
         
         # Verificar límite de monedas
         if len(operaciones_activas) >= MAX_MONEDAS_SIMULTANEAS:
@@ -1895,19 +2088,6 @@ def operar_monedas_calificadas(activos_disponibles):
             break
             
         print(f"\n📈 Operando {moneda} ({symbol})...")
-
-        # FUERZA TENDENCIAL POSITIVA
-        if not verificar_fuerza_tendencial_positiva(symbol):
-            print(f"   ❌ Fuerza tendencial negativa - Saltando {symbol}")
-            continue
-        
-        # Verificar funding rate
-        funding_rate = obtener_funding_rate(symbol)
-        print(f"   📊 Funding Rate: {funding_rate:.4f}%")
-        
-        if funding_rate >= 0.06:
-            print(f"   ❌ Funding rate muy alto - Saltando")
-            continue
         
         # Verificar si ya tenemos operación activa
         if symbol in operaciones_activas:
@@ -2000,7 +2180,7 @@ def cerrar_posicion_long_real(symbol, motivo="General"):
         # Obtener cantidad real de Bybit
         print(f"   🔍 Obteniendo cantidad REAL de posición LONG desde Bybit...")
         
-        positions_response = bybit_session.get_positions(category="linear", symbol=symbol)
+        positions_response = espejo_cuenta.get_positions(category="linear", symbol=symbol)
         if positions_response['retCode'] != 0:
             print(f"❌ Error obteniendo posición de Bybit: {positions_response.get('retMsg')}")
             return False
@@ -2039,22 +2219,23 @@ def cerrar_posicion_long_real(symbol, motivo="General"):
             print(f"✅ ORDEN DE CIERRE enviada exitosamente!")
             order_id = response['result']['orderId']
             
-            # Esperar confirmación
+            # Esperar la ejecución real (stream privado; historial REST si no llega a tiempo)
             print(f"   ⏳ Esperando confirmación de cierre...")
-            time.sleep(3)
+            ejecucion = espejo_cuenta.esperar_ejecucion(symbol, order_id=order_id)
             
             # Verificar cierre
-            positions_after = bybit_session.get_positions(category="linear", symbol=symbol)
-            long_cerrado = True
-            
-            if positions_after['retCode'] == 0:
-                for position in positions_after['result']['list']:
-                    if position['side'] == 'Buy' and float(position['size']) > 0:
-                        long_cerrado = False
-                        break
+            if ejecucion and ejecucion['cantidad'] >= float(qty_str):
+                long_cerrado = True
+            else:
+                # Sin ejecución completa: dar tiempo a que la posición desaparezca
+                long_cerrado = espejo_cuenta.esperar_posicion_cerrada(symbol, side='Buy')
             
             if long_cerrado:
-                precio_cierre = obtener_precio_actual(symbol)
+                if ejecucion and ejecucion['cantidad'] > 0:
+                    precio_cierre = ejecucion['precio']
+                    print(f"   💵 Ejecutado: {ejecucion['cantidad']} @ ${precio_cierre:.6f} (comisión ${ejecucion['comision']:.4f})")
+                else:
+                    precio_cierre = obtener_precio_actual(symbol)
                 ganancia_porcentaje = ((precio_cierre - precio_long_actual) / precio_long_actual) * 100
                 
                 # Determinar tipo de cierre
@@ -2280,7 +2461,7 @@ def obtener_montos_reales_posiciones(symbol):
     try:
         print(f"   🔍 Obteniendo montos reales desde Bybit para {symbol}...")
         
-        response = bybit_session.get_positions(category="linear", symbol=symbol)
+        response = espejo_cuenta.get_positions(category="linear", symbol=symbol)
         
         if response['retCode'] == 0:
             monto_long = 0.0
@@ -2327,7 +2508,7 @@ def obtener_montos_reales_posiciones(symbol):
     try:
         print(f"   🔍 Obteniendo montos reales desde Bybit para {symbol}...")
         
-        response = bybit_session.get_positions(category="linear", symbol=symbol)
+        response = espejo_cuenta.get_positions(category="linear", symbol=symbol)
         
         if response['retCode'] == 0:
             monto_long = 0.0
@@ -2364,25 +2545,20 @@ def obtener_montos_reales_posiciones(symbol):
         return CANTIDAD_USDT, CANTIDAD_USDT * 2.0
 
 def obtener_funding_rate(symbol):
-    """Obtiene el funding rate actual para un símbolo"""
+    """Obtiene el funding rate previsto para un símbolo (None si no hay dato)"""
     if not PYBIT_INSTALADO or not bybit_session:
         return 0.01
     
     try:
-        response = bybit_session.get_funding_rate_history(
-            category="linear",
-            symbol=symbol,
-            limit=1
-        )
-        
-        if response['retCode'] == 0 and response['result']['list']:
-            funding_rate = float(response['result']['list'][0]['fundingRate']) * 100
-            return funding_rate
-        else:
-            return 0.05
-            
+        # Almacén llenado desde el snapshot de tickers: solo se recarga al pasar la hora de funding
+        funding_rate = almacen_funding.funding_rate(symbol, bybit_session)
     except Exception as e:
-        return 0.05
+        print(f"❌ Error obteniendo funding rate de {symbol}: {e}")
+        return None
+    
+    if funding_rate is None:
+        print(f"❌ Funding rate no disponible para {symbol}")
+    return funding_rate
     
 def obtener_balance_total():
     """Obtiene el balance total actual de la cuenta"""
@@ -2460,7 +2636,7 @@ def inicializar_bybit():
     """Inicializa la conexión con Bybit - MANTENIENDO HEDGE MODE"""
     global bybit_session
     
-    if not BYBIT_CONFIG["api_key"] or not BYBIT_CONFIG["api_secret"]:
+    if not BYBIT_CONFIG["simulador"] and (not BYBIT_CONFIG["api_key"] or not BYBIT_CONFIG["api_secret"]):
         print("❌ No se encontraron las credenciales de Bybit")
         return False
     
@@ -2469,18 +2645,47 @@ def inicializar_bybit():
         return False
     
     try:
-        bybit_session = HTTP(
-            testnet=BYBIT_CONFIG["testnet"],
-            api_key=BYBIT_CONFIG["api_key"],
-            api_secret=BYBIT_CONFIG["api_secret"],
-        )
+        if BYBIT_CONFIG["simulador"]:
+            bybit_session = crear_exchange_simulado()
+        else:
+            bybit_session = HTTP(
+                testnet=BYBIT_CONFIG["testnet"],
+                api_key=BYBIT_CONFIG["api_key"],
+                api_secret=BYBIT_CONFIG["api_secret"],
+            )
+            # Velas cerradas en disco, una carpeta por red (las del simulador son sintéticas y no se archivan)
+            cache_velas.usar_archivo(archivo_de_sesion("testnet" if BYBIT_CONFIG["testnet"] else "mainnet"))
+        
+        # Lecturas idénticas de ambos hilos (balance, posiciones...) comparten una llamada
+        bybit_session = SesionAgrupada(bybit_session, ttl=BYBIT_CONFIG["ttl_lecturas"])
         
         print("🔗 Probando conexión con Bybit...")
         response = bybit_session.get_wallet_balance(accountType="UNIFIED")
         
         if response['retCode'] == 0:
             print("✅ Conexión con Bybit establecida correctamente")
-            print(f"   Modo: {'TESTNET' if BYBIT_CONFIG['testnet'] else 'LIVE'}")
+            print(f"   Modo: {'SIMULADOR' if BYBIT_CONFIG['simulador'] else 'TESTNET' if BYBIT_CONFIG['testnet'] else 'LIVE'}")
+            
+            # Metadatos de todos los contratos de una vez (tamaños de orden sin red)
+            if cache_instrumentos.actualizar(bybit_session):
+                print(f"✅ Instrumentos cargados: {len(cache_instrumentos)} contratos lineales")
+            
+            # Cierres de vela de las operaciones abiertas: indicadores y salidas al cierre
+            bus_velas.al_cerrar_vela(actualizar_indicadores_vela)
+            bus_velas.al_cerrar_vela(verificar_salidas_cierre_vela)
+            
+            if BYBIT_CONFIG["simulador"]:
+                # Sin streams: el exchange simulado responde todo por REST
+                espejo_cuenta.iniciar(bybit_session, None, None)
+            else:
+                # Copia local de posiciones y órdenes mantenida por los streams privados
+                espejo_cuenta.iniciar(bybit_session, BYBIT_CONFIG["api_key"], BYBIT_CONFIG["api_secret"],
+                                      BYBIT_CONFIG["testnet"])
+                
+                # Precios en tiempo real por WebSocket (si falla se sigue con REST)
+                stream_tickers.iniciar(testnet=BYBIT_CONFIG["testnet"])
+                
+                bus_velas.iniciar(testnet=BYBIT_CONFIG["testnet"])
             
             # Configurar Hedge Mode como antes
             if configurar_hedge_mode():
@@ -2605,18 +2810,11 @@ def obtener_cantidad_posicion_por_order_id(symbol, order_id):
             return str(5.5 / precio_actual)   # Simular cantidad para LONG inicial
     
     try:
-        # Obtener información de la orden ejecutada
-        order_info = bybit_session.get_order_history(
-            category="linear",
-            symbol=symbol,
-            orderId=order_id
-        )
+        # Ejecución de la orden (ya guardada por el stream si es reciente; si no, historial REST)
+        ejecucion = espejo_cuenta.esperar_ejecucion(symbol, order_id=order_id, timeout=1)
         
-        if order_info['retCode'] == 0 and order_info['result']['list']:
-            order_data = order_info['result']['list'][0]
-            cantidad_ejecutada = order_data.get('execQty', '0')
-            if cantidad_ejecutada and float(cantidad_ejecutada) > 0:
-                return cantidad_ejecutada
+        if ejecucion and ejecucion['cantidad'] > 0:
+            return str(ejecucion['cantidad'])
         
         return None
         
@@ -2627,25 +2825,20 @@ def obtener_cantidad_posicion_por_order_id(symbol, order_id):
 def obtener_pares_bybit():
     """Obtiene todos los pares de trading disponibles en Bybit"""
     if not PYBIT_INSTALADO or not bybit_session:
-        pares_simulados = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "ADAUSDT", "DOTUSDT"]
+        pares_simulados = {"BTCUSDT", "ETHUSDT", "SOLUSDT", "ADAUSDT", "DOTUSDT"}
         return pares_simulados
     
     try:
-        symbol_info = bybit_session.get_instruments_info(category="linear")
-        pares_disponibles = []
-        if symbol_info['retCode'] == 0:
-            for symbol in symbol_info['result']['list']:
-                pares_disponibles.append(symbol['symbol'])
-            print(f"📊 Pares disponibles en Bybit: {len(pares_disponibles)}")
-        else:
-            print(f"❌ Error obteniendo pares: {symbol_info.get('retMsg', 'Unknown error')}")
-            return []
+        # Cache de instrumentos (se descarga de nuevo solo cuando caduca)
+        if not cache_instrumentos.asegurar(bybit_session):
+            return set()
         
-        return pares_disponibles
+        print(f"📊 Pares disponibles en Bybit: {len(cache_instrumentos)}")
+        return cache_instrumentos.simbolos
         
     except Exception as e:
         print(f"❌ Error obteniendo pares de Bybit: {e}")
-        return []
+        return cache_instrumentos.simbolos
 
 def verificar_operaciones_abiertas(symbol):
     """Verifica si hay operaciones abiertas para un símbolo específico"""
@@ -2653,13 +2846,13 @@ def verificar_operaciones_abiertas(symbol):
         return False, "Sin operaciones abiertas (simulado)"
     
     try:
-        positions = bybit_session.get_positions(category="linear", symbol=symbol)
+        positions = espejo_cuenta.get_positions(category="linear", symbol=symbol)
         if positions['retCode'] == 0:
             for position in positions['result']['list']:
                 if float(position['size']) > 0:
                     return True, f"Posición abierta: {position['size']} contratos"
         
-        orders = bybit_session.get_open_orders(category="linear", symbol=symbol)
+        orders = espejo_cuenta.get_open_orders(category="linear", symbol=symbol)
         if orders['retCode'] == 0:
             if len(orders['result']['list']) > 0:
                 order_count = len(orders['result']['list'])
@@ -2725,18 +2918,20 @@ def filtrar_activos_disponibles_bybit(activos_seleccionados):
 
 def obtener_tabla_coinalyze(url):
     """Obtiene la tabla de datos de CoinAlyze - VERSIÓN GOOGLE CLOUD"""
-    print("🌐 Iniciando Chrome para Google Cloud...")
-    driver = configurar_chrome_cloud()
+    # Primero sin navegador: la tabla del HTML que envía el servidor (Selenium solo si no está)
+    df = cliente_coinalyze.obtener_tabla(url)
+    if df is not None:
+        return df
+    
+    # Chrome sigue abierto entre ciclos: solo se refresca la página y se espera a que la tabla tenga filas
+    driver = navegador_coinalyze.cargar(url, configurar_chrome_cloud)
     
     if not driver:
         print("❌ No se pudo inicializar Chrome. Usando datos de respaldo...")
         return crear_dataframe_respaldo()
     
     try:
-        print("📄 Cargando página de CoinAlyze...")
-        driver.get(url)
         wait = WebDriverWait(driver, 30)
-        time.sleep(12)  # Más tiempo para cargar JavaScript
         
         print("🔍 Buscando tabla de datos...")
         table_selectors = [
@@ -2770,58 +2965,24 @@ def obtener_tabla_coinalyze(url):
             else:
                 raise Exception("No se pudo encontrar ninguna tabla en la página")
         
-        # Obtener headers
-        headers = []
-        try:
-            header_rows = table_elem.find_elements(By.TAG_NAME, "thead")
-            if header_rows:
-                header_cells = header_rows[0].find_elements(By.TAG_NAME, "th")
-                headers = [cell.text.strip() for cell in header_cells if cell.text.strip()]
-            
-            if not headers:
-                # Si no hay thead, buscar en la primera fila
-                primera_fila = table_elem.find_element(By.TAG_NAME, "tr")
-                header_cells = primera_fila.find_elements(By.TAG_NAME, "th")
-                headers = [cell.text.strip() for cell in header_cells if cell.text.strip()]
-            
+        # Una sola lectura del HTML de la tabla y extracción local (sin una llamada WebDriver por celda)
+        inicio_extraccion = time.time()
+        headers, filas = extraer_tabla_html(table_elem.get_attribute('outerHTML'))
+        
+        if headers:
             print(f"✅ Headers encontrados: {headers}")
-        except Exception as e:
-            print(f"❌ Error obteniendo headers: {e}")
+        else:
+            print("❌ Error obteniendo headers: la tabla no tiene encabezados")
             # Headers por defecto basados en CoinAlyze
             headers = ['COIN', 'PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H']
         
-        # Obtener datos
-        datos = []
-        try:
-            # Buscar filas de datos
-            rows = table_elem.find_elements(By.TAG_NAME, "tr")
-            print(f"📊 Se encontraron {len(rows)} filas")
-            
-            for i, row in enumerate(rows):
-                try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
-                    if cells and len(cells) >= len(headers):
-                        fila_datos = [cell.text.strip() for cell in cells]
-                        # Filtrar filas vacías
-                        if any(fila_datos) and fila_datos[0] != '':
-                            if len(fila_datos) > len(headers):
-                                fila_datos = fila_datos[:len(headers)]
-                            datos.append(fila_datos)
-                            
-                            # Mostrar progreso cada 10 filas
-                            if len(datos) % 10 == 0:
-                                print(f"   📝 Procesadas {len(datos)} filas...")
-                except Exception as e:
-                    print(f"❌ Error procesando fila {i}: {e}")
-                    continue
-                    
-        except Exception as e:
-            print(f"❌ Error obteniendo datos: {e}")
-            return crear_dataframe_respaldo()
+        # Obtener datos (mismo formato que la descarga por HTTP: sin la celda inicial vacía)
+        print(f"📊 Se encontraron {len(filas)} filas")
+        df = tabla_a_dataframe(headers, filas)
+        print(f"⚡ Tabla extraída en {(time.time() - inicio_extraccion) * 1000:.0f} ms")
         
         # Crear DataFrame
-        if datos:
-            df = pd.DataFrame(datos, columns=headers)
+        if not df.empty:
             print(f"✅ DataFrame creado con {len(df)} filas y {len(df.columns)} columnas")
             
             # Mostrar lista de monedas encontradas
@@ -2846,125 +3007,97 @@ def obtener_tabla_coinalyze(url):
             
     except Exception as e:
         print(f"❌ Error durante el scraping: {e}")
+        navegador_coinalyze.descartar()  # Próximo ciclo con un Chrome nuevo
         return crear_dataframe_respaldo()
-    
-    finally:
-        if driver:
-            driver.quit()
-            print("✅ Chrome cerrado")
-
-def limpiar_y_convertir_valor(valor):
-    """Convierte valores como '$40.6m' a numérico"""
-    if not valor or valor == 'n/a' or valor == 'ERROR' or valor == '':
-        return 0
-    
-    try:
-        valor_limpio = str(valor).replace('$', '').replace(',', '').replace(' ', '').strip()
-        if 'b' in valor_limpio.lower():
-            return float(valor_limpio.lower().replace('b', '')) * 1_000_000_000
-        elif 'm' in valor_limpio.lower():
-            return float(valor_limpio.lower().replace('m', '')) * 1_000_000
-        elif 'k' in valor_limpio.lower():
-            return float(valor_limpio.lower().replace('k', '')) * 1_000
-        else:
-            return float(valor_limpio)
-    except:
-        return 0
-
-def limpiar_porcentaje(valor):
-    """Convierte porcentajes como '+14.52%' a numérico"""
-    if not valor or valor == 'n/a' or valor == 'ERROR' or valor == '':
-        return 0
-    
-    try:
-        valor_limpio = str(valor).replace('%', '').replace('+', '').replace(' ', '').strip()
-        return float(valor_limpio)
-    except:
-        return 0
 
 def comparar_y_seleccionar_activos(df_actual, df_anterior):
-    """Compara los datos actuales con los anteriores y seleccionar activos que cumplan los criterios"""
+    """
+    Compara los datos actuales con los anteriores y seleccionar activos que cumplan los criterios.
+    Ambas tablas ya vienen con las columnas numéricas convertidas (convertir_tabla_coinalyze);
+    una celda sin valor (NaN) no cumple ningún criterio.
+    """
     if df_anterior is None or df_anterior.empty:
         print("📭 No hay datos anteriores para comparar. Primera ejecución.")
         return []
     
     print("🔍 Comparando activos con datos anteriores...")
     
-    activos_seleccionados = []
-    total_analizados = 0
+    columnas_actual = ['COIN', 'PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H']
+    columnas_anterior = ['COIN', 'PRICE', 'OI CHG 24H']
+    faltan = ([c for c in columnas_actual if c not in df_actual.columns] +
+              [c for c in columnas_anterior if c not in df_anterior.columns])
+    if faltan:
+        print(f"❌ Faltan columnas para comparar: {faltan}")
+        return []
     
-    for idx_actual, fila_actual in df_actual.iterrows():
-        try:
-            moneda_completa = str(fila_actual['COIN'])
-            if not moneda_completa or moneda_completa == '' or moneda_completa == 'nan':
-                continue
-            
-            total_analizados += 1
-            simbolo = extraer_simbolo_de_moneda(moneda_completa)
-            if not simbolo:
-                continue
-            
-            # Buscar la misma moneda en datos anteriores
-            fila_anterior = None
-            for idx_ant, fila_ant in df_anterior.iterrows():
-                moneda_anterior_completa = str(fila_ant['COIN'])
-                simbolo_anterior = extraer_simbolo_de_moneda(moneda_anterior_completa)
-                if simbolo_anterior and simbolo_anterior == simbolo:
-                    fila_anterior = fila_ant
-                    break
-            
-            if fila_anterior is None:
-                continue
-            
-            # Extraer y limpiar valores
-            price_actual = limpiar_y_convertir_valor(fila_actual['PRICE'])
-            chg_24h_actual = limpiar_porcentaje(fila_actual['CHG 24H'])
-            mkt_cap_actual = limpiar_y_convertir_valor(fila_actual['MKT CAP'])
-            vol_24h_actual = limpiar_y_convertir_valor(fila_actual['VOL 24H'])
-            open_interest_actual = limpiar_y_convertir_valor(fila_actual['OPEN INTEREST'])
-            oi_chg_24h_actual = limpiar_porcentaje(fila_actual['OI CHG 24H'])
-            
-            price_anterior = limpiar_y_convertir_valor(fila_anterior['PRICE'])
-            oi_chg_24h_anterior = limpiar_porcentaje(fila_anterior['OI CHG 24H'])
-            
-            oi_vol_ratio = open_interest_actual / vol_24h_actual if vol_24h_actual > 0 else float('inf')
-            
-            # Aplicar criterios de selección
-            criterios = [
-                price_actual > price_anterior,
-                oi_chg_24h_actual > oi_chg_24h_anterior,
-                oi_vol_ratio < 0.30,
-                mkt_cap_actual > 50_000_000,
-                chg_24h_actual > 3,
-                chg_24h_actual > 0
-            ]
-            
-            if all(criterios):
-                print(f"\n🎯 ACTIVO SELECCIONADO: {moneda_completa} ({simbolo})")
-                print(f"  📊 Datos actuales:")
-                print(f"     Price: ${price_actual:.4f} (Anterior: ${price_anterior:.4f})")
-                print(f"     CHG 24H: {chg_24h_actual:.2f}%")
-                print(f"     MKT CAP: ${mkt_cap_actual:,.0f}")
-                print(f"     VOL 24H: ${vol_24h_actual:,.0f}")
-                print(f"     OPEN INTEREST: ${open_interest_actual:,.0f}")
-                print(f"     OI CHG 24H: {oi_chg_24h_actual:.2f}% (Anterior: {oi_chg_24h_anterior:.2f}%)")
-                print(f"  📈 Ratio OI/VOL: {oi_vol_ratio:.4f}")
-                
-                activo_info = {
-                    'moneda': moneda_completa,
-                    'simbolo': simbolo,
-                    'price': price_actual,
-                    'chg_24h': chg_24h_actual,
-                    'mkt_cap': mkt_cap_actual,
-                    'oi_chg_24h': oi_chg_24h_actual,
-                    'oi_vol_ratio': oi_vol_ratio,
-                    'open_interest': open_interest_actual,
-                    'vol_24h': vol_24h_actual
-                }
-                activos_seleccionados.append(activo_info)
-                
-        except Exception as e:
-            continue
+    # Símbolo de cada moneda (una sola vez por nombre) y monedas válidas
+    actual = df_actual[columnas_actual].copy()
+    actual['COIN'] = actual['COIN'].astype(str)
+    actual = actual[(actual['COIN'] != '') & (actual['COIN'] != 'nan')]
+    total_analizados = len(actual)
+    actual['simbolo'] = actual['COIN'].map(extraer_simbolo_de_moneda)
+    actual = actual[actual['simbolo'].map(bool)]
+    
+    anterior = df_anterior[columnas_anterior].copy()
+    anterior['simbolo'] = anterior['COIN'].astype(str).map(extraer_simbolo_de_moneda)
+    # Primera aparición de cada símbolo en los datos anteriores
+    anterior = anterior[anterior['simbolo'].map(bool)].drop_duplicates('simbolo')
+    anterior = anterior.rename(columns={'PRICE': 'PRICE_ANTERIOR', 'OI CHG 24H': 'OI CHG 24H_ANTERIOR'})
+    
+    # Cruce por símbolo (conserva el orden de la tabla actual)
+    cruce = actual.merge(anterior[['simbolo', 'PRICE_ANTERIOR', 'OI CHG 24H_ANTERIOR']], on='simbolo', how='inner')
+    
+    # Columnas numéricas
+    price_actual = cruce['PRICE'].to_numpy(dtype=float)
+    chg_24h_actual = cruce['CHG 24H'].to_numpy(dtype=float)
+    mkt_cap_actual = cruce['MKT CAP'].to_numpy(dtype=float)
+    vol_24h_actual = cruce['VOL 24H'].to_numpy(dtype=float)
+    open_interest_actual = cruce['OPEN INTEREST'].to_numpy(dtype=float)
+    oi_chg_24h_actual = cruce['OI CHG 24H'].to_numpy(dtype=float)
+    
+    price_anterior = cruce['PRICE_ANTERIOR'].to_numpy(dtype=float)
+    oi_chg_24h_anterior = cruce['OI CHG 24H_ANTERIOR'].to_numpy(dtype=float)
+    
+    oi_vol_ratio = np.divide(open_interest_actual, vol_24h_actual,
+                             out=np.full(len(cruce), np.inf), where=vol_24h_actual > 0)
+    
+    # Aplicar criterios de selección (una máscara por criterio)
+    criterios = [
+        price_actual > price_anterior,
+        oi_chg_24h_actual > oi_chg_24h_anterior,
+        oi_vol_ratio < 0.30,
+        mkt_cap_actual > 50_000_000,
+        chg_24h_actual > 3,
+        chg_24h_actual > 0
+    ]
+    seleccion = np.logical_and.reduce(criterios) if len(cruce) else np.zeros(0, dtype=bool)
+    
+    activos_seleccionados = []
+    for i in np.flatnonzero(seleccion):
+        moneda_completa = cruce['COIN'].iat[i]
+        simbolo = cruce['simbolo'].iat[i]
+        print(f"\n🎯 ACTIVO SELECCIONADO: {moneda_completa} ({simbolo})")
+        print(f"  📊 Datos actuales:")
+        print(f"     Price: ${price_actual[i]:.4f} (Anterior: ${price_anterior[i]:.4f})")
+        print(f"     CHG 24H: {chg_24h_actual[i]:.2f}%")
+        print(f"     MKT CAP: ${mkt_cap_actual[i]:,.0f}")
+        print(f"     VOL 24H: ${vol_24h_actual[i]:,.0f}")
+        print(f"     OPEN INTEREST: ${open_interest_actual[i]:,.0f}")
+        print(f"     OI CHG 24H: {oi_chg_24h_actual[i]:.2f}% (Anterior: {oi_chg_24h_anterior[i]:.2f}%)")
+        print(f"  📈 Ratio OI/VOL: {oi_vol_ratio[i]:.4f}")
+        
+        activo_info = {
+            'moneda': moneda_completa,
+            'simbolo': simbolo,
+            'price': float(price_actual[i]),
+            'chg_24h': float(chg_24h_actual[i]),
+            'mkt_cap': float(mkt_cap_actual[i]),
+            'oi_chg_24h': float(oi_chg_24h_actual[i]),
+            'oi_vol_ratio': float(oi_vol_ratio[i]),
+            'open_interest': float(open_interest_actual[i]),
+            'vol_24h': float(vol_24h_actual[i])
+        }
+        activos_seleccionados.append(activo_info)
     
     print(f"\n📊 Resumen comparación: {len(activos_seleccionados)} de {total_analizados} activos califican")
     return activos_seleccionados
@@ -3082,6 +3215,9 @@ def main():
         # Solo hacer scraping si hay espacios disponibles Y puede operar
         if espacios_disponibles > 0 and puede_operar:
             df_actual = obtener_tabla_coinalyze(url)
+            grabador_mercado.grabar_tabla('coinalyze', df_actual)
+            # Columnas numéricas una sola vez por tabla ('$40.4m' -> 40400000.0; sin dato -> NaN)
+            df_actual = convertir_tabla_coinalyze(df_actual)
             
             if not df_actual.empty:
                 print(f"📊 Datos actuales obtenidos: {len(df_actual)} filas")
@@ -3116,6 +3252,7 @@ def main():
         if ciclo % 5 == 0:
             mostrar_estadisticas()
             guardar_estadisticas_json()
+            cache_velas.mostrar_estadisticas()
         
         # Esperar 2 minutos
         if not bot_salir:
@@ -0,0 +1,363 @@
+import atexit
+import os
+import re
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from urllib3.util.retry import Retry
+
+try:
+    import lxml  # noqa: F401
+    PARSER_HTML = 'lxml'
+except ImportError:
+    PARSER_HTML = 'html.parser'
+
+# ========== EXTRACCIÓN DE LA TABLA DE COINALYZE ==========
+
+def texto_celda(celda):
+    """Texto visible de una celda con los espacios normalizados (como `.text` de Selenium en una línea)"""
+    return ' '.join(celda.get_text(' ').split())
+
+def extraer_tabla_html(html):
+    """
+    Encabezados y filas de la primera tabla del HTML (outerHTML de la tabla o
+    page_source completo) con un solo parseo local. Encabezados: los `th` no
+    vacíos del thead, o de la primera fila si no hay thead. Filas: las del tbody
+    (o todas) que tengan celdas `td`, como listas de textos.
+    """
+    tabla = BeautifulSoup(html, PARSER_HTML).find('table')
+    if tabla is None:
+        return [], []
+
+    thead = tabla.find('thead')
+    fila_encabezados = thead if thead is not None else tabla.find('tr')
+    headers = []
+    if fila_encabezados is not None:
+        headers = [texto for texto in (texto_celda(th) for th in fila_encabezados.find_all('th')) if texto]
+
+    cuerpo = tabla.find('tbody') or tabla
+    filas = []
+    for tr in cuerpo.find_all('tr'):
+        celdas = tr.find_all('td')
+        if celdas:
+            filas.append([texto_celda(td) for td in celdas])
+    return headers, filas
+
+def tabla_a_dataframe(headers, filas):
+    """
+    DataFrame con una columna por encabezado: se quita la celda inicial vacía
+    (icono de favorito) y cada fila se recorta o rellena al número de columnas
+    """
+    datos = []
+    for fila in filas:
+        if fila and fila[0] == '':
+            fila = fila[1:]
+        if not any(fila):
+            continue
+        datos.append((fila + [''] * len(headers))[:len(headers)])
+    return pd.DataFrame(datos, columns=headers)
+
+# ========== CONVERSIÓN NUMÉRICA POR COLUMNAS ==========
+
+COLUMNAS_NUMERICAS = ['PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H',
+                      'OI SHARE', 'OI / VOL24H', 'FR AVG', 'PFR AVG', 'LIQS. 24H']
+# Importes y volúmenes ('$40.4m'): las únicas columnas con sufijos k/m/b/t
+COLUMNAS_CON_SUFIJO = {'PRICE', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'LIQS. 24H'}
+SIN_DATO = {'', 'n/a', 'na', 'nan', 'none', 'error', '-', '--', '—'}
+# Sufijos como exponente: '40.4m' -> '40.4e6', que float entiende directamente
+EXPONENTES = (('k', 'e3'), ('m', 'e6'), ('b', 'e9'), ('t', 'e12'))
+_SIMBOLOS = str.maketrans('', '', '$,+% \t\r')
+_NO_NUMERO = re.compile(r'^(?!-?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?$).*$', re.MULTILINE)
+
+def parsear_columna(serie, sufijos=True):
+    """
+    Convierte una columna de textos de CoinAlyze ('$40.4m', '+190.73%', '$1,234.5',
+    'n/a') en float64 de una vez: la columna se une en un solo texto que se limpia,
+    se valida con una regex compilada y se convierte con numpy, sin funciones por
+    celda. Los sufijos k/m/b/t solo se aceptan con `sufijos`. Devuelve (valores,
+    sin_dato, no_parseable): las celdas sin dato o que no se entienden quedan en
+    NaN (nunca en 0) y se marcan en su máscara.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        valores = serie.to_numpy(dtype=float)
+        return valores, np.isnan(valores), np.zeros(len(valores), dtype=bool)
+
+    if len(serie) == 0:
+        return np.empty(0), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+
+    celdas = [str(valor) for valor in serie.tolist()]
+    texto = '\n'.join(celdas)
+    if texto.count('\n') != len(celdas) - 1:
+        texto = '\n'.join(celda.replace('\n', ' ') for celda in celdas)  # Celdas con saltos de línea
+    texto = texto.lower().translate(_SIMBOLOS)
+
+    sin_dato = np.array([linea in SIN_DATO for linea in texto.split('\n')], dtype=bool)
+    if sufijos:
+        for sufijo, exponente in EXPONENTES:
+            texto = texto.replace(sufijo, exponente)
+    valores = np.array(_NO_NUMERO.sub('nan', texto).split('\n')).astype(float)
+    valores[sin_dato] = np.nan
+    return valores, sin_dato, np.isnan(valores) & ~sin_dato
+
+class MetricasConversion:
+    """Celdas sin dato y no parseables por columna, acumuladas entre tablas"""
+
+    def __init__(self):
+        self.tablas = 0
+        self.celdas = 0
+        self.sin_dato = defaultdict(int)
+        self.no_parseables = defaultdict(int)
+        self.ejemplos = {}  # columna -> último texto no parseable
+
+    def resumen(self):
+        return {'tablas': self.tablas, 'celdas': self.celdas,
+                'sin_dato': dict(self.sin_dato), 'no_parseables': dict(self.no_parseables)}
+
+metricas_conversion = MetricasConversion()
+
+def convertir_tabla_coinalyze(df, metricas=metricas_conversion):
+    """
+    Copia de la tabla con las columnas numéricas en float64 (una pasada por
+    columna, una vez por tabla). El resto de columnas (COIN) no se tocan.
+    """
+    resultado = df.copy()
+    avisos = []
+    for columna in COLUMNAS_NUMERICAS:
+        if columna not in df.columns:
+            continue
+        valores, sin_dato, no_parseable = parsear_columna(df[columna], sufijos=columna in COLUMNAS_CON_SUFIJO)
+        resultado[columna] = valores
+        metricas.celdas += len(valores)
+        metricas.sin_dato[columna] += int(sin_dato.sum())
+        invalidas = int(no_parseable.sum())
+        if invalidas:
+            ejemplo = str(df[columna].to_numpy()[no_parseable][0])
+            metricas.no_parseables[columna] += invalidas
+            metricas.ejemplos[columna] = ejemplo
+            avisos.append(f"{columna}: {invalidas} (p.ej. '{ejemplo}')")
+    metricas.tablas += 1
+    if avisos:
+        print(f"⚠️  Celdas no numéricas en CoinAlyze (quedan sin valor): {', '.join(avisos)}")
+    return resultado
+
+# ========== DESCARGA SIN NAVEGADOR (HTTP) ==========
+
+CABECERAS_HTTP = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+class ClienteCoinalyzeHTTP:
+    """
+    Descarga la página de CoinAlyze con una requests.Session reutilizada (conexiones
+    keep-alive, reintentos ante 429/5xx) y extrae la tabla del HTML que envía el
+    servidor, sin navegador. Si la respuesta no trae la tabla con al menos
+    `min_filas` filas (p.ej. porque se rellena con JavaScript) devuelve None para
+    que se use Selenium, y no vuelve a intentarlo hasta pasados `espera_tras_fallo` s.
+    """
+
+    def __init__(self, session=None, timeout=15, min_filas=20, espera_tras_fallo=30 * 60):
+        if session is None:
+            session = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=4,
+                                    max_retries=Retry(total=2, backoff_factor=0.5,
+                                                      status_forcelist=(429, 500, 502, 503, 504)))
+            session.mount('https://', adaptador)
+            session.mount('http://', adaptador)
+            session.headers.update(CABECERAS_HTTP)
+        self.session = session
+        self.timeout = timeout
+        self.min_filas = min_filas
+        self.espera_tras_fallo = espera_tras_fallo
+        self.pausado_hasta = 0.0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def disponible(self):
+        return time.time() >= self.pausado_hasta
+
+    def _fallo(self, motivo):
+        self.fallos += 1
+        self.pausado_hasta = time.time() + self.espera_tras_fallo
+        print(f"⚠️  CoinAlyze por HTTP no disponible ({motivo}) - Usando navegador")
+        return None
+
+    def obtener_tabla(self, url):
+        """DataFrame de la tabla, o None si hay que recurrir a Selenium"""
+        if not self.disponible():
+            return None
+
+        inicio = time.time()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            return self._fallo(e.__class__.__name__)
+        if response.status_code != 200:
+            return self._fallo(f"HTTP {response.status_code}")
+
+        headers, filas = extraer_tabla_html(response.text)
+        if not headers or len(filas) < self.min_filas:
+            return self._fallo(f"{len(filas)} filas en el HTML del servidor")
+
+        df = tabla_a_dataframe(headers, filas)
+        self.aciertos += 1
+        print(f"✅ Tabla de CoinAlyze por HTTP: {len(df)} filas en {time.time() - inicio:.2f}s (sin navegador)")
+        return df
+
+# Cliente único para todo el proceso (mantiene las conexiones abiertas)
+cliente_coinalyze = ClienteCoinalyzeHTTP()
+
+# ========== NAVEGADOR PERSISTENTE ENTRE CICLOS ==========
+
+def memoria_procesos_mb(pid):
+    """
+    Memoria residente (MB) de un proceso y todos sus descendientes según /proc
+    (aproximada: la memoria compartida entre procesos de Chrome cuenta varias
+    veces). None si no se puede medir (p.ej. fuera de Linux).
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    hijos = defaultdict(list)
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as archivo:
+                campos = archivo.read().rsplit(')', 1)[1].split()
+            hijos[int(campos[1])].append(int(entrada))
+        except (OSError, IndexError, ValueError):
+            continue  # Proceso terminado mientras se recorría
+
+    total = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(f'/proc/{actual}/statm') as archivo:
+                total += int(archivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+        pendientes.extend(hijos.get(actual, []))
+    return total / 1024 / 1024 if total else None
+
+class _FilasCargadas:
+    """Condición de espera: la tabla tiene al menos `minimo` filas con datos y no creció desde la última consulta"""
+
+    def __init__(self, minimo):
+        self.minimo = minimo
+        self.anterior = -1
+
+    def __call__(self, driver):
+        filas = len(driver.find_elements(By.XPATH, "//table//tr[td]"))
+        estable = filas >= self.minimo and filas == self.anterior
+        self.anterior = filas
+        return estable
+
+class NavegadorCoinalyze:
+    """
+    Un solo Chrome headless que se mantiene abierto entre ciclos de scraping: la
+    primera vez carga la página y después solo la refresca, esperando a que la
+    tabla tenga al menos `min_filas` filas (en vez de una pausa fija). Se recicla
+    (cierra y vuelve a arrancar) al superar `max_edad` segundos o `max_memoria_mb`.
+    """
+
+    def __init__(self, min_filas=20, timeout=30, max_edad=2 * 60 * 60, max_memoria_mb=1500):
+        self.min_filas = min_filas
+        self.timeout = timeout
+        self.max_edad = max_edad
+        self.max_memoria_mb = max_memoria_mb
+        self.driver = None
+        self.url = None
+        self.creado = 0.0
+        self.cargas = 0
+        self.arranques = 0
+
+    def memoria_mb(self):
+        """Memoria de chromedriver y sus procesos de Chrome, o None si no se puede medir"""
+        try:
+            pid = self.driver.service.process.pid
+        except AttributeError:
+            return None
+        return memoria_procesos_mb(pid)
+
+    def _reciclar_si_toca(self):
+        edad = time.time() - self.creado
+        if edad > self.max_edad:
+            motivo = f"abierto hace {edad / 60:.0f} min"
+        else:
+            memoria = self.memoria_mb()
+            if memoria is None or memoria <= self.max_memoria_mb:
+                return
+            motivo = f"{memoria:.0f} MB en uso"
+        print(f"♻️  Reciclando Chrome ({motivo})")
+        self.descartar()
+
+    def _arrancar(self, crear_driver):
+        print("🌐 Iniciando Chrome...")
+        try:
+            self.driver = crear_driver()
+        except Exception as e:
+            print(f"❌ No se pudo iniciar Chrome: {e}")
+            self.driver = None
+        if self.driver is not None:
+            self.creado = time.time()
+            self.url = None
+            self.arranques += 1
+        return self.driver
+
+    def cargar(self, url, crear_driver):
+        """
+        Driver con `url` cargada y la tabla ya rellenada, arrancando Chrome con
+        `crear_driver()` solo si no hay uno abierto. Si el navegador falla se
+        descarta y se reintenta una vez con uno nuevo. None si no se pudo.
+        """
+        for intento in range(2):
+            if self.driver is not None:
+                self._reciclar_si_toca()
+            if self.driver is None and self._arrancar(crear_driver) is None:
+                return None
+
+            inicio = time.time()
+            try:
+                if self.url == url:
+                    print("🔄 Refrescando página de CoinAlyze...")
+                    self.driver.refresh()
+                else:
+                    print("📄 Cargando página de CoinAlyze...")
+                    self.driver.get(url)
+                    self.url = url
+
+                try:
+                    WebDriverWait(self.driver, self.timeout, poll_frequency=0.5).until(_FilasCargadas(self.min_filas))
+                    print(f"✅ Tabla cargada en {time.time() - inicio:.1f}s")
+                except TimeoutException:
+                    print(f"⚠️  La tabla no llegó a {self.min_filas} filas en {self.timeout}s - Se extrae lo que haya")
+                self.cargas += 1
+                return self.driver
+            except WebDriverException as e:
+                print(f"❌ Error en Chrome ({e.msg}) - Descartando navegador")
+                self.descartar()
+        return None
+
+    def descartar(self):
+        """Cierra el navegador; el siguiente `cargar` arranca uno nuevo"""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        self.driver = None
+        self.url = None
+
+# Navegador único para todo el proceso (se cierra al salir)
+navegador_coinalyze = NavegadorCoinalyze()
+atexit.register(navegador_coinalyze.descartar)
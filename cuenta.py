@@ -0,0 +1,348 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from pybit.unified_trading import WebSocket
+    PYBIT_WEBSOCKET = True
+except ImportError:
+    PYBIT_WEBSOCKET = False
+
+# ========== ESPEJO LOCAL DE LA CUENTA (STREAMS PRIVADOS) ==========
+
+ESTADOS_ORDEN_ABIERTA = {'New', 'PartiallyFilled', 'Untriggered'}
+ESTADOS_ORDEN_FINAL = {'Filled', 'Cancelled', 'PartiallyFilledCanceled', 'Rejected', 'Deactivated'}
+
+def _respuesta(lista):
+    """Respuesta con la misma forma que las de pybit.HTTP"""
+    return {'retCode': 0, 'retMsg': 'OK', 'result': {'category': 'linear', 'list': lista}}
+
+def _a_float(valor, defecto=0.0):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+def _resumen_ejecucion(order_id, estado, precio, cantidad, comision, origen):
+    """Precio medio, cantidad y comisión reales de una orden"""
+    return {'order_id': order_id, 'estado': estado, 'precio': precio,
+            'cantidad': cantidad, 'comision': comision, 'origen': origen}
+
+def _intentos(timeout, pausa=0.1, pausa_maxima=1.0):
+    """Un intento enseguida y luego otros tras pausas crecientes hasta agotar `timeout` s"""
+    limite = time.time() + timeout
+    while True:
+        yield
+        restante = limite - time.time()
+        if restante <= 0:
+            return
+        time.sleep(min(pausa, restante))
+        pausa = min(pausa * 2, pausa_maxima)
+
+def _momento(registro):
+    try:
+        return int(registro.get('updatedTime') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+class EspejoCuenta:
+    """
+    Copia local de las posiciones y órdenes abiertas de la cuenta, mantenida con
+    los streams privados (position, order, execution) y recargada por REST cada
+    `resincronizar` segundos y tras cada reconexión del stream. get_positions y
+    get_open_orders responden con la misma forma que pybit, así que el código que
+    consultaba por REST lee la copia sin más cambios; sin stream conectado se
+    delega en la sesión REST.
+    """
+
+    def __init__(self, resincronizar=300, max_recientes=500):
+        self.resincronizar = resincronizar
+        self.max_recientes = max_recientes
+        self.session = None
+        self._ws = None
+        self.posiciones = {}                 # (symbol, positionIdx) -> posición
+        self.ordenes = {}                    # orderId -> orden abierta
+        self.ordenes_recientes = OrderedDict()  # orderId -> último estado (abiertas y cerradas)
+        self.ejecuciones = OrderedDict()     # orderId -> lista de ejecuciones
+        self.sincronizado = 0.0
+        self._conexion = None                # Conexión del stream con la que se hizo la última carga
+        self._reconectar = False             # Se vio el stream caído: recargar antes de volver a la copia
+        self._lock = threading.RLock()
+        self._cierre = threading.Event()
+        self._ejecucion = threading.Condition(self._lock)
+        self.lecturas_espejo = 0
+        self.lecturas_rest = 0
+        self.ejecuciones_stream = 0
+        self.ejecuciones_rest = 0
+
+    def iniciar(self, session, api_key, api_secret, testnet=False):
+        """
+        Conecta los streams privados y carga el estado inicial. False si solo se podrá
+        usar REST (sin pybit o sin credenciales, p.ej. con el exchange simulado)
+        """
+        self.session = session
+        if not PYBIT_WEBSOCKET or not api_key:
+            return False
+        try:
+            self._ws = WebSocket(channel_type="private", testnet=testnet, api_key=api_key, api_secret=api_secret)
+            self.suscribir(self._ws)
+        except Exception as e:
+            print(f"⚠️  No se pudieron conectar los streams privados ({e}) - Usando REST")
+            self._ws = None
+            return False
+
+        if not self.cargar():
+            return False
+        print("✅ Streams privados conectados (posiciones, órdenes y ejecuciones)")
+        return True
+
+    def suscribir(self, ws):
+        """Suscribe los callbacks a los topics privados (suscribir antes de cargar para no perder eventos)"""
+        self._ws = ws
+        ws.position_stream(callback=self._on_position)
+        ws.order_stream(callback=self._on_order)
+        ws.execution_stream(callback=self._on_execution)
+
+    def detener(self):
+        if self._ws is not None:
+            try:
+                self._ws.exit()
+            except Exception:
+                pass
+            self._ws = None
+
+    def _conexion_ws(self):
+        """Conexión subyacente del stream: pybit crea una nueva en cada reconexión"""
+        return getattr(self._ws, 'ws', None)
+
+    def cargar(self):
+        """Carga (o recarga) posiciones y órdenes abiertas por REST. False si Bybit responde con error"""
+        inicio = int(time.time() * 1000)
+        conexion = self._conexion_ws()
+        posiciones = self.session.get_positions(category="linear", settleCoin="USDT")
+        ordenes = self.session.get_open_orders(category="linear", settleCoin="USDT")
+        if posiciones['retCode'] != 0 or ordenes['retCode'] != 0:
+            print(f"❌ Error cargando posiciones/órdenes: {posiciones.get('retMsg')} / {ordenes.get('retMsg')}")
+            return False
+
+        with self._lock:
+            # Posiciones: la lista REST sustituye a la copia (lo que no trae está cerrado),
+            # salvo lo que el stream haya traído después de pedirla
+            anteriores = self.posiciones
+            self.posiciones = {clave: posicion for clave, posicion in anteriores.items() if _momento(posicion) > inicio}
+            for posicion in posiciones['result']['list']:
+                self._aplicar_posicion(posicion)
+            if any(_a_float(posicion.get('size')) > 0 and _a_float(self.posiciones.get(clave, {}).get('size')) == 0
+                   for clave, posicion in anteriores.items()):
+                self._cierre.set()
+
+            # Órdenes: la lista REST manda, salvo lo que el stream haya traído después de pedirla
+            abiertas = {orden['orderId']: orden for orden in ordenes['result']['list']}
+            for order_id, orden in self.ordenes.items():
+                if order_id not in abiertas and _momento(orden) > inicio:
+                    abiertas[order_id] = orden
+            self.ordenes = abiertas
+            self.sincronizado = time.time()
+            self._conexion = conexion
+            self._reconectar = False
+        return True
+
+    # ---------- Eventos del stream ----------
+
+    def _aplicar_posicion(self, posicion):
+        clave = (posicion['symbol'], int(posicion.get('positionIdx') or 0))
+        actual = self.posiciones.get(clave)
+        if actual is not None and _momento(actual) > _momento(posicion):
+            return
+
+        posicion = dict(posicion)
+        if not posicion.get('avgPrice'):
+            posicion['avgPrice'] = posicion.get('entryPrice') or '0'  # El stream usa entryPrice
+        if actual is not None and float(actual.get('size') or 0) > 0 and float(posicion.get('size') or 0) == 0:
+            self._cierre.set()
+        self.posiciones[clave] = posicion
+
+    def _recordar(self, tabla, clave, valor):
+        tabla[clave] = valor
+        tabla.move_to_end(clave)
+        while len(tabla) > self.max_recientes:
+            tabla.popitem(last=False)
+
+    def _on_position(self, mensaje):
+        with self._lock:
+            for posicion in mensaje.get('data', []):
+                if posicion.get('category', 'linear') == 'linear':
+                    self._aplicar_posicion(posicion)
+
+    def _on_order(self, mensaje):
+        with self._lock:
+            for orden in mensaje.get('data', []):
+                if orden.get('category', 'linear') != 'linear':
+                    continue
+                if orden.get('orderStatus') in ESTADOS_ORDEN_ABIERTA:
+                    self.ordenes[orden['orderId']] = orden
+                else:
+                    self.ordenes.pop(orden['orderId'], None)
+                self._recordar(self.ordenes_recientes, orden['orderId'], orden)
+            self._ejecucion.notify_all()
+
+    def _on_execution(self, mensaje):
+        with self._lock:
+            for ejecucion in mensaje.get('data', []):
+                if ejecucion.get('category', 'linear') != 'linear':
+                    continue
+                previas = self.ejecuciones.get(ejecucion['orderId'], [])
+                self._recordar(self.ejecuciones, ejecucion['orderId'], previas + [ejecucion])
+            self._ejecucion.notify_all()
+
+    # ---------- Lecturas (misma forma que pybit.HTTP) ----------
+
+    def usando_espejo(self):
+        """
+        True si el stream está conectado y la copia es fiable. Resincroniza si toca y
+        siempre tras una reconexión (los eventos perdidos mientras tanto no llegan).
+        """
+        if self._ws is None or self.session is None:
+            return False
+        if not self._ws.is_connected():
+            self._reconectar = True
+            return False
+        if (self._reconectar or self._conexion_ws() is not self._conexion or
+                time.time() - self.sincronizado > self.resincronizar):
+            return self.cargar()
+        return True
+
+    def get_positions(self, category="linear", symbol=None, settleCoin=None, **kwargs):
+        if not self.usando_espejo():
+            self.lecturas_rest += 1
+            return self.session.get_positions(category=category, symbol=symbol, settleCoin=settleCoin, **kwargs)
+
+        self.lecturas_espejo += 1
+        with self._lock:
+            lista = [dict(posicion) for (simbolo, _), posicion in sorted(self.posiciones.items())
+                     if symbol is None or simbolo == symbol]
+        return _respuesta(lista)
+
+    def get_open_orders(self, category="linear", symbol=None, settleCoin=None, **kwargs):
+        if not self.usando_espejo():
+            self.lecturas_rest += 1
+            return self.session.get_open_orders(category=category, symbol=symbol, settleCoin=settleCoin, **kwargs)
+
+        self.lecturas_espejo += 1
+        with self._lock:
+            lista = [dict(orden) for orden in self.ordenes.values() if symbol is None or orden['symbol'] == symbol]
+        return _respuesta(lista)
+
+    def descartar_cierres(self):
+        """Olvida los cierres ya notificados (quien llama va a leer el estado completo)"""
+        self._cierre.clear()
+
+    def esperar_cierre(self, timeout):
+        """Espera hasta `timeout` s a que alguna posición pase a tamaño 0. True si ocurrió"""
+        if self._cierre.wait(timeout):
+            self._cierre.clear()
+            return True
+        return False
+
+    # ---------- Ejecución de órdenes ----------
+
+    def _buscar_orden(self, order_id, order_link_id):
+        """orderId conocido por el stream a partir de orderId u orderLinkId"""
+        if order_id:
+            return order_id
+        for clave, orden in reversed(self.ordenes_recientes.items()):
+            if orden.get('orderLinkId') == order_link_id:
+                return clave
+        for clave, ejecuciones in reversed(self.ejecuciones.items()):
+            if ejecuciones[0].get('orderLinkId') == order_link_id:
+                return clave
+        return None
+
+    def _ejecucion_completa(self, order_id):
+        """Resumen de la orden si el stream ya la dio por terminada, o None"""
+        ejecuciones = self.ejecuciones.get(order_id, [])
+        if any(_a_float(e.get('leavesQty'), 1.0) == 0 for e in ejecuciones):
+            cantidad = sum(_a_float(e.get('execQty')) for e in ejecuciones)
+            if cantidad > 0:
+                precio = sum(_a_float(e.get('execPrice')) * _a_float(e.get('execQty')) for e in ejecuciones) / cantidad
+                comision = sum(_a_float(e.get('execFee')) for e in ejecuciones)
+                return _resumen_ejecucion(order_id, 'Filled', precio, cantidad, comision, 'stream')
+
+        orden = self.ordenes_recientes.get(order_id)
+        if orden is not None and orden.get('orderStatus') in ESTADOS_ORDEN_FINAL:
+            # Terminada sin ejecuciones completas en el stream: manda el acumulado de la orden
+            return _resumen_ejecucion(order_id, orden['orderStatus'], _a_float(orden.get('avgPrice')),
+                                      _a_float(orden.get('cumExecQty')), _a_float(orden.get('cumExecFee')), 'stream')
+        return None
+
+    def _ejecucion_rest(self, symbol, order_id, order_link_id, timeout=0):
+        """
+        Consulta el historial por REST hasta que la orden termine o pase `timeout` s
+        (una orden a mercado recién enviada puede no estar ejecutada todavía)
+        """
+        if self.session is None:
+            return None
+        resumen = None
+        for _ in _intentos(timeout):
+            response = self.session.get_order_history(category="linear", symbol=symbol,
+                                                      orderId=order_id, orderLinkId=order_link_id)
+            if response['retCode'] != 0 or not response['result']['list']:
+                continue
+
+            orden = response['result']['list'][0]
+            cantidad = _a_float(orden.get('cumExecQty'))
+            if cantidad > 0:
+                resumen = _resumen_ejecucion(orden.get('orderId', order_id), orden.get('orderStatus', ''),
+                                             _a_float(orden.get('avgPrice')), cantidad,
+                                             _a_float(orden.get('cumExecFee')), 'rest')
+            if orden.get('orderStatus') in ESTADOS_ORDEN_FINAL:
+                break
+
+        if resumen is not None:
+            self.ejecuciones_rest += 1
+        return resumen
+
+    def esperar_ejecucion(self, symbol, order_id=None, order_link_id=None, timeout=5):
+        """
+        Espera hasta `timeout` s a que el stream dé la orden por terminada y devuelve
+        precio medio, cantidad y comisión reales. Si el evento no llega se consulta el
+        historial por REST; sin stream se consulta el historial cada poco durante todo
+        el `timeout`. None si no se pudo saber.
+        """
+        if not self.usando_espejo():
+            return self._ejecucion_rest(symbol, order_id, order_link_id, timeout)
+
+        limite = time.time() + timeout
+        with self._ejecucion:
+            while True:
+                clave = self._buscar_orden(order_id, order_link_id)
+                resumen = self._ejecucion_completa(clave) if clave else None
+                if resumen is not None:
+                    self.ejecuciones_stream += 1
+                    return resumen
+                restante = limite - time.time()
+                if restante <= 0:
+                    break
+                self._ejecucion.wait(restante)
+
+        return self._ejecucion_rest(symbol, order_id, order_link_id)
+
+    def esperar_posicion_cerrada(self, symbol, side='Buy', timeout=3):
+        """
+        Consulta las posiciones de `symbol` cada poco hasta que no quede ninguna
+        abierta del lado `side` o pase `timeout` s. True si se cerró; una respuesta
+        con error no cuenta como posición abierta.
+        """
+        cerrada = False
+        for _ in _intentos(timeout):
+            response = self.get_positions(category="linear", symbol=symbol)
+            if response['retCode'] != 0:
+                return True
+            cerrada = not any(posicion['side'] == side and _a_float(posicion.get('size')) > 0
+                              for posicion in response['result']['list'])
+            if cerrada:
+                break
+        return cerrada
+
+# Espejo único para todo el proceso (hilo principal y monitoreo)
+espejo_cuenta = EspejoCuenta()
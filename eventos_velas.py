@@ -0,0 +1,129 @@
+import threading
+from collections import deque
+
+from grabador import grabador_mercado
+from velas import COLUMNAS_VELA
+
+try:
+    from pybit.unified_trading import WebSocket
+    PYBIT_WEBSOCKET = True
+except ImportError:
+    PYBIT_WEBSOCKET = False
+
+# ========== BUS DE EVENTOS DE CIERRE DE VELA (STREAM DE KLINES) ==========
+
+def parsear_vela_stream(kline):
+    """Vela del stream de klines con las mismas columnas que las de get_kline"""
+    vela = {'timestamp': int(kline['start'])}
+    for columna in COLUMNAS_VELA[1:]:
+        vela[columna] = float(kline.get(columna) or 0)
+    return vela
+
+class BusVelas:
+    """
+    Suscriptor WebSocket de klines que emite candle_closed(symbol, intervalo, vela)
+    cuando Bybit confirma el cierre de una vela (`confirm`). Los eventos se encolan
+    desde el hilo del WebSocket y los manejadores suscritos con `al_cerrar_vela` se
+    ejecutan en el hilo que llama a `despachar`, así las decisiones de trading no
+    compiten con el monitoreo.
+    """
+
+    def __init__(self):
+        self._ws = None
+        self._manejadores = []
+        self._pendientes = deque()
+        self._ultimo = {}        # (symbol, intervalo) -> timestamp de la última vela emitida
+        self._suscritos = set()  # (symbol, intervalo)
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self.velas_cerradas = 0
+
+    def iniciar(self, testnet=False):
+        """Abre la conexión pública lineal. Devuelve False si no se pudo (se seguirá sondeando)"""
+        if not PYBIT_WEBSOCKET:
+            return False
+        try:
+            self._ws = WebSocket(channel_type="linear", testnet=testnet)
+            print("✅ Stream de velas WebSocket conectado")
+            return True
+        except Exception as e:
+            print(f"⚠️  No se pudo conectar el stream de velas ({e}) - Sondeando cada ciclo")
+            self._ws = None
+            return False
+
+    def detener(self):
+        if self._ws is not None:
+            try:
+                self._ws.exit()
+            except Exception:
+                pass
+            self._ws = None
+        with self._lock:
+            self._suscritos.clear()
+
+    def conectado(self):
+        return self._ws is not None and self._ws.is_connected()
+
+    def al_cerrar_vela(self, manejador):
+        """Suscribe manejador(symbol, intervalo, vela) al evento candle_closed"""
+        if manejador not in self._manejadores:
+            self._manejadores.append(manejador)
+
+    def seguir(self, symbols, intervalo='5'):
+        """Suscribe las velas de los símbolos que aún no lo estén"""
+        if self._ws is None:
+            return
+        intervalo = str(intervalo)
+        with self._lock:
+            nuevos = [symbol for symbol in symbols if (symbol, intervalo) not in self._suscritos]
+            self._suscritos.update((symbol, intervalo) for symbol in nuevos)
+        if nuevos:
+            try:
+                self._ws.kline_stream(interval=intervalo, symbol=nuevos, callback=self._on_kline)
+            except Exception as e:
+                print(f"⚠️  Error suscribiendo velas {nuevos}: {e}")
+                with self._lock:
+                    self._suscritos.difference_update((symbol, intervalo) for symbol in nuevos)
+
+    def _on_kline(self, mensaje):
+        grabador_mercado.grabar('klines', {'stream': mensaje})
+        self.recibir(mensaje)
+
+    def recibir(self, mensaje):
+        """Encola las velas confirmadas de un mensaje del stream (en vivo o reproducido)"""
+        symbol = mensaje.get('topic', '').split('.')[-1]
+        for kline in mensaje.get('data', []):
+            # Solo interesa la vela confirmada; las actualizaciones de la vela en curso se ignoran
+            if not kline.get('confirm'):
+                continue
+            clave = (symbol, str(kline['interval']))
+            vela = parsear_vela_stream(kline)
+            with self._lock:
+                if vela['timestamp'] <= self._ultimo.get(clave, -1):
+                    continue  # Repetida (p.ej. al reconectar)
+                self._ultimo[clave] = vela['timestamp']
+                self._pendientes.append((symbol, clave[1], vela))
+            self._aviso.set()
+
+    def esperar(self, timeout):
+        """Espera hasta `timeout` s a que cierre alguna vela seguida. True si hay eventos pendientes"""
+        return self._aviso.wait(timeout)
+
+    def despachar(self):
+        """Ejecuta los manejadores con las velas cerradas pendientes. Devuelve cuántas había"""
+        with self._lock:
+            eventos = list(self._pendientes)
+            self._pendientes.clear()
+            self._aviso.clear()
+
+        for symbol, intervalo, vela in eventos:
+            self.velas_cerradas += 1
+            for manejador in list(self._manejadores):
+                try:
+                    manejador(symbol, intervalo, vela)
+                except Exception as e:
+                    print(f"❌ Error procesando cierre de vela {symbol}: {e}")
+        return len(eventos)
+
+# Bus único para todo el proceso
+bus_velas = BusVelas()
@@ -0,0 +1,229 @@
+import atexit
+import gzip
+import heapq
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime
+
+# ========== GRABACIÓN DE DATOS DE MERCADO (REPRODUCCIÓN OFFLINE) ==========
+
+MAGIA = b'GRABMD1\n'                # Cabecera de cada segmento (formato versión 1)
+CABECERA_REGISTRO = struct.Struct('<qI')  # timestamp ms, longitud del contenido
+STREAMS = ('tickers', 'klines', 'coinalyze')
+
+def tabla_a_registro(df):
+    """DataFrame (p.ej. la tabla de Coinalyze) como contenido grabable"""
+    return {'columns': [str(columna) for columna in df.columns], 'data': df.values.tolist()}
+
+def registro_a_tabla(contenido):
+    import pandas as pd
+    return pd.DataFrame(contenido['data'], columns=contenido['columns'])
+
+class _Segmento:
+    """Archivo de un stream abierto para añadir registros"""
+
+    def __init__(self, directorio, stream):
+        marca = datetime.now().strftime('%Y%m%dT%H%M%S_%f')
+        self.ruta = os.path.join(directorio, f"{stream}-{marca}.rec")
+        self.archivo = open(self.ruta, 'ab')
+        self.archivo.write(MAGIA)
+        self.bytes = len(MAGIA)
+        self.creado = time.time()
+
+    def escribir(self, timestamp_ms, contenido):
+        self.archivo.write(CABECERA_REGISTRO.pack(timestamp_ms, len(contenido)) + contenido)
+        self.archivo.flush()  # Solo se añade: tras un corte se pierde como mucho el último registro
+        self.bytes += CABECERA_REGISTRO.size + len(contenido)
+
+    def cerrar(self):
+        self.archivo.close()
+
+class GrabadorMercado:
+    """
+    Graba cada ticker, vela y tabla de Coinalyze que consume el bot en segmentos
+    binarios de solo-añadir por stream: registros (timestamp ms, JSON compacto)
+    con prefijo de longitud. Un segmento rota al pasar de `max_bytes` o de
+    `max_segundos` y el cerrado se comprime con gzip en segundo plano.
+    Inactivo (grabar no hace nada) hasta que se llama a `activar`.
+    """
+
+    def __init__(self):
+        self.directorio = None
+        self.max_bytes = 0
+        self.max_segundos = 0
+        self.comprimir = True
+        self._segmentos = {}
+        self._compresiones = []
+        self._lock = threading.Lock()
+        self.registros = 0
+
+    @property
+    def activo(self):
+        return self.directorio is not None
+
+    def activar(self, directorio='grabaciones', max_bytes=32 * 1024 * 1024, max_segundos=60 * 60, comprimir=True):
+        os.makedirs(directorio, exist_ok=True)
+        with self._lock:
+            self.directorio = directorio
+            self.max_bytes = max_bytes
+            self.max_segundos = max_segundos
+            self.comprimir = comprimir
+        atexit.register(self.cerrar)
+        print(f"⏺️  Grabando datos de mercado en {directorio}/")
+
+    def grabar(self, stream, contenido, timestamp_ms=None):
+        """Añade un registro al segmento del stream (rotándolo si toca)"""
+        if self.directorio is None:
+            return
+        datos = json.dumps(contenido, separators=(',', ':'), default=str).encode()
+        if timestamp_ms is None:
+            timestamp_ms = int(time.time() * 1000)
+
+        with self._lock:
+            if self.directorio is None:
+                return
+            segmento = self._segmentos.get(stream)
+            if segmento is not None and (segmento.bytes >= self.max_bytes or
+                                         time.time() - segmento.creado >= self.max_segundos):
+                self._cerrar_segmento(stream)
+                segmento = None
+            if segmento is None:
+                segmento = self._segmentos[stream] = _Segmento(self.directorio, stream)
+            segmento.escribir(timestamp_ms, datos)
+            self.registros += 1
+
+    def grabar_tabla(self, stream, df):
+        if self.directorio is not None:
+            self.grabar(stream, tabla_a_registro(df))
+
+    def _cerrar_segmento(self, stream):
+        segmento = self._segmentos.pop(stream)
+        segmento.cerrar()
+        if self.comprimir:
+            hilo = threading.Thread(target=comprimir_segmento, args=(segmento.ruta,), daemon=True)
+            hilo.start()
+            self._compresiones = [h for h in self._compresiones if h.is_alive()] + [hilo]
+
+    def esperar_compresiones(self, timeout=None):
+        for hilo in list(self._compresiones):
+            hilo.join(timeout)
+
+    def cerrar(self):
+        """Cierra los segmentos abiertos (sin comprimir: se leen igual) y desactiva la grabación"""
+        with self._lock:
+            for segmento in self._segmentos.values():
+                segmento.cerrar()
+            self._segmentos.clear()
+            self.directorio = None
+
+def comprimir_segmento(ruta):
+    """Comprime un segmento cerrado (.rec -> .rec.gz) sin dejar nunca un .gz a medias"""
+    temporal = ruta + '.gz.tmp'
+    with open(ruta, 'rb') as origen, gzip.open(temporal, 'wb') as destino:
+        shutil.copyfileobj(origen, destino)
+    os.replace(temporal, ruta + '.gz')
+    os.remove(ruta)
+
+# Grabador único para todo el proceso (inactivo salvo que se active)
+grabador_mercado = GrabadorMercado()
+
+# ========== REPRODUCCIÓN ==========
+
+def leer_segmento(ruta):
+    """Registros (timestamp_ms, contenido) de un segmento, parando en un registro incompleto"""
+    abrir = gzip.open if ruta.endswith('.gz') else open
+    if not os.path.exists(ruta) and os.path.exists(ruta + '.gz'):
+        ruta, abrir = ruta + '.gz', gzip.open  # Comprimido mientras tanto
+    try:
+        with abrir(ruta, 'rb') as archivo:
+            if archivo.read(len(MAGIA)) != MAGIA:
+                return
+            while True:
+                cabecera = archivo.read(CABECERA_REGISTRO.size)
+                if len(cabecera) < CABECERA_REGISTRO.size:
+                    return
+                timestamp_ms, longitud = CABECERA_REGISTRO.unpack(cabecera)
+                datos = archivo.read(longitud)
+                if len(datos) < longitud:
+                    return  # Cortado a mitad de escritura
+                yield timestamp_ms, json.loads(datos)
+    except EOFError:
+        return  # gzip truncado
+
+class ReproductorMercado:
+    """Lee una grabación y la devuelve en orden de tiempo, a 1x (o a `velocidad`) o sin esperas"""
+
+    def __init__(self, directorio='grabaciones'):
+        self.directorio = directorio
+
+    def segmentos(self, stream):
+        """Segmentos de un stream en orden (si están el .rec y su .rec.gz, solo el comprimido)"""
+        nombres = set(os.listdir(self.directorio)) if os.path.isdir(self.directorio) else set()
+        rutas = []
+        for nombre in sorted(nombres):
+            if not nombre.startswith(stream + '-'):
+                continue
+            if nombre.endswith('.rec.gz') or (nombre.endswith('.rec') and nombre + '.gz' not in nombres):
+                rutas.append(os.path.join(self.directorio, nombre))
+        return rutas
+
+    def eventos(self, streams=STREAMS):
+        """(timestamp_ms, stream, contenido) de todos los streams mezclados por tiempo"""
+        def del_stream(stream):
+            for ruta in self.segmentos(stream):
+                for timestamp_ms, contenido in leer_segmento(ruta):
+                    yield timestamp_ms, stream, contenido
+        return heapq.merge(*[del_stream(stream) for stream in streams], key=lambda evento: evento[0])
+
+    def reproducir(self, manejadores=None, velocidad=1.0, streams=STREAMS):
+        """
+        Entrega cada evento a manejadores[stream](contenido) respetando el ritmo
+        grabado dividido por `velocidad` (None = lo más rápido posible). Por defecto
+        alimenta la capa de datos de mercado (ver manejadores_mercado). Devuelve
+        cuántos eventos se entregaron por stream.
+        """
+        if manejadores is None:
+            manejadores = manejadores_mercado()
+        entregados = dict.fromkeys(streams, 0)
+        inicio_grabacion = inicio_real = None
+
+        for timestamp_ms, stream, contenido in self.eventos(streams):
+            if velocidad:
+                if inicio_grabacion is None:
+                    inicio_grabacion, inicio_real = timestamp_ms, time.time()
+                espera = (timestamp_ms - inicio_grabacion) / 1000 / velocidad - (time.time() - inicio_real)
+                if espera > 0:
+                    time.sleep(espera)
+            manejador = manejadores.get(stream)
+            if manejador is not None:
+                manejador(contenido)
+                entregados[stream] += 1
+        return entregados
+
+def manejadores_mercado():
+    """
+    Manejadores que devuelven cada registro al mismo sitio del que salió: snapshot y
+    tabla de tickers, cache de velas y bus de cierres de vela. Las tablas de
+    Coinalyze no tienen capa propia y se dejan al llamador (registro_a_tabla).
+    """
+    from eventos_velas import bus_velas
+    from tickers import snapshot_tickers, stream_tickers
+    from velas import cache_velas
+
+    def tickers(contenido):
+        if 'snapshot' in contenido:
+            snapshot_tickers.cargar(contenido['snapshot'])
+        else:
+            stream_tickers.tabla.actualizar(contenido['tabla'])
+
+    def klines(contenido):
+        if 'stream' in contenido:
+            bus_velas.recibir(contenido['stream'])
+        else:
+            cache_velas.cargar(contenido['symbol'], contenido['interval'], contenido['list'])
+
+    return {'tickers': tickers, 'klines': klines}
@@ -0,0 +1,384 @@
+import warnings
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+
+# ========== REGRESIÓN LINEAL MÓVIL (FORMA CERRADA) ==========
+
+@lru_cache(maxsize=None)
+def _kernel_pendiente(longitud):
+    """Pesos fijos (x - x̄) / Σ(x - x̄)² para la pendiente OLS de una ventana"""
+    x = np.arange(longitud, dtype=float)
+    x -= x.mean()
+    return x / np.dot(x, x)
+
+def pendiente_movil(valores, longitud):
+    """
+    Pendiente de la regresión lineal de cada ventana de `longitud` valores.
+    Equivale a rolling(longitud).apply(np.polyfit(x, y, 1)[0]) pero en una
+    sola correlación con un kernel fijo. NaN hasta completar la primera ventana
+    y en cualquier ventana que contenga NaN (igual que rolling).
+    """
+    y = np.asarray(valores, dtype=float)
+    resultado = np.full(len(y), np.nan)
+
+    if longitud < 2 or len(y) < longitud:
+        return resultado
+
+    resultado[longitud - 1:] = np.correlate(y, _kernel_pendiente(longitud), mode='valid')
+    return resultado
+
+# ========== REPARTO DE VOLUMEN COMPRA/VENTA ==========
+
+def calcular_rate_velas(open_, high, low, close):
+    """
+    Fracción compradora de cada vela (rate) sobre arrays completos.
+    Vela verde: 0.5 * (tw + bw + 2*body) / rango, vela roja: 0.5 * (tw + bw) / rango.
+    Rango cero o cualquier NaN en la vela devuelven 0.5.
+    """
+    open_ = np.asarray(open_, dtype=float)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+
+    tw = high - np.maximum(open_, close)  # Top wick
+    bw = np.minimum(open_, close) - low   # Bottom wick
+    body = np.abs(close - open_)          # Body
+    rango = tw + bw + body
+
+    mechas = tw + bw
+    numerador = np.where(open_ <= close, mechas + 2 * body, mechas)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = 0.5 * numerador / rango
+
+    rate[(rango == 0) | np.isnan(rate)] = 0.5
+    return rate
+
+def calcular_señales(slope_price, slope_volume_up, slope_volume_down):
+    """Señales vol_up / vol_down (1 o NaN) igual que las columnas de calcular_volume_regression"""
+    vol_up = 1.0 if (slope_price > 0 and slope_volume_up > 0 and
+                     slope_volume_up > slope_volume_down) else np.nan
+    vol_down = 1.0 if (slope_price < 0 and slope_volume_down > 0 and
+                       slope_volume_up < slope_volume_down) else np.nan
+    return {
+        'slope_price': slope_price,
+        'slope_volume_up': slope_volume_up,
+        'slope_volume_down': slope_volume_down,
+        'vol_up': vol_up,
+        'vol_down': vol_down
+    }
+
+# ========== VOLUME REGRESSION SOLO ÚLTIMA VELA ==========
+
+def _pendiente_cola(valores, longitud):
+    """Pendiente OLS de las últimas `longitud` posiciones (NaN si no hay suficientes)"""
+    if longitud < 2 or len(valores) < longitud:
+        return np.nan
+    return float(np.dot(_kernel_pendiente(longitud), valores[-longitud:]))
+
+def volume_regression_ultimo(velas, short_len=7, long_len=50, source='close'):
+    """
+    Señales Volume Regression de la última vela calculando solo las ventanas finales.
+    `velas` es cualquier contenedor indexable por columna (DataFrame, dict de arrays)
+    en orden cronológico; no se copia ni se crea ningún DataFrame. El resultado
+    coincide con la última fila de calcular_volume_regression.
+    """
+    precio = np.asarray(velas[source], dtype=float)
+    slope_price = _pendiente_cola(precio, short_len)
+
+    cola = slice(-long_len, None)
+    volume = np.asarray(velas['volume'], dtype=float)[cola]
+    rate = calcular_rate_velas(
+        np.asarray(velas['open'], dtype=float)[cola],
+        np.asarray(velas['high'], dtype=float)[cola],
+        np.asarray(velas['low'], dtype=float)[cola],
+        np.asarray(velas['close'], dtype=float)[cola]
+    )
+    slope_volume_up = _pendiente_cola(volume * rate, long_len)
+    slope_volume_down = _pendiente_cola(volume * (1 - rate), long_len)
+
+    return calcular_señales(slope_price, slope_volume_up, slope_volume_down)
+
+# ========== MÉTRICAS POR LOTE (SÍMBOLOS × VELAS) ==========
+
+def apilar_velas(velas_por_simbolo, cantidad):
+    """
+    Apila las últimas `cantidad` velas de cada símbolo en matrices (símbolos × velas)
+    por columna OHLCV. Todos los símbolos deben tener al menos `cantidad` velas.
+    """
+    return {
+        columna: np.vstack([np.asarray(velas[columna], dtype=float)[-cantidad:]
+                            for velas in velas_por_simbolo])
+        for columna in ('open', 'high', 'low', 'close', 'volume')
+    }
+
+def calcular_metricas_lote(open, high, low, close, volume, short_len=7, long_len=50, periodo_atr=14):
+    """
+    Métricas de entrada para todos los candidatos en una sola pasada vectorizada.
+    Cada argumento es una matriz (símbolos × velas) en orden cronológico. Devuelve
+    un dict de arrays (uno por símbolo) con el rango %, la tendencia de volumen,
+    la fuerza de tendencia (ATR normalizado) y las pendientes de Volume Regression
+    de la última vela, con la misma semántica que las funciones por símbolo.
+    Con `periodo_atr=None` se omite la fuerza de tendencia (p.ej. si la aporta ATRIncremental).
+    """
+    open_, high, low, close, volume = (np.atleast_2d(np.asarray(m, dtype=float))
+                                       for m in (open, high, low, close, volume))
+    simbolos, velas = close.shape
+
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # Filas completas de NaN
+
+        # 1. Rango de precio (máximo vs mínimo)
+        high_max = np.nanmax(high, axis=1)
+        low_min = np.nanmin(low, axis=1)
+        rango_porcentual = (high_max - low_min) / ((high_max + low_min) / 2) * 100
+
+        # 2. Tendencia de volumen: primer tercio vs último tercio
+        tercio = velas // 3
+        if velas < 10 or tercio == 0:
+            tendencia_volumen = np.zeros(simbolos)
+        else:
+            volumen_inicial = np.nanmean(volume[:, :tercio], axis=1)
+            volumen_final = np.nanmean(volume[:, -tercio:], axis=1)
+            tendencia_volumen = np.where(
+                volumen_inicial == 0, 0.0, (volumen_final - volumen_inicial) / volumen_inicial
+            )
+
+        # 3. Fuerza de tendencia: ATR normalizado de la última vela
+        if periodo_atr is not None:
+            fuerza_tendencia = atr_normalizado_lote(high, low, close, periodo_atr)
+
+    # 4. Pendientes de Volume Regression de la última vela
+    rate = calcular_rate_velas(open_, high, low, close)
+    slope_price = _pendiente_cola_lote(close, short_len)
+    slope_volume_up = _pendiente_cola_lote(volume * rate, long_len)
+    slope_volume_down = _pendiente_cola_lote(volume * (1 - rate), long_len)
+
+    metricas = {
+        'rango_porcentual': rango_porcentual,
+        'tendencia_volumen': tendencia_volumen,
+        'slope_price': slope_price,
+        'slope_volume_up': slope_volume_up,
+        'slope_volume_down': slope_volume_down
+    }
+    if periodo_atr is not None:
+        metricas['fuerza_tendencia'] = fuerza_tendencia
+    return metricas
+
+def _true_range(high, low, close_prev):
+    """max(high - low, |high - close previo|, |low - close previo|) ignorando el close previo ausente"""
+    return np.fmax(high - low, np.fmax(np.abs(high - close_prev), np.abs(low - close_prev)))
+
+def atr_normalizado_lote(high, low, close, periodo=14):
+    """ATR(periodo) / close * 100 de la última vela de cada fila (0 si hay menos de `periodo` velas)"""
+    high, low, close = (np.atleast_2d(np.asarray(m, dtype=float)) for m in (high, low, close))
+    simbolos, velas = close.shape
+    if velas < periodo:
+        return np.zeros(simbolos)
+
+    # True range de las últimas `periodo` velas; la primera vela no tiene cierre previo
+    close_prev = np.concatenate([np.full((simbolos, 1), np.nan), close[:, :-1]], axis=1)
+    cola = slice(-periodo, None)
+    true_range = _true_range(high[:, cola], low[:, cola], close_prev[:, cola])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return true_range.mean(axis=1) / close[:, -1] * 100
+
+def _pendiente_cola_lote(matriz, longitud):
+    """Pendiente OLS de las últimas `longitud` velas de cada fila"""
+    if longitud < 2 or matriz.shape[1] < longitud:
+        return np.full(matriz.shape[0], np.nan)
+    return matriz[:, -longitud:] @ _kernel_pendiente(longitud)
+
+# ========== VOLUME REGRESSION INCREMENTAL (STREAMING) ==========
+
+class _PendienteIncremental:
+    """Pendiente OLS de una ventana deslizante mantenida con sumas en O(1)"""
+
+    def __init__(self, longitud):
+        self.longitud = longitud
+        self.valores = deque(maxlen=longitud)
+        self.suma_y = 0.0   # Σ y_j
+        self.suma_jy = 0.0  # Σ j·y_j, j = 0 para el valor más antiguo
+        self.nans = 0
+        self.desde_recalculo = 0
+
+        n = float(longitud)
+        self.suma_j = n * (n - 1) / 2
+        self.denominador = n * n * (n * n - 1) / 12  # n·Σj² - (Σj)²
+
+    def _sumas_con(self, valor):
+        """Sumas (Σy, Σjy, nans) tras añadir `valor` sin modificar el estado"""
+        y = 0.0 if np.isnan(valor) else valor
+        nans = self.nans + (1 if np.isnan(valor) else 0)
+
+        if len(self.valores) < self.longitud:
+            return self.suma_y + y, self.suma_jy + len(self.valores) * y, nans
+
+        y0 = self.valores[0]
+        if np.isnan(y0):
+            nans -= 1
+            y0 = 0.0
+        suma_y = self.suma_y - y0 + y
+        suma_jy = self.suma_jy - (self.suma_y - y0) + (self.longitud - 1) * y
+        return suma_y, suma_jy, nans
+
+    def _pendiente(self, suma_y, suma_jy, nans, cantidad):
+        if self.longitud < 2 or cantidad < self.longitud or nans > 0:
+            return np.nan
+        return (self.longitud * suma_jy - self.suma_j * suma_y) / self.denominador
+
+    def agregar(self, valor):
+        """Añade un valor cerrado a la ventana"""
+        valor = float(valor)
+        self.suma_y, self.suma_jy, self.nans = self._sumas_con(valor)
+        self.valores.append(valor)
+
+        # Recalcular exacto cada `longitud` valores para que no se acumule error de redondeo
+        self.desde_recalculo += 1
+        if self.desde_recalculo >= self.longitud:
+            self._recalcular()
+
+    def _recalcular(self):
+        y = np.array(self.valores, dtype=float)
+        nan = np.isnan(y)
+        y[nan] = 0.0
+        self.suma_y = float(y.sum())
+        self.suma_jy = float(np.dot(np.arange(len(y)), y))
+        self.nans = int(nan.sum())
+        self.desde_recalculo = 0
+
+    def pendiente(self):
+        """Pendiente de la ventana actual"""
+        return self._pendiente(self.suma_y, self.suma_jy, self.nans, len(self.valores))
+
+    def pendiente_con(self, valor):
+        """Pendiente si `valor` fuese el siguiente de la ventana (sin modificar el estado)"""
+        suma_y, suma_jy, nans = self._sumas_con(float(valor))
+        return self._pendiente(suma_y, suma_jy, nans, min(len(self.valores) + 1, self.longitud))
+
+class VolumeRegressionIncremental:
+    """
+    Estado Volume Regression de un símbolo que se actualiza en O(1) por vela cerrada.
+    Mantiene las sumas de la pendiente de precio (short_len) y de los volúmenes
+    comprador/vendedor (long_len) y expone las señales de la última vela.
+    """
+
+    def __init__(self, short_len=7, long_len=50, source='close'):
+        self.source = source
+        self.precio = _PendienteIncremental(short_len)
+        self.volumen_up = _PendienteIncremental(long_len)
+        self.volumen_down = _PendienteIncremental(long_len)
+        self.ultimo_timestamp = None
+
+    def _descomponer(self, vela):
+        """Devuelve (precio fuente, volumen comprador, volumen vendedor) de una vela"""
+        rate = calcular_rate_velas([vela['open']], [vela['high']], [vela['low']], [vela['close']])[0]
+        volume = float(vela['volume'])
+        return float(vela[self.source]), volume * rate, volume * (1 - rate)
+
+    def actualizar(self, vela):
+        """Incorpora una vela CERRADA (dict con open, high, low, close, volume y opcional timestamp)"""
+        precio, volumen_up, volumen_down = self._descomponer(vela)
+        self.precio.agregar(precio)
+        self.volumen_up.agregar(volumen_up)
+        self.volumen_down.agregar(volumen_down)
+
+        if vela.get('timestamp') is not None:
+            self.ultimo_timestamp = int(vela['timestamp'])
+
+    def cargar_historial(self, df):
+        """Carga velas cerradas en orden cronológico (más antigua primero)"""
+        for vela in df.to_dict('records'):
+            self.actualizar(vela)
+
+    def ultimo(self, vela_en_curso=None):
+        """
+        Señales de la última vela. Con `vela_en_curso` se calcula como si fuese la
+        última fila del DataFrame (igual que calcular_volume_regression con la vela
+        aún abierta) sin incorporarla al estado.
+        """
+        if vela_en_curso is None:
+            return calcular_señales(
+                self.precio.pendiente(), self.volumen_up.pendiente(), self.volumen_down.pendiente()
+            )
+
+        precio, volumen_up, volumen_down = self._descomponer(vela_en_curso)
+        return calcular_señales(
+            self.precio.pendiente_con(precio),
+            self.volumen_up.pendiente_con(volumen_up),
+            self.volumen_down.pendiente_con(volumen_down)
+        )
+
+# ========== ATR / FUERZA DE TENDENCIA INCREMENTAL ==========
+
+class ATRIncremental:
+    """
+    ATR normalizado (ATR / close * 100) de un símbolo que se actualiza en O(1) por
+    vela cerrada. `cargar_historial` arranca en frío de forma vectorizada.
+    """
+
+    def __init__(self, periodo=14):
+        self.periodo = periodo
+        self.rangos = deque(maxlen=periodo)
+        self.suma = 0.0
+        self.close_prev = np.nan
+        self.ultimo_timestamp = None
+        self.desde_recalculo = 0
+
+    def _rango(self, vela):
+        return float(_true_range(float(vela['high']), float(vela['low']), self.close_prev))
+
+    def actualizar(self, vela):
+        """Incorpora una vela CERRADA (dict con high, low, close y opcional timestamp)"""
+        true_range = self._rango(vela)
+        if len(self.rangos) == self.periodo:
+            self.suma -= self.rangos[0]
+        self.rangos.append(true_range)
+        self.suma += true_range
+        self.close_prev = float(vela['close'])
+
+        if vela.get('timestamp') is not None:
+            self.ultimo_timestamp = int(vela['timestamp'])
+
+        # Recalcular exacto cada `periodo` velas para que no se acumule error de redondeo
+        self.desde_recalculo += 1
+        if self.desde_recalculo >= self.periodo:
+            self.suma = float(sum(self.rangos))
+            self.desde_recalculo = 0
+
+    def cargar_historial(self, df):
+        """Carga velas cerradas en orden cronológico; solo se procesan las últimas `periodo`"""
+        if len(df) == 0:
+            return
+        close = df['close'].to_numpy(dtype=float)
+        close_prev = np.concatenate([[self.close_prev], close[:-1]])
+        cola = slice(-self.periodo, None)
+        rangos = _true_range(df['high'].to_numpy(dtype=float)[cola], df['low'].to_numpy(dtype=float)[cola],
+                             close_prev[cola])
+
+        self.rangos.extend(float(r) for r in rangos)
+        self.suma = float(sum(self.rangos))
+        self.close_prev = float(close[-1])
+        self.desde_recalculo = 0
+        if 'timestamp' in df:
+            self.ultimo_timestamp = int(df['timestamp'].iloc[-1])
+
+    def atr_normalizado(self, vela_en_curso=None):
+        """
+        ATR normalizado de la última vela (0 si hay menos de `periodo` velas). Con
+        `vela_en_curso` se calcula como si fuese la última fila, sin incorporarla.
+        """
+        if vela_en_curso is None:
+            cantidad, suma, close = len(self.rangos), self.suma, self.close_prev
+        else:
+            lleno = len(self.rangos) == self.periodo
+            cantidad = min(len(self.rangos) + 1, self.periodo)
+            suma = self.suma + self._rango(vela_en_curso) - (self.rangos[0] if lleno else 0.0)
+            close = float(vela_en_curso['close'])
+
+        if cantidad < self.periodo:
+            return 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(np.float64(suma / self.periodo) / close * 100)
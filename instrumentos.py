@@ -0,0 +1,84 @@
+import threading
+import time
+
+# ========== CACHE DE INSTRUMENTOS (CONTRATOS LINEALES) ==========
+
+def _a_float(valor, defecto):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+def parsear_instrumento(instrumento):
+    """Tabla de tamaño de orden de un instrumento de get_instruments_info"""
+    lot_size_filter = instrumento.get('lotSizeFilter', {})
+    price_filter = instrumento.get('priceFilter', {})
+    return {
+        'min_order_qty': _a_float(lot_size_filter.get('minOrderQty'), 0.001),
+        'qty_step': _a_float(lot_size_filter.get('qtyStep'), 0.001),
+        'max_order_qty': _a_float(lot_size_filter.get('maxOrderQty'), float('inf')),
+        # Mismo criterio que antes para el mínimo de la orden (minOrderAmt, por defecto 5 USDT)
+        'min_order_value': _a_float(instrumento.get('minOrderAmt'), 5.0),
+        'min_notional': _a_float(lot_size_filter.get('minNotionalValue'), 5.0),
+        'tick_size': _a_float(price_filter.get('tickSize'), 0.0001),
+        'status': instrumento.get('status', ''),
+    }
+
+class CacheInstrumentos:
+    """
+    Metadatos de todos los contratos lineales, descargados de una vez (paginando)
+    y refrescados cada `intervalo` segundos: conjunto de símbolos para comprobar
+    pertenencia en O(1) y tabla de lote / nocional mínimo / tick por símbolo.
+    """
+
+    def __init__(self, intervalo=6 * 60 * 60):
+        self.intervalo = intervalo
+        self.simbolos = frozenset()
+        self.info = {}
+        self.actualizado = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, symbol):
+        return symbol in self.simbolos
+
+    def __len__(self):
+        return len(self.simbolos)
+
+    def vigente(self):
+        return bool(self.info) and time.time() - self.actualizado < self.intervalo
+
+    def actualizar(self, session):
+        """Descarga todos los instrumentos lineales. Devuelve False si Bybit responde con error"""
+        info = {}
+        cursor = None  # pybit omite los parámetros None
+        while True:
+            response = session.get_instruments_info(category="linear", limit=1000, cursor=cursor)
+            if response['retCode'] != 0:
+                print(f"❌ Error obteniendo pares: {response.get('retMsg', 'Unknown error')}")
+                return False
+
+            for instrumento in response['result']['list']:
+                info[instrumento['symbol']] = parsear_instrumento(instrumento)
+
+            cursor = response['result'].get('nextPageCursor') or None
+            if cursor is None:
+                break
+
+        with self._lock:
+            self.info = info
+            self.simbolos = frozenset(info)
+            self.actualizado = time.time()
+        return True
+
+    def asegurar(self, session):
+        """Refresca la tabla si caducó. True si hay tabla utilizable (aunque sea la anterior)"""
+        if not self.vigente():
+            self.actualizar(session)
+        return bool(self.info)
+
+    def obtener(self, symbol):
+        """Tabla de tamaño de orden del símbolo (sin red), o None si no se conoce"""
+        return self.info.get(symbol)
+
+# Cache única para todo el proceso
+cache_instrumentos = CacheInstrumentos()
@@ -0,0 +1,103 @@
+import threading
+import time
+
+# ========== AGRUPACIÓN DE PETICIONES IDÉNTICAS (SINGLE-FLIGHT) ==========
+
+class _Vuelo:
+    """Una ejecución en curso (o recién terminada) de una petición"""
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.fin = 0.0
+
+class VueloUnico:
+    """
+    Las llamadas concurrentes con la misma clave comparten una sola ejecución y su
+    resultado. Con `ttl` > 0 el resultado se sigue sirviendo durante esos segundos
+    a las llamadas que lleguen después (los errores nunca se guardan).
+    """
+
+    def __init__(self, ttl=0.0):
+        self.ttl = ttl
+        self._vuelos = {}
+        self._lock = threading.Lock()
+        self.ejecuciones = 0
+        self.agrupadas = 0
+
+    def hacer(self, clave, funcion):
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is not None and vuelo.terminado.is_set() and time.time() - vuelo.fin > self.ttl:
+                vuelo = None  # Caducado
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.ejecuciones += 1
+            else:
+                self.agrupadas += 1
+
+        if not lider:
+            vuelo.terminado.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = funcion()
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            vuelo.fin = time.time()
+            with self._lock:
+                if (vuelo.error is not None or not self.ttl) and self._vuelos.get(clave) is vuelo:
+                    del self._vuelos[clave]
+            vuelo.terminado.set()
+        return vuelo.resultado
+
+    def invalidar(self):
+        """
+        Olvida los resultados guardados. Las ejecuciones en curso terminan para quien
+        ya las esperaba, pero las llamadas nuevas no se unen a ellas (podrían ser
+        anteriores al cambio que motiva la invalidación).
+        """
+        with self._lock:
+            self._vuelos.clear()
+
+class SesionAgrupada:
+    """
+    Envoltorio de la sesión de Bybit (pybit.HTTP o el exchange simulado): las
+    lecturas (`get_*`) idénticas que coinciden en el tiempo, p.ej. el balance o
+    get_positions(settleCoin="USDT") desde el hilo principal y el de monitoreo,
+    hacen una sola llamada de red y comparten la respuesta (no modificarla).
+    Cualquier otra llamada (órdenes, stops, apalancamiento) pasa directa y
+    descarta las lecturas guardadas por el micro-TTL.
+    """
+
+    def __init__(self, session, ttl=0.0):
+        self.session = session
+        self.vuelos = VueloUnico(ttl)
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.session, nombre)
+        if not callable(atributo):
+            return atributo
+
+        if nombre.startswith('get_'):
+            def lectura(*args, **kwargs):
+                clave = (nombre, args, tuple(sorted(kwargs.items())))
+                try:
+                    hash(clave)
+                except TypeError:
+                    return atributo(*args, **kwargs)  # Argumentos no comparables (p.ej. listas)
+                return self.vuelos.hacer(clave, lambda: atributo(*args, **kwargs))
+            return lectura
+
+        def escritura(*args, **kwargs):
+            try:
+                return atributo(*args, **kwargs)
+            finally:
+                self.vuelos.invalidar()
+        return escritura
@@ -0,0 +1,88 @@
+import time
+
+# ========== PUERTAS DE ENTRADA DE LOS CANDIDATOS ==========
+
+FUNDING_MAXIMO = 0.06  # % de funding a partir del cual se descarta
+
+MOTIVO_LATERAL = "En rango lateral"
+MOTIVO_TENDENCIA = "Fuerza tendencial negativa"
+MOTIVO_SIN_FUNDING = "Funding rate no disponible"
+MOTIVO_FUNDING_ALTO = "Funding rate muy alto"
+
+def _cronometrar(tiempos, puerta, funcion, *args):
+    inicio = time.perf_counter()
+    try:
+        return funcion(*args)
+    finally:
+        tiempos[puerta] = (time.perf_counter() - inicio) * 1000
+
+def tendencia_positiva(symbol, metricas, sin_metricas):
+    """
+    Fuerza tendencial con la pendiente de precio de las métricas ya calculadas
+    (las mismas velas que la lateralización); sin métricas se delega en
+    `sin_metricas(symbol)`, que descarga sus propias velas
+    """
+    if metricas is None:
+        return sin_metricas(symbol)
+    slope_price = metricas['slope_price']
+    print(f"   📊 Fuerza tendencial {symbol}: {slope_price:.8f}")
+    return slope_price > 0
+
+def evaluar_puertas(activo, metricas, es_lateral, obtener_funding, tendencia_sin_metricas=None, tiempo_datos=0.0):
+    """
+    Veredicto de un candidato con las puertas de entrada en orden: lateralización,
+    fuerza tendencial y funding. La primera que falla fija el `motivo` y las
+    siguientes no se evalúan (el funding solo se consulta si hace falta).
+    Lo que depende del script llega como funciones:
+    - es_lateral(symbol, metricas): criterios de lateralización (sin métricas no se descarta)
+    - obtener_funding(symbol): funding previsto en %, o None (sin dato se descarta)
+    - tendencia_sin_metricas(symbol): fuerza tendencial sin métricas; sin ella
+      no hay puerta de fuerza tendencial
+    Devuelve {'activo', 'symbol', 'moneda', 'apto', 'motivo', 'metricas',
+    'funding_rate', 'tiempos'} con la duración en ms de cada puerta evaluada.
+    """
+    symbol = activo['simbolo_bybit']
+    moneda = activo['moneda']
+    veredicto = {
+        'activo': activo,
+        'symbol': symbol,
+        'moneda': moneda,
+        'apto': False,
+        'motivo': None,
+        'metricas': metricas,
+        'funding_rate': None,
+        'tiempos': {'datos': tiempo_datos}
+    }
+    tiempos = veredicto['tiempos']
+
+    # 1. Lateralización
+    if metricas is not None and _cronometrar(tiempos, 'lateral', es_lateral, symbol, metricas):
+        print(f"   ❌ {moneda} ({symbol}): EN LATERAL - Descartado")
+        veredicto['motivo'] = MOTIVO_LATERAL
+        return veredicto
+    tiempos.setdefault('lateral', 0.0)
+
+    # 2. Fuerza tendencial
+    if tendencia_sin_metricas is not None:
+        if not _cronometrar(tiempos, 'tendencia', tendencia_positiva, symbol, metricas, tendencia_sin_metricas):
+            print(f"   ❌ Fuerza tendencial NEGATIVA - Descartado")
+            veredicto['motivo'] = MOTIVO_TENDENCIA
+            return veredicto
+
+    # 3. Funding rate
+    funding_rate = _cronometrar(tiempos, 'funding', obtener_funding, symbol)
+    veredicto['funding_rate'] = funding_rate
+    if funding_rate is None:
+        print(f"   ❌ Funding rate no disponible - Descartado")
+        veredicto['motivo'] = MOTIVO_SIN_FUNDING
+        return veredicto
+
+    print(f"   📊 Funding Rate {symbol}: {funding_rate:.4f}%")
+    if funding_rate >= FUNDING_MAXIMO:
+        print(f"   ❌ Funding rate muy alto - Descartado")
+        veredicto['motivo'] = MOTIVO_FUNDING_ALTO
+        return veredicto
+
+    veredicto['apto'] = True
+    print(f"   ✅ {moneda} ({symbol}): Apto para operar")
+    return veredicto
@@ -0,0 +1,602 @@
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+
+from velas import ArchivoVelas, intervalo_a_ms, registros_a_columnas
+
+try:
+    from pybit.exceptions import InvalidRequestError
+except ImportError:
+    class InvalidRequestError(Exception):
+        """Mismo papel que pybit.exceptions.InvalidRequestError cuando pybit no está instalado"""
+
+        def __init__(self, request, message, status_code, time, resp_headers):
+            self.request = request
+            self.message = message
+            self.status_code = status_code
+            self.time = time
+            self.resp_headers = resp_headers
+            super().__init__(f"{message.capitalize()} (ErrCode: {status_code}) (ErrTime: {time}).")
+
+# ========== EXCHANGE BYBIT SIMULADO (PRUEBAS SIN RED) ==========
+
+MINUTO_MS = 60 * 1000
+HORA_MS = 60 * MINUTO_MS
+FUNDING_MS = 8 * HORA_MS
+ABRIR, HIGH, LOW, CLOSE, VOLUME, TURNOVER = range(6)  # Columnas de `valores` (COLUMNAS_VELA sin timestamp)
+
+def trayectoria_sintetica(precio_inicial, minutos, volatilidad=0.002, deriva=0.0, volumen=1000.0,
+                          semilla=None, inicio_ms=0):
+    """Velas de 1 minuto de un paseo aleatorio geométrico, como (timestamps, valores) de parsear_klines"""
+    rng = np.random.default_rng(semilla)
+    cierres = precio_inicial * np.exp(np.cumsum(rng.normal(deriva, volatilidad, minutos)))
+    aperturas = np.concatenate(([precio_inicial], cierres[:-1]))
+    mechas = np.abs(rng.normal(0, volatilidad / 2, (2, minutos)))
+    volumenes = volumen * rng.lognormal(0, 0.5, minutos)
+    valores = np.column_stack([
+        aperturas,
+        np.maximum(aperturas, cierres) * (1 + mechas[0]),
+        np.minimum(aperturas, cierres) * (1 - mechas[1]),
+        cierres,
+        volumenes,
+        volumenes * cierres
+    ])
+    return inicio_ms + np.arange(minutos, dtype=np.int64) * MINUTO_MS, valores
+
+def _paso_decimal(valor):
+    """Potencia de 10 más cercana por debajo (0.0123 -> 0.01)"""
+    return 10.0 ** math.floor(math.log10(valor))
+
+def _texto(numero):
+    return f"{numero:.10f}".rstrip('0').rstrip('.') if numero else '0'
+
+class ExchangeSimulado:
+    """
+    Sustituto en proceso de pybit.HTTP para probar el bot sin red: responde
+    get_kline, get_tickers, get_instruments_info, get_wallet_balance,
+    get_positions, get_open_orders, get_order_history, place_order,
+    cancel_order, set_trading_stop, set_leverage y switch_position_mode con la
+    misma forma que Bybit y lanza InvalidRequestError en los rechazos, igual que pybit.
+
+    Los precios salen de velas base (de 1 minuto sintéticas o grabadas) que se
+    reproducen con un reloj propio: `velocidad` minutos de mercado por minuto real
+    (0 = reloj parado, se mueve con `avanzar`). En cada llamada se recorre el
+    tramo de precios transcurrido para ejecutar órdenes límite y TP/SL.
+    `latencia` (segundos o (mín, máx)) se duerme en cada llamada y `limites`
+    ({'consulta': n, 'orden': n} peticiones por segundo) hace esperar como los
+    reintentos de pybit ante el límite de peticiones de Bybit.
+    No simula liquidaciones ni el cobro de funding.
+    """
+
+    def __init__(self, trayectorias, saldo_inicial=1000.0, velocidad=1.0, inicio_ms=None, latencia=0.0,
+                 limites=None, comision_taker=0.00055, comision_maker=0.0002, deslizamiento=0.0,
+                 funding_rate=0.0001, apalancamiento=10):
+        self.velocidad = velocidad
+        self.latencia = latencia
+        self.limites = limites or {}
+        self.comision_taker = comision_taker
+        self.comision_maker = comision_maker
+        self.deslizamiento = deslizamiento
+        self.funding_rate = funding_rate
+        self.apalancamiento_defecto = apalancamiento
+        self.saldo = float(saldo_inicial)
+        self.modo_posicion = 0  # 0 = One-Way, 3 = Hedge (como en Bybit)
+
+        # El instante `inicio_ms` de las trayectorias pasa a ser "ahora", desplazando
+        # las velas un número entero de horas para que sigan alineadas a su intervalo
+        if inicio_ms is None:
+            primero = max(int(ts[0]) for ts, _ in trayectorias.values())
+            ultimo = min(int(ts[-1]) for ts, _ in trayectorias.values())
+            inicio_ms = primero + (ultimo - primero) // 2
+        ahora_real = int(time.time() * 1000)
+        desplazamiento = (ahora_real - inicio_ms) // HORA_MS * HORA_MS
+
+        self._velas = {}
+        self._duracion = {}
+        self.instrumentos = {}
+        for symbol, (timestamps, valores) in trayectorias.items():
+            timestamps = np.asarray(timestamps, dtype=np.int64) + desplazamiento
+            self._velas[symbol] = (timestamps, np.asarray(valores, dtype=float))
+            self._duracion[symbol] = int(timestamps[1] - timestamps[0]) if len(timestamps) > 1 else MINUTO_MS
+            self.instrumentos[symbol] = self._instrumento(symbol, float(valores[0][ABRIR]))
+
+        self._t0 = time.time()
+        self._inicio_ms = ahora_real
+        self._adelanto_ms = 0
+        self._lock = threading.RLock()
+        self._lock_limites = threading.Lock()
+        self._fichas = {}
+        self._apalancamiento = {}
+        self.posiciones = {}       # (symbol, positionIdx) -> posición
+        self.ordenes = {}          # orderId -> orden (todas)
+        self.abiertas = {}         # orderId -> orden límite en el libro
+        self._procesado = {}       # symbol -> último instante recorrido por el motor
+        self.llamadas = defaultdict(int)
+        self.esperas_limite = 0
+
+    @classmethod
+    def sintetico(cls, precios, minutos=3000, volatilidad=0.002, semilla=None, **kwargs):
+        """Exchange con un paseo aleatorio de `minutos` velas por símbolo ({symbol: precio inicial})"""
+        rng = np.random.default_rng(semilla)
+        trayectorias = {symbol: trayectoria_sintetica(precio, minutos, volatilidad, semilla=rng.integers(2 ** 32))
+                        for symbol, precio in precios.items()}
+        return cls(trayectorias, **kwargs)
+
+    @classmethod
+    def desde_archivo(cls, archivo, symbols, intervalo='1', **kwargs):
+        """Exchange que reproduce las velas grabadas en un ArchivoVelas"""
+        trayectorias = {}
+        for symbol in symbols:
+            registros = archivo.leer(symbol, intervalo)
+            if len(registros) > 1:
+                trayectorias[symbol] = registros_a_columnas(np.array(registros))
+        if not trayectorias:
+            raise ValueError(f"No hay velas grabadas de {list(symbols)} en {intervalo}m")
+        return cls(trayectorias, **kwargs)
+
+    # ---------- Reloj y precios ----------
+
+    def ahora_ms(self):
+        return int(self._inicio_ms + (time.time() - self._t0) * self.velocidad * 1000 + self._adelanto_ms)
+
+    def avanzar(self, segundos):
+        """Adelanta el reloj de mercado (p.ej. con velocidad 0 para pruebas deterministas)"""
+        with self._lock:
+            self._adelanto_ms += int(segundos * 1000)
+
+    def _precio(self, symbol, instante):
+        """Precio interpolado entre apertura y cierre de la vela base en curso"""
+        timestamps, valores = self._velas[symbol]
+        i = int(np.searchsorted(timestamps, instante, side='right')) - 1
+        if i < 0:
+            return float(valores[0, ABRIR])
+        fraccion = min((instante - timestamps[i]) / self._duracion[symbol], 1.0)
+        return float(valores[i, ABRIR] + (valores[i, CLOSE] - valores[i, ABRIR]) * fraccion)
+
+    def _rango(self, symbol, desde, hasta):
+        """Máximo y mínimo que alcanzó el precio entre dos instantes (mechas incluidas)"""
+        timestamps, valores = self._velas[symbol]
+        precios = [self._precio(symbol, desde), self._precio(symbol, hasta)]
+        alto, bajo = max(precios), min(precios)
+        i_desde = max(int(np.searchsorted(timestamps, desde, side='right')) - 1, 0)
+        i_hasta = int(np.searchsorted(timestamps, hasta, side='right')) - 1
+        if i_hasta > i_desde:
+            bloque = valores[i_desde:i_hasta]
+            alto = max(alto, float(bloque[:, HIGH].max()), float(valores[i_hasta, ABRIR]))
+            bloque_bajo = min(float(bloque[:, LOW].min()), float(valores[i_hasta, ABRIR]))
+            bajo = min(bajo, bloque_bajo)
+        return alto, bajo
+
+    def _instrumento(self, symbol, precio):
+        paso = _paso_decimal(5.0 / precio)
+        return {
+            'symbol': symbol, 'contractType': 'LinearPerpetual', 'status': 'Trading',
+            'baseCoin': symbol[:-4], 'quoteCoin': 'USDT', 'settleCoin': 'USDT',
+            'priceFilter': {'tickSize': _texto(_paso_decimal(precio) / 10000)},
+            'lotSizeFilter': {'minOrderQty': _texto(paso), 'qtyStep': _texto(paso),
+                              'maxOrderQty': _texto(paso * 10 ** 7), 'minNotionalValue': '5'},
+        }
+
+    # ---------- Infraestructura de llamadas ----------
+
+    def _llamada(self, grupo):
+        """Cuenta la llamada, respeta el límite de peticiones del grupo y aplica la latencia"""
+        self.llamadas[grupo] += 1
+        limite = self.limites.get(grupo)
+        if limite:
+            with self._lock_limites:
+                ahora = time.monotonic()
+                fichas, ultimo = self._fichas.get(grupo, (float(limite), ahora))
+                fichas = min(float(limite), fichas + (ahora - ultimo) * limite) - 1
+                self._fichas[grupo] = (fichas, ahora)
+            if fichas < 0:
+                self.esperas_limite += 1
+                time.sleep(-fichas / limite)
+        if self.latencia:
+            time.sleep(random.uniform(*self.latencia) if isinstance(self.latencia, tuple) else self.latencia)
+
+    def _respuesta(self, resultado):
+        return {'retCode': 0, 'retMsg': 'OK', 'result': resultado, 'retExtInfo': {}, 'time': self.ahora_ms()}
+
+    def _rechazar(self, codigo, mensaje, peticion):
+        raise InvalidRequestError(request=peticion, message=mensaje, status_code=codigo,
+                                  time=time.strftime("%H:%M:%S"), resp_headers={})
+
+    def _validar_symbol(self, symbol, peticion):
+        if symbol not in self._velas:
+            self._rechazar(10001, "params error: symbol invalid", peticion)
+
+    # ---------- Mercado ----------
+
+    def get_kline(self, category="linear", symbol=None, interval='5', limit=200, start=None, end=None, **kwargs):
+        self._llamada('consulta')
+        self._validar_symbol(symbol, 'get_kline')
+        duracion = intervalo_a_ms(interval)
+        timestamps, valores = self._velas[symbol]
+        if duracion is None or duracion < self._duracion[symbol]:
+            self._rechazar(10001, f"params error: interval {interval} not supported", 'get_kline')
+
+        ahora = self.ahora_ms()
+        limit = min(int(limit), 1000)
+        fin = min(int(end), ahora) if end else ahora
+        desde = fin // duracion * duracion - (limit - 1) * duracion
+        if start:
+            desde = max(desde, int(start) // duracion * duracion)
+
+        # Velas base del tramo pedido; la última, si está en curso, se recorta al precio actual
+        a = int(np.searchsorted(timestamps, desde, side='left'))
+        b = int(np.searchsorted(timestamps, fin, side='right'))
+        if b <= a:
+            return self._respuesta({'category': 'linear', 'symbol': symbol, 'list': []})
+        ts_base, base = timestamps[a:b], valores[a:b].copy()
+        if ahora < ts_base[-1] + self._duracion[symbol]:
+            precio = self._precio(symbol, ahora)
+            fraccion = (ahora - ts_base[-1]) / self._duracion[symbol]
+            base[-1, HIGH] = max(base[-1, ABRIR], precio)
+            base[-1, LOW] = min(base[-1, ABRIR], precio)
+            base[-1, CLOSE] = precio
+            base[-1, VOLUME:] *= fraccion
+
+        # Agregar las velas base al intervalo pedido
+        grupos = ts_base // duracion * duracion
+        inicios = np.concatenate(([0], np.flatnonzero(np.diff(grupos)) + 1))
+        finales = np.append(inicios[1:], len(base)) - 1
+        velas = np.column_stack([
+            grupos[inicios],
+            base[inicios, ABRIR],
+            np.maximum.reduceat(base[:, HIGH], inicios),
+            np.minimum.reduceat(base[:, LOW], inicios),
+            base[finales, CLOSE],
+            np.add.reduceat(base[:, VOLUME], inicios),
+            np.add.reduceat(base[:, TURNOVER], inicios),
+        ])
+        lista = [[str(int(fila[0]))] + [_texto(valor) for valor in fila[1:]] for fila in velas[::-1][:limit]]
+        return self._respuesta({'category': 'linear', 'symbol': symbol, 'list': lista})
+
+    def _ticker(self, symbol, ahora):
+        precio = self._precio(symbol, ahora)
+        hace_24h = self._precio(symbol, ahora - 24 * HORA_MS)
+        timestamps, valores = self._velas[symbol]
+        a = int(np.searchsorted(timestamps, ahora - 24 * HORA_MS, side='left'))
+        b = int(np.searchsorted(timestamps, ahora, side='right'))
+        return {
+            'symbol': symbol, 'lastPrice': _texto(precio), 'markPrice': _texto(precio),
+            'indexPrice': _texto(precio), 'price24hPcnt': _texto(round(precio / hace_24h - 1, 6)),
+            'turnover24h': _texto(round(float(valores[a:b, TURNOVER].sum()), 4)),
+            'volume24h': _texto(round(float(valores[a:b, VOLUME].sum()), 4)),
+            'fundingRate': _texto(self.funding_rate),
+            'nextFundingTime': str((ahora // FUNDING_MS + 1) * FUNDING_MS),
+        }
+
+    def get_tickers(self, category="linear", symbol=None, **kwargs):
+        self._llamada('consulta')
+        ahora = self.ahora_ms()
+        if symbol is not None:
+            self._validar_symbol(symbol, 'get_tickers')
+            lista = [self._ticker(symbol, ahora)]
+        else:
+            lista = [self._ticker(simbolo, ahora) for simbolo in self._velas]
+        return self._respuesta({'category': 'linear', 'list': lista})
+
+    def get_instruments_info(self, category="linear", symbol=None, limit=500, cursor=None, **kwargs):
+        self._llamada('consulta')
+        simbolos = [symbol] if symbol else sorted(self.instrumentos)
+        inicio = int(cursor or 0)
+        pagina = simbolos[inicio:inicio + int(limit)]
+        siguiente = str(inicio + int(limit)) if inicio + int(limit) < len(simbolos) else ''
+        return self._respuesta({'category': 'linear', 'list': [dict(self.instrumentos[s]) for s in pagina],
+                                'nextPageCursor': siguiente})
+
+    # ---------- Motor de ejecución ----------
+
+    def _procesar(self):
+        """Recorre el precio desde la última llamada: ejecuta límites y dispara TP/SL"""
+        ahora = self.ahora_ms()
+        activos = {orden['symbol'] for orden in self.abiertas.values()}
+        activos.update(clave[0] for clave, posicion in self.posiciones.items()
+                       if posicion['size'] > 0 and (posicion['takeProfit'] or posicion['stopLoss']))
+
+        for symbol in activos:
+            desde = self._procesado.get(symbol, ahora)
+            self._procesado[symbol] = ahora
+            if ahora <= desde:
+                continue
+            alto, bajo = self._rango(symbol, desde, ahora)
+
+            for orden in [o for o in self.abiertas.values() if o['symbol'] == symbol]:
+                precio = float(orden['price'])
+                if (orden['side'] == 'Buy' and bajo <= precio) or (orden['side'] == 'Sell' and alto >= precio):
+                    del self.abiertas[orden['orderId']]
+                    self._ejecutar(orden, precio, maker=True)
+
+            for (simbolo, idx), posicion in list(self.posiciones.items()):
+                if simbolo != symbol or posicion['size'] <= 0:
+                    continue
+                largo = posicion['side'] == 'Buy'
+                sl, tp = posicion['stopLoss'], posicion['takeProfit']
+                # Con ambos alcanzados en el mismo tramo se asume primero el SL (lo conservador)
+                if sl and ((largo and bajo <= sl) or (not largo and alto >= sl)):
+                    self._disparar(symbol, idx, posicion, sl, 'StopLoss')
+                elif tp and ((largo and alto >= tp) or (not largo and bajo <= tp)):
+                    self._disparar(symbol, idx, posicion, tp, 'TakeProfit')
+
+    def _disparar(self, symbol, idx, posicion, precio, tipo):
+        orden = self._nueva_orden(symbol, 'Sell' if posicion['side'] == 'Buy' else 'Buy', 'Market',
+                                  posicion['size'], idx, reduce_only=True)
+        orden['stopOrderType'] = tipo
+        self._ejecutar(orden, precio, maker=False)
+
+    def _nueva_orden(self, symbol, side, tipo, qty, idx, precio=None, reduce_only=False, order_link_id=None):
+        ahora = str(self.ahora_ms())
+        orden = {
+            'orderId': str(uuid.uuid4()), 'orderLinkId': order_link_id or '', 'symbol': symbol,
+            'side': side, 'orderType': tipo, 'price': _texto(precio) if precio else '0', 'qty': _texto(qty),
+            'positionIdx': idx, 'reduceOnly': reduce_only, 'orderStatus': 'New', 'stopOrderType': '',
+            'avgPrice': '', 'cumExecQty': '0', 'cumExecValue': '0', 'cumExecFee': '0', 'leavesQty': _texto(qty),
+            'createdTime': ahora, 'updatedTime': ahora, 'category': 'linear',
+        }
+        self.ordenes[orden['orderId']] = orden
+        return orden
+
+    def _posicion(self, symbol, idx):
+        clave = (symbol, idx)
+        if clave not in self.posiciones:
+            self.posiciones[clave] = {'size': 0.0, 'avgPrice': 0.0, 'side': '', 'takeProfit': 0.0,
+                                      'stopLoss': 0.0, 'createdTime': self.ahora_ms(), 'updatedTime': self.ahora_ms()}
+        return self.posiciones[clave]
+
+    def _margen_usado(self):
+        return sum(p['size'] * p['avgPrice'] / self._apalancamiento.get(s, self.apalancamiento_defecto)
+                   for (s, _), p in self.posiciones.items() if p['size'] > 0)
+
+    def _pnl_no_realizado(self, ahora):
+        return sum((self._precio(s, ahora) - p['avgPrice']) * p['size'] * (1 if p['side'] == 'Buy' else -1)
+                   for (s, _), p in self.posiciones.items() if p['size'] > 0)
+
+    def _ejecutar(self, orden, precio, maker):
+        """Aplica una ejecución completa de la orden sobre la posición y el saldo"""
+        symbol, idx, side = orden['symbol'], orden['positionIdx'], orden['side']
+        qty = float(orden['qty'])
+        posicion = self._posicion(symbol, idx)
+        if self.modo_posicion == 3:
+            abre = (idx == 1) == (side == 'Buy')
+        else:
+            abre = posicion['size'] == 0 or posicion['side'] == side
+
+        if not abre:
+            qty = min(qty, posicion['size'])  # One-Way: no se da la vuelta a la posición
+        comision = qty * precio * (self.comision_maker if maker else self.comision_taker)
+
+        if abre:
+            nuevo = posicion['size'] + qty
+            posicion['avgPrice'] = (posicion['avgPrice'] * posicion['size'] + precio * qty) / nuevo
+            posicion['size'] = nuevo
+            posicion['side'] = side
+        else:
+            direccion = 1 if posicion['side'] == 'Buy' else -1
+            self.saldo += (precio - posicion['avgPrice']) * qty * direccion
+            posicion['size'] = round(posicion['size'] - qty, 12)
+            if posicion['size'] <= 0:
+                posicion.update({'size': 0.0, 'avgPrice': 0.0, 'side': '', 'takeProfit': 0.0, 'stopLoss': 0.0})
+        self.saldo -= comision
+        posicion['updatedTime'] = self.ahora_ms()
+
+        orden.update({
+            'orderStatus': 'Filled', 'avgPrice': _texto(precio), 'cumExecQty': _texto(qty),
+            'cumExecValue': _texto(qty * precio), 'cumExecFee': _texto(comision), 'leavesQty': '0',
+            'updatedTime': str(self.ahora_ms()),
+        })
+
+    # ---------- Cuenta y órdenes ----------
+
+    def get_wallet_balance(self, accountType="UNIFIED", coin=None, **kwargs):
+        self._llamada('consulta')
+        with self._lock:
+            self._procesar()
+            ahora = self.ahora_ms()
+            pnl = self._pnl_no_realizado(ahora)
+            disponible = self.saldo - self._margen_usado()
+            moneda = {
+                'coin': 'USDT', 'walletBalance': _texto(round(self.saldo, 8)),
+                'equity': _texto(round(self.saldo + pnl, 8)), 'unrealisedPnl': _texto(round(pnl, 8)),
+                'availableToWithdraw': _texto(round(max(disponible, 0), 8)),
+            }
+            return self._respuesta({'list': [{
+                'accountType': accountType, 'totalEquity': moneda['equity'],
+                'totalWalletBalance': moneda['walletBalance'],
+                'totalAvailableBalance': _texto(round(max(disponible + min(pnl, 0), 0), 8)),
+                'coin': [moneda],
+            }]})
+
+    def _posicion_pybit(self, symbol, idx, posicion, ahora):
+        precio = self._precio(symbol, ahora)
+        direccion = 1 if posicion['side'] == 'Buy' else -1
+        return {
+            'symbol': symbol, 'positionIdx': idx, 'side': posicion['side'], 'size': _texto(posicion['size']),
+            'avgPrice': _texto(posicion['avgPrice']), 'markPrice': _texto(precio),
+            'positionValue': _texto(posicion['size'] * posicion['avgPrice']),
+            'unrealisedPnl': _texto((precio - posicion['avgPrice']) * posicion['size'] * direccion),
+            'leverage': str(self._apalancamiento.get(symbol, self.apalancamiento_defecto)),
+            'takeProfit': _texto(posicion['takeProfit']), 'stopLoss': _texto(posicion['stopLoss']),
+            'createdTime': str(posicion['createdTime']), 'updatedTime': str(posicion['updatedTime']),
+        }
+
+    def get_positions(self, category="linear", symbol=None, settleCoin=None, **kwargs):
+        self._llamada('consulta')
+        if symbol is None and settleCoin is None:
+            self._rechazar(10001, "params error: symbol or settleCoin is required", 'get_positions')
+        with self._lock:
+            self._procesar()
+            ahora = self.ahora_ms()
+            if symbol is not None:
+                # Por símbolo Bybit devuelve también los lados sin posición
+                self._validar_symbol(symbol, 'get_positions')
+                indices = (1, 2) if self.modo_posicion == 3 else (0,)
+                lista = [self._posicion_pybit(symbol, idx, self._posicion(symbol, idx), ahora) for idx in indices]
+            else:
+                lista = [self._posicion_pybit(s, idx, p, ahora)
+                         for (s, idx), p in sorted(self.posiciones.items()) if p['size'] > 0]
+            return self._respuesta({'category': 'linear', 'list': lista, 'nextPageCursor': ''})
+
+    def get_open_orders(self, category="linear", symbol=None, settleCoin=None, **kwargs):
+        self._llamada('consulta')
+        with self._lock:
+            self._procesar()
+            lista = [dict(o) for o in self.abiertas.values() if symbol is None or o['symbol'] == symbol]
+            return self._respuesta({'category': 'linear', 'list': lista, 'nextPageCursor': ''})
+
+    def get_order_history(self, category="linear", symbol=None, orderId=None, orderLinkId=None, limit=20, **kwargs):
+        self._llamada('consulta')
+        with self._lock:
+            self._procesar()
+            lista = [dict(o) for o in reversed(list(self.ordenes.values()))
+                     if (symbol is None or o['symbol'] == symbol)
+                     and (orderId is None or o['orderId'] == orderId)
+                     and (orderLinkId is None or o['orderLinkId'] == orderLinkId)]
+            return self._respuesta({'category': 'linear', 'list': lista[:int(limit)], 'nextPageCursor': ''})
+
+    def place_order(self, category="linear", symbol=None, side=None, orderType="Market", qty=None, price=None,
+                    timeInForce="GTC", positionIdx=0, reduceOnly=False, orderLinkId=None, **kwargs):
+        self._llamada('orden')
+        self._validar_symbol(symbol, 'place_order')
+        if side not in ('Buy', 'Sell') or orderType not in ('Market', 'Limit'):
+            self._rechazar(10001, "params error: side or orderType invalid", 'place_order')
+
+        with self._lock:
+            self._procesar()
+            ahora = self.ahora_ms()
+            idx = int(positionIdx or 0)
+            if (self.modo_posicion == 3) != (idx in (1, 2)):
+                self._rechazar(10001, "position idx not match position mode", 'place_order')
+
+            filtro = self.instrumentos[symbol]['lotSizeFilter']
+            paso = float(filtro['qtyStep'])
+            cantidad = float(qty)
+            if abs(round(cantidad / paso) * paso - cantidad) > paso * 1e-6:
+                self._rechazar(10001, "Qty invalid: too many decimals", 'place_order')
+            if cantidad < float(filtro['minOrderQty']) or cantidad > float(filtro['maxOrderQty']):
+                self._rechazar(10001, "The number of contracts exceeds minimum limit allowed", 'place_order')
+
+            mercado = self._precio(symbol, ahora)
+            posicion = self._posicion(symbol, idx)
+            abre = ((idx == 1) == (side == 'Buy')) if self.modo_posicion == 3 else (
+                posicion['size'] == 0 or posicion['side'] == side)
+            if not abre and posicion['size'] <= 0:
+                self._rechazar(110017, "current position is zero, cannot fix reduce-only order qty", 'place_order')
+            if abre and reduceOnly:
+                self._rechazar(110017, "reduce-only order has same side with current position", 'place_order')
+            if abre:
+                if cantidad * mercado < float(filtro['minNotionalValue']):
+                    self._rechazar(110094, "Order does not meet minimum order value 5USDT", 'place_order')
+                margen = cantidad * mercado / self._apalancamiento.get(symbol, self.apalancamiento_defecto)
+                disponible = self.saldo - self._margen_usado() + min(self._pnl_no_realizado(ahora), 0)
+                if margen + cantidad * mercado * self.comision_taker > disponible:
+                    self._rechazar(110007, "ab not enough for new order", 'place_order')
+
+            limite = float(price) if orderType == 'Limit' and price else None
+            orden = self._nueva_orden(symbol, side, orderType, cantidad, idx, limite, bool(reduceOnly), orderLinkId)
+            cruza = limite is None or (side == 'Buy' and limite >= mercado) or (side == 'Sell' and limite <= mercado)
+            if cruza:
+                ajuste = self.deslizamiento if side == 'Buy' else -self.deslizamiento
+                self._ejecutar(orden, mercado * (1 + ajuste) if limite is None else mercado, maker=False)
+            else:
+                self.abiertas[orden['orderId']] = orden
+                self._procesado[symbol] = ahora  # _procesar ya recorrió hasta ahora
+            return self._respuesta({'orderId': orden['orderId'], 'orderLinkId': orden['orderLinkId']})
+
+    def cancel_order(self, category="linear", symbol=None, orderId=None, orderLinkId=None, **kwargs):
+        self._llamada('orden')
+        with self._lock:
+            self._procesar()
+            for orden in list(self.abiertas.values()):
+                if orden['orderId'] == orderId or (orderLinkId and orden['orderLinkId'] == orderLinkId):
+                    del self.abiertas[orden['orderId']]
+                    orden.update({'orderStatus': 'Cancelled', 'updatedTime': str(self.ahora_ms())})
+                    return self._respuesta({'orderId': orden['orderId'], 'orderLinkId': orden['orderLinkId']})
+            self._rechazar(110001, "order not exists or too late to cancel", 'cancel_order')
+
+    def set_trading_stop(self, category="linear", symbol=None, takeProfit=None, stopLoss=None, positionIdx=0,
+                         **kwargs):
+        self._llamada('orden')
+        self._validar_symbol(symbol, 'set_trading_stop')
+        with self._lock:
+            self._procesar()
+            ahora = self.ahora_ms()
+            posicion = self.posiciones.get((symbol, int(positionIdx or 0)))
+            if posicion is None or posicion['size'] <= 0:
+                self._rechazar(10001, "can not set tp/sl/ts for zero position", 'set_trading_stop')
+
+            precio = self._precio(symbol, ahora)
+            largo = posicion['side'] == 'Buy'
+            tp = float(takeProfit) if takeProfit not in (None, '') else None
+            sl = float(stopLoss) if stopLoss not in (None, '') else None
+            if tp and (tp <= precio if largo else tp >= precio):
+                self._rechazar(10001, f"TakeProfit:{takeProfit} set for {posicion['side']} position should be "
+                                      f"{'higher' if largo else 'lower'} than base_price", 'set_trading_stop')
+            if sl and (sl >= precio if largo else sl <= precio):
+                self._rechazar(10001, f"StopLoss:{stopLoss} set for {posicion['side']} position should be "
+                                      f"{'lower' if largo else 'higher'} than base_price", 'set_trading_stop')
+            if tp is not None:
+                posicion['takeProfit'] = tp
+            if sl is not None:
+                posicion['stopLoss'] = sl
+            self._procesado[symbol] = ahora  # _procesar ya recorrió hasta ahora
+            return self._respuesta({})
+
+    def set_leverage(self, category="linear", symbol=None, buyLeverage=None, sellLeverage=None, **kwargs):
+        self._llamada('orden')
+        self._validar_symbol(symbol, 'set_leverage')
+        apalancamiento = float(buyLeverage)
+        if self._apalancamiento.get(symbol, self.apalancamiento_defecto) == apalancamiento:
+            self._rechazar(110043, "leverage not modified", 'set_leverage')
+        self._apalancamiento[symbol] = apalancamiento
+        return self._respuesta({})
+
+    def switch_position_mode(self, category="linear", symbol=None, coin=None, mode=0, **kwargs):
+        self._llamada('orden')
+        if int(mode) not in (0, 3):
+            self._rechazar(10001, "params error: mode invalid", 'switch_position_mode')
+        with self._lock:
+            if any(p['size'] > 0 for p in self.posiciones.values()):
+                self._rechazar(110025, "Position mode is not modified", 'switch_position_mode')
+            self.modo_posicion = int(mode)
+            return self._respuesta({})
+
+    def resumen(self):
+        """Contadores de llamadas y estado de la cuenta simulada"""
+        with self._lock:
+            return {'llamadas': dict(self.llamadas), 'esperas_limite': self.esperas_limite,
+                    'saldo': self.saldo, 'ordenes': len(self.ordenes),
+                    'posiciones': sum(1 for p in self.posiciones.values() if p['size'] > 0)}
+
+def crear_exchange_simulado():
+    """
+    Exchange simulado configurado con variables de entorno:
+    SIMULADOR_SYMBOLS ("BTCUSDT:60000,ETHUSDT:3000" símbolo:precio inicial),
+    SIMULADOR_ARCHIVO (directorio de ArchivoVelas con velas de 1m a reproducir),
+    SIMULADOR_VELOCIDAD, SIMULADOR_LATENCIA (s), SIMULADOR_LIMITE_CONSULTAS,
+    SIMULADOR_LIMITE_ORDENES (peticiones/s), SIMULADOR_SALDO y SIMULADOR_SEMILLA.
+    """
+    precios = {}
+    for par in os.getenv("SIMULADOR_SYMBOLS", "BTCUSDT:60000,ETHUSDT:3000,SOLUSDT:150").split(','):
+        symbol, _, precio = par.strip().partition(':')
+        precios[symbol] = float(precio or 1.0)
+
+    semilla = os.getenv("SIMULADOR_SEMILLA")
+    opciones = {
+        'velocidad': float(os.getenv("SIMULADOR_VELOCIDAD", "1")),
+        'latencia': float(os.getenv("SIMULADOR_LATENCIA", "0")),
+        'limites': {'consulta': float(os.getenv("SIMULADOR_LIMITE_CONSULTAS", "120")),
+                    'orden': float(os.getenv("SIMULADOR_LIMITE_ORDENES", "10"))},
+        'saldo_inicial': float(os.getenv("SIMULADOR_SALDO", "1000")),
+    }
+    directorio = os.getenv("SIMULADOR_ARCHIVO")
+    if directorio:
+        return ExchangeSimulado.desde_archivo(ArchivoVelas(directorio), precios, **opciones)
+    return ExchangeSimulado.sintetico(precios, semilla=int(semilla) if semilla else None, **opciones)
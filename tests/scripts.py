@@ -0,0 +1,28 @@
+"""
+Funciones de los scripts del bot cargadas sin ejecutarlos: importar un script
+conecta con Bybit y arranca Chrome, así que se compilan solo las funciones
+pedidas a partir del código fuente del script.
+"""
+import ast
+import os
+import types
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ['bot_serv.py', 'bot_servidor.py', 'crypto_test.py', 'estadisticas.py']
+
+def cargar_funciones(script, nombres, **globales):
+    """
+    Namespace con las funciones `nombres` del script, definidas sobre `globales`
+    (los módulos y objetos del script que usen). El diccionario de globales queda
+    en `.globales` para sustituir dependencias desde las pruebas.
+    """
+    with open(os.path.join(RAIZ, script), encoding='utf-8') as archivo:
+        arbol = ast.parse(archivo.read(), filename=script)
+    definiciones = [nodo for nodo in arbol.body if isinstance(nodo, ast.FunctionDef) and nodo.name in nombres]
+    faltan = set(nombres) - {nodo.name for nodo in definiciones}
+    if faltan:
+        raise LookupError(f"{script} no define {sorted(faltan)}")
+
+    espacio = dict(globales)
+    exec(compile(ast.Module(body=definiciones, type_ignores=[]), os.path.join(RAIZ, script), 'exec'), espacio)
+    return types.SimpleNamespace(globales=espacio, **{nombre: espacio[nombre] for nombre in nombres})
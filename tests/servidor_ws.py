@@ -0,0 +1,173 @@
+"""
+Servidor WebSocket mínimo que imita el canal público lineal de Bybit, para probar
+StreamTickers sin red.
+"""
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+
+_GUID_WEBSOCKET = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def _leer_exacto(conexion, n):
+    datos = b''
+    while len(datos) < n:
+        bloque = conexion.recv(n - len(datos))
+        if not bloque:
+            raise ConnectionError("Conexión cerrada")
+        datos += bloque
+    return datos
+
+def _leer_frame(conexion):
+    """Lee un frame WebSocket (los del cliente vienen enmascarados). Devuelve (opcode, datos)"""
+    b1, b2 = _leer_exacto(conexion, 2)
+    opcode = b1 & 0x0F
+    longitud = b2 & 0x7F
+    if longitud == 126:
+        longitud = struct.unpack('>H', _leer_exacto(conexion, 2))[0]
+    elif longitud == 127:
+        longitud = struct.unpack('>Q', _leer_exacto(conexion, 8))[0]
+    mascara = _leer_exacto(conexion, 4) if b2 & 0x80 else None
+    datos = bytearray(_leer_exacto(conexion, longitud))
+    if mascara:
+        for i in range(len(datos)):
+            datos[i] ^= mascara[i % 4]
+    return opcode, bytes(datos)
+
+def _enviar_frame(conexion, opcode, datos):
+    n = len(datos)
+    if n < 126:
+        cabecera = bytes([0x80 | opcode, n])
+    elif n < 65536:
+        cabecera = bytes([0x80 | opcode, 126]) + struct.pack('>H', n)
+    else:
+        cabecera = bytes([0x80 | opcode, 127]) + struct.pack('>Q', n)
+    conexion.sendall(cabecera + datos)
+
+class ServidorTickersLocal:
+    """
+    Servidor WebSocket mínimo que imita el canal público lineal de Bybit:
+    suscripción a tickers.{symbol}, ping/pong y snapshots periódicos de los
+    precios publicados con `publicar`. Sirve para probar StreamTickers sin red.
+    `latencia` retrasa las respuestas como lo haría la red (pybit registra la
+    suscripción después de enviarla y falla si la confirmación llega antes).
+    """
+
+    def __init__(self, host='127.0.0.1', puerto=0, intervalo=0.1, latencia=0.05):
+        self.intervalo = intervalo
+        self.latencia = latencia
+        self._servidor = socket.create_server((host, puerto))
+        self._servidor.settimeout(0.2)
+        self.url = f"ws://{host}:{self._servidor.getsockname()[1]}/v5/public/linear"
+        self.precios = {}
+        self._clientes = []
+        self._lock = threading.Lock()
+        self._activo = False
+
+    def publicar(self, symbol, last_price, mark_price=None):
+        with self._lock:
+            self.precios[symbol] = {
+                'symbol': symbol,
+                'lastPrice': str(last_price),
+                'markPrice': str(mark_price if mark_price is not None else last_price)
+            }
+
+    def retirar(self, symbol):
+        """Deja de emitir el símbolo (sus datos en el cliente quedarán viejos)"""
+        with self._lock:
+            self.precios.pop(symbol, None)
+
+    def iniciar(self):
+        self._activo = True
+        threading.Thread(target=self._aceptar, daemon=True).start()
+        threading.Thread(target=self._emitir, daemon=True).start()
+        return self
+
+    def detener(self):
+        self._activo = False
+        with self._lock:
+            clientes, self._clientes = self._clientes, []
+        for cliente in clientes:
+            try:
+                cliente['conexion'].close()
+            except OSError:
+                pass
+        self._servidor.close()
+
+    def _aceptar(self):
+        while self._activo:
+            try:
+                conexion, _ = self._servidor.accept()
+            except (socket.timeout, OSError):
+                continue
+            threading.Thread(target=self._atender, args=(conexion,), daemon=True).start()
+
+    def _enviar(self, cliente, mensaje):
+        with cliente['lock']:
+            _enviar_frame(cliente['conexion'], 0x1, json.dumps(mensaje).encode())
+
+    def _atender(self, conexion):
+        try:
+            peticion = b''
+            while b'\r\n\r\n' not in peticion:
+                peticion += _leer_exacto(conexion, 1)
+            cabeceras = dict(
+                linea.split(': ', 1) for linea in peticion.decode().split('\r\n')[1:] if ': ' in linea
+            )
+            clave = cabeceras.get('Sec-WebSocket-Key', '')
+            aceptacion = base64.b64encode(hashlib.sha1((clave + _GUID_WEBSOCKET).encode()).digest()).decode()
+            conexion.sendall(
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {aceptacion}\r\n\r\n".encode()
+            )
+
+            cliente = {'conexion': conexion, 'topics': set(), 'lock': threading.Lock()}
+            with self._lock:
+                self._clientes.append(cliente)
+
+            while self._activo:
+                opcode, datos = _leer_frame(conexion)
+                if opcode == 0x8:  # Cierre
+                    break
+                if opcode == 0x9:  # Ping de control -> pong
+                    with cliente['lock']:
+                        _enviar_frame(conexion, 0xA, datos)
+                    continue
+                if opcode != 0x1:
+                    continue
+
+                mensaje = json.loads(datos)
+                time.sleep(self.latencia)
+                if mensaje.get('op') == 'subscribe':
+                    cliente['topics'].update(mensaje.get('args', []))
+                    self._enviar(cliente, {'success': True, 'ret_msg': '', 'conn_id': 'local',
+                                           'req_id': mensaje.get('req_id', ''), 'op': 'subscribe'})
+                elif mensaje.get('op') == 'ping':
+                    self._enviar(cliente, {'success': True, 'ret_msg': 'pong', 'conn_id': 'local',
+                                           'req_id': mensaje.get('req_id', ''), 'op': 'ping'})
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self._clientes = [c for c in self._clientes if c['conexion'] is not conexion]
+            conexion.close()
+
+    def _emitir(self):
+        while self._activo:
+            with self._lock:
+                clientes = list(self._clientes)
+                precios = dict(self.precios)
+            for cliente in clientes:
+                for topic in list(cliente['topics']):
+                    ticker = precios.get(topic.split('.', 1)[-1])
+                    if ticker is None:
+                        continue
+                    try:
+                        self._enviar(cliente, {'topic': topic, 'type': 'snapshot', 'data': ticker,
+                                               'cs': 0, 'ts': int(time.time() * 1000)})
+                    except OSError:
+                        pass
+            time.sleep(self.intervalo)
@@ -0,0 +1,307 @@
+import glob
+import os
+import re
+import time
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+from coinalyze import (COLUMNAS_CON_SUFIJO, COLUMNAS_NUMERICAS, ClienteCoinalyzeHTTP, MetricasConversion,
+                       NavegadorCoinalyze, convertir_tabla_coinalyze, extraer_tabla_html, memoria_procesos_mb,
+                       parsear_columna, tabla_a_dataframe)
+from scripts import SCRIPTS, cargar_funciones
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGINA_REFERENCIA = os.path.join(FIXTURES, 'coinalyze_pagina.html')
+CSV_GUARDADO = os.path.join(os.path.dirname(FIXTURES), os.pardir, 'coinalyze_data.csv')
+PAGINAS = sorted(glob.glob(os.path.join(FIXTURES, 'coinalyze_*.html')))
+URL = 'https://coinalyze.net/?order_by=oi_24h_pchange&order_dir=desc'
+COLUMNAS = ['COIN', 'PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H',
+            'OI SHARE', 'OI / VOL24H', 'FR AVG', 'PFR AVG', 'LIQS. 24H']
+
+def leer(ruta):
+    with open(ruta, encoding='utf-8') as archivo:
+        return archivo.read()
+
+class RespuestaPrueba:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+
+class SesionHTTPPrueba:
+    """Sustituto de requests.Session que sirve respuestas guardadas en orden"""
+
+    def __init__(self, respuestas):
+        self.respuestas = list(respuestas)
+        self.peticiones = 0
+
+    def get(self, url, timeout=None):
+        self.peticiones += 1
+        respuesta = self.respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+# ========== EXTRACCIÓN DE LA TABLA ==========
+
+def test_extraccion_reproduce_el_csv_guardado():
+    headers, filas = extraer_tabla_html(leer(PAGINA_REFERENCIA))
+    guardado = pd.read_csv(CSV_GUARDADO, dtype=str, keep_default_na=False)
+    esperadas = [fila[1:len(COLUMNAS) + 1] for fila in guardado.values.tolist()]
+
+    assert headers == COLUMNAS and len(filas) == 41
+    assert all(fila[0] == '' for fila in filas)  # Celda del icono de favorito
+    assert [fila[1:] for fila in filas[:40]] == esperadas[:40]
+
+def test_extraccion_texto_de_celdas():
+    headers, filas = extraer_tabla_html(
+        '<table><thead><tr><th></th><th><span>COIN</span></th><th>OI /\n VOL24H</th></tr></thead><tbody>'
+        '<tr><td><svg></svg></td><td><div>Bitcoin &amp; Co</div>\n<span>BTC</span></td><td> 0.5 </td></tr>'
+        '<tr class="anuncio"><th>sin td</th></tr></tbody></table>')
+    assert headers == ['COIN', 'OI / VOL24H'] and filas == [['', 'Bitcoin & Co BTC', '0.5']]
+
+def test_extraccion_sin_thead_y_sin_tabla():
+    headers, filas = extraer_tabla_html('<table><tr><th>COIN</th><th>PRICE</th></tr>'
+                                        '<tr><td>Bitcoin BTC</td><td>$1</td></tr></table>')
+    assert headers == ['COIN', 'PRICE'] and filas == [['Bitcoin BTC', '$1']]
+    assert extraer_tabla_html('<div>sin tabla</div>') == ([], [])
+
+def test_tabla_a_dataframe_recorta_y_rellena():
+    df = tabla_a_dataframe(['COIN', 'PRICE'], [['', 'Bitcoin BTC', '$1', 'sobra'], ['Ether ETH'], ['', ''], []])
+    assert df.values.tolist() == [['Bitcoin BTC', '$1'], ['Ether ETH', '']]
+
+# ========== DESCARGA POR HTTP ==========
+
+@pytest.mark.parametrize('ruta', PAGINAS, ids=os.path.basename)
+def test_cliente_http_con_pagina_guardada(ruta):
+    cliente = ClienteCoinalyzeHTTP(session=SesionHTTPPrueba([RespuestaPrueba(200, leer(ruta))]))
+    df = cliente.obtener_tabla(URL)
+    if df is None:
+        pytest.skip("La página no trae la tabla en el HTML del servidor: se usará Selenium")
+
+    assert set(COLUMNAS) <= set(df.columns) and len(df) >= cliente.min_filas
+    assert all(re.fullmatch(r'.+ \S+', moneda) for moneda in df['COIN'])  # 'Nombre SÍMBOLO', sin la celda del favorito
+    assert df['PRICE'].str.startswith('$').all()
+    numerica = convertir_tabla_coinalyze(df, MetricasConversion())
+    assert np.isfinite(numerica['PRICE']).all()
+
+def test_cliente_http_pagina_de_referencia():
+    cliente = ClienteCoinalyzeHTTP(session=SesionHTTPPrueba([RespuestaPrueba(200, leer(PAGINA_REFERENCIA))]))
+    df = cliente.obtener_tabla(URL)
+
+    assert list(df.columns) == COLUMNAS and len(df) == 41
+    assert df.iloc[0].tolist() == ['Enso ENSO', '$1.91', '+13.28%', '$40.4m', '$620.9m', '$30.1m', '+190.73%',
+                                   '0.39%', '0.048', '-2.0110%', '-2.0798%', '$2.6m']
+    assert df.loc[2, 'COIN'] == 'FTX Token FTT' and df.loc[2, 'MKT CAP'] == 'n/a'
+    assert df.loc[10, 'COIN'] == 'rats (Ordinals) RATS'
+    btcdom = df[df['COIN'] == 'Binance BTCDOM Index BTCDOM'].iloc[0]
+    assert btcdom['PRICE'] == '$4,273.60' and btcdom['LIQS. 24H'] == '$273.0'
+    assert cliente.aciertos == 1 and cliente.fallos == 0
+
+@pytest.mark.parametrize('ruta', PAGINAS, ids=os.path.basename)
+def test_selenium_y_http_dan_la_misma_tabla(ruta):
+    """El outerHTML de la tabla (lo que lee Selenium) y la página completa dan el mismo DataFrame"""
+    pagina = leer(ruta)
+    tabla = BeautifulSoup(pagina, 'html.parser').find('table')
+    if tabla is None:
+        pytest.skip("La página no trae la tabla en el HTML del servidor")
+    por_http = tabla_a_dataframe(*extraer_tabla_html(pagina))
+    por_selenium = tabla_a_dataframe(*extraer_tabla_html(str(tabla)))
+    assert por_selenium.equals(por_http)
+
+class ElementoTablaPrueba:
+    def __init__(self, html):
+        self.html = html
+
+    def get_attribute(self, nombre):
+        return self.html
+
+def selenium_del_script(script, tabla_html):
+    """obtener_tabla_coinalyze del script sin HTTP, con un Chrome de prueba que tiene `tabla_html` cargada"""
+    class EsperaPrueba:
+        def __init__(self, driver, timeout):
+            pass
+
+        def until(self, condicion):
+            return ElementoTablaPrueba(tabla_html)
+
+    funciones = cargar_funciones(
+        script, ['obtener_tabla_coinalyze', 'extraer_simbolo_de_moneda'], pd=pd, time=time, By=By,
+        WebDriverWait=EsperaPrueba, EC=types.SimpleNamespace(presence_of_element_located=lambda selector: selector),
+        cliente_coinalyze=types.SimpleNamespace(obtener_tabla=lambda url: None),
+        navegador_coinalyze=types.SimpleNamespace(cargar=lambda url, configurar: object(), descartar=lambda: None),
+        configurar_chrome=None, configurar_chrome_cloud=None, extraer_tabla_html=extraer_tabla_html,
+        tabla_a_dataframe=tabla_a_dataframe)
+    return funciones.obtener_tabla_coinalyze(URL)
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_ruta_selenium_de_los_scripts_igual_que_http(script):
+    """Los cuatro scripts dan por Selenium la misma tabla que el cliente HTTP, también con filas vacías"""
+    tabla = BeautifulSoup(leer(PAGINA_REFERENCIA), 'html.parser').find('table')
+    tabla.find('tbody').append(BeautifulSoup('<tr><td></td><td></td><td> </td></tr>', 'html.parser').tr)
+    por_http = tabla_a_dataframe(*extraer_tabla_html(str(tabla)))
+    por_selenium = selenium_del_script(script, str(tabla))
+    assert len(por_selenium) == 41 and por_selenium.equals(por_http)
+
+def test_cliente_http_recurre_a_selenium_y_pausa_tras_fallo():
+    sesion = SesionHTTPPrueba([RespuestaPrueba(200, '<html><div id="root"></div></html>'),  # Tabla por JavaScript
+                               RespuestaPrueba(503),
+                               requests.ConnectionError("sin red"),
+                               RespuestaPrueba(200, leer(PAGINA_REFERENCIA))])
+    cliente = ClienteCoinalyzeHTTP(session=sesion, espera_tras_fallo=60)
+
+    assert cliente.obtener_tabla(URL) is None
+    assert cliente.obtener_tabla(URL) is None and sesion.peticiones == 1  # En pausa: directamente a Selenium
+    for _ in range(2):
+        cliente.pausado_hasta = 0
+        assert cliente.obtener_tabla(URL) is None
+    cliente.pausado_hasta = 0
+    assert len(cliente.obtener_tabla(URL)) == 41
+    assert sesion.peticiones == 4 and cliente.fallos == 3 and cliente.aciertos == 1
+
+def test_cliente_http_pocas_filas():
+    pagina = leer(PAGINA_REFERENCIA)
+    cliente = ClienteCoinalyzeHTTP(session=SesionHTTPPrueba([RespuestaPrueba(200, pagina)]), min_filas=50)
+    assert cliente.obtener_tabla(URL) is None and cliente.fallos == 1
+
+# ========== CONVERSIÓN NUMÉRICA ==========
+
+def convertir_celda_original(valor, porcentaje):
+    """limpiar_y_convertir_valor / limpiar_porcentaje de antes, con NaN en vez de 0 para lo que no es número"""
+    texto = str(valor).replace('$', '').replace(',', '').replace('%', '').replace('+', '').replace(' ', '').lower()
+    if texto in ('', 'n/a', 'error'):
+        return np.nan
+    if not porcentaje:
+        for sufijo, multiplicador in (('b', 1e9), ('m', 1e6), ('k', 1e3)):
+            if texto.endswith(sufijo):
+                return float(texto[:-1]) * multiplicador
+    return float(texto)
+
+def test_conversion_igual_a_la_conversion_por_celda():
+    df = pd.concat([tabla_a_dataframe(*extraer_tabla_html(leer(PAGINA_REFERENCIA)))] * 25, ignore_index=True)
+    numerica = convertir_tabla_coinalyze(df, MetricasConversion())
+
+    for columna in COLUMNAS_NUMERICAS:
+        assert numerica[columna].dtype == np.float64
+        esperado = [convertir_celda_original(valor, columna not in COLUMNAS_CON_SUFIJO) for valor in df[columna]]
+        assert np.allclose(numerica[columna], esperado, rtol=1e-12, atol=0, equal_nan=True), columna
+    assert numerica['COIN'].equals(df['COIN'])
+
+@pytest.mark.parametrize('texto, valor', [
+    ('1e5', 1e5), ('1e-5', 1e-5), ('1E+5', 1e5), ('-2.5e-3', -2.5e-3), ('.5', 0.5), ('$1,234.5', 1234.5),
+    ('+190.73%', 190.73), ('-2.0110%', -2.011),
+])
+def test_parsear_columna_numeros(texto, valor):
+    for sufijos in (True, False):
+        valores, sin_dato, no_parseable = parsear_columna(pd.Series([texto]), sufijos=sufijos)
+        assert valores[0] == pytest.approx(valor, rel=1e-12) and not sin_dato[0] and not no_parseable[0]
+
+@pytest.mark.parametrize('texto, valor', [('$40.4m', 40.4e6), ('$2.6M', 2.6e6), ('$520.8k', 520.8e3),
+                                          ('$1.2b', 1.2e9), ('$3t', 3e12)])
+def test_parsear_columna_sufijos(texto, valor):
+    assert parsear_columna(pd.Series([texto]))[0][0] == pytest.approx(valor, rel=1e-12)
+    valores, _, no_parseable = parsear_columna(pd.Series([texto]), sufijos=False)
+    assert np.isnan(valores[0]) and no_parseable[0]
+
+def test_porcentajes_no_aceptan_sufijos():
+    df = pd.DataFrame({'COIN': ['A A', 'B B', 'C C'], 'CHG 24H': ['+1.5%', '2m%', 'n/a'],
+                       'OPEN INTEREST': ['$1.5m', '-$2k', 'ERROR']})
+    metricas = MetricasConversion()
+    numerica = convertir_tabla_coinalyze(df, metricas)
+    assert numerica['CHG 24H'].iloc[0] == 1.5 and np.isnan(numerica['CHG 24H'].iloc[1:]).all()
+    assert numerica['OPEN INTEREST'].iloc[:2].tolist() == [1.5e6, -2e3] and np.isnan(numerica['OPEN INTEREST'].iloc[2])
+    assert metricas.no_parseables == {'CHG 24H': 1} and metricas.ejemplos == {'CHG 24H': '2m%'}
+    assert metricas.sin_dato == {'CHG 24H': 1, 'OPEN INTEREST': 1} and metricas.celdas == 6
+
+def test_conversion_de_tabla_ya_numerica_y_vacia():
+    df = tabla_a_dataframe(*extraer_tabla_html(leer(PAGINA_REFERENCIA)))
+    numerica = convertir_tabla_coinalyze(df, MetricasConversion())
+    assert convertir_tabla_coinalyze(numerica, MetricasConversion()).equals(numerica)
+    vacia = convertir_tabla_coinalyze(pd.DataFrame(columns=COLUMNAS), MetricasConversion())
+    assert len(vacia) == 0 and vacia['PRICE'].dtype == np.float64
+
+# ========== NAVEGADOR PERSISTENTE ==========
+
+class DriverPrueba:
+    """Sustituto de webdriver.Chrome: la tabla gana `por_consulta` filas en cada consulta hasta `total`"""
+
+    def __init__(self, total=100, por_consulta=40, fallar_en=None):
+        self.total = total
+        self.por_consulta = por_consulta
+        self.fallar_en = fallar_en
+        self.filas = 0
+        self.gets = 0
+        self.refrescos = 0
+        self.cerrado = False
+
+    def get(self, url):
+        self.gets += 1
+        self.filas = 0
+
+    def refresh(self):
+        self.refrescos += 1
+        if self.refrescos == self.fallar_en:
+            raise WebDriverException("chrome not reachable")
+        self.filas = 0
+
+    def find_elements(self, by, selector):
+        self.filas = min(self.filas + self.por_consulta, self.total)
+        return [None] * self.filas
+
+    def quit(self):
+        self.cerrado = True
+
+def test_navegador_reutiliza_chrome_y_reintenta_tras_fallo():
+    creados = []
+
+    def crear_driver():
+        creados.append(DriverPrueba(fallar_en=2 if not creados else None))
+        return creados[-1]
+
+    navegador = NavegadorCoinalyze(min_filas=50, timeout=5)
+    inicio = time.time()
+    assert navegador.cargar(URL, crear_driver) is creados[0]
+    assert time.time() - inicio < 3  # 40, 80, 100, 100: estable tras ~1.5 s de sondeo
+    assert creados[0].filas == 100
+    assert navegador.cargar(URL, crear_driver) is creados[0]
+    assert len(creados) == 1 and creados[0].gets == 1 and creados[0].refrescos == 1
+
+    # Falla el refresco: se descarta y se reintenta con un Chrome nuevo
+    assert navegador.cargar(URL, crear_driver) is creados[1]
+    assert creados[0].cerrado and creados[1].gets == 1 and navegador.cargas == 3
+
+def test_navegador_reciclado_por_edad_y_memoria():
+    creados = []
+
+    def crear_driver():
+        creados.append(DriverPrueba())
+        return creados[-1]
+
+    navegador = NavegadorCoinalyze(min_filas=50, timeout=5)
+    navegador.cargar(URL, crear_driver)
+    navegador.creado -= navegador.max_edad + 1
+    assert navegador.cargar(URL, crear_driver) is creados[1] and creados[0].cerrado
+
+    navegador.memoria_mb = lambda: navegador.max_memoria_mb + 1
+    assert navegador.cargar(URL, crear_driver) is creados[2] and creados[1].cerrado
+    assert navegador.arranques == 3 and creados[2].gets == 1
+
+def test_navegador_tabla_incompleta_y_sin_chrome():
+    navegador = NavegadorCoinalyze(min_filas=50, timeout=1)
+    driver = DriverPrueba(total=30)
+    assert navegador.cargar(URL, lambda: driver) is driver and driver.filas == 30  # Se extrae lo que haya
+
+    assert NavegadorCoinalyze().cargar(URL, lambda: None) is None
+    def sin_chrome():
+        raise WebDriverException("chromedriver no encontrado")
+    assert NavegadorCoinalyze().cargar(URL, sin_chrome) is None
+
+def test_memoria_procesos():
+    memoria = memoria_procesos_mb(os.getpid())
+    assert memoria is None or memoria > 0
@@ -0,0 +1,294 @@
+import threading
+import time
+
+import pytest
+
+from cuenta import EspejoCuenta
+
+class SesionRESTPrueba:
+    """Sustituto de pybit.HTTP con get_positions/get_open_orders/get_order_history y contador de llamadas"""
+
+    def __init__(self, posiciones, ordenes):
+        self.posiciones = posiciones
+        self.ordenes = ordenes
+        self.historial = []
+        self.llamadas = 0
+        self.error = False
+        self.antes_de_responder = None  # Para emitir eventos del stream mientras "viaja" la petición
+
+    def _respuesta(self, lista):
+        if self.antes_de_responder is not None:
+            self.antes_de_responder()
+        if self.error:
+            return {'retCode': 10002, 'retMsg': 'timeout', 'result': {}}
+        return {'retCode': 0, 'retMsg': 'OK', 'result': {'category': 'linear', 'list': [dict(x) for x in lista]}}
+
+    def get_order_history(self, category, symbol=None, orderId=None, orderLinkId=None):
+        self.llamadas += 1
+        return self._respuesta([o for o in self.historial if o['orderId'] == orderId])
+
+    def get_positions(self, category, symbol=None, settleCoin=None):
+        self.llamadas += 1
+        return self._respuesta([p for p in self.posiciones if symbol is None or p['symbol'] == symbol])
+
+    def get_open_orders(self, category, symbol=None, settleCoin=None):
+        self.llamadas += 1
+        return self._respuesta([o for o in self.ordenes if symbol is None or o['symbol'] == symbol])
+
+class StreamPrueba:
+    """
+    Sustituto del WebSocket privado de pybit: guarda los callbacks para emitir
+    eventos a mano; `ws` es la conexión subyacente, que cambia en cada reconexión
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+        self.conectado = True
+        self.ws = object()
+
+    def position_stream(self, callback):
+        self.callbacks['position'] = callback
+
+    def order_stream(self, callback):
+        self.callbacks['order'] = callback
+
+    def execution_stream(self, callback):
+        self.callbacks['execution'] = callback
+
+    def is_connected(self):
+        return self.conectado
+
+    def reconectar(self):
+        self.ws = object()
+
+    def emitir(self, topic, *datos):
+        self.callbacks[topic]({'topic': topic, 'data': list(datos)})
+
+def ms():
+    return int(time.time() * 1000)
+
+def posicion(symbol, size, idx=1, momento=None, **campos):
+    return dict({'category': 'linear', 'symbol': symbol, 'side': 'Buy' if float(size) else '', 'size': size,
+                 'positionIdx': idx, 'avgPrice': '100', 'updatedTime': str(momento or ms())}, **campos)
+
+def orden(order_id, estado='New', symbol='BTCUSDT', momento=None, **campos):
+    return dict({'category': 'linear', 'symbol': symbol, 'orderId': order_id, 'orderStatus': estado,
+                 'updatedTime': str(momento or ms())}, **campos)
+
+@pytest.fixture
+def cuenta():
+    rest = SesionRESTPrueba([posicion('BTCUSDT', '0.01')], [orden('a')])
+    espejo = EspejoCuenta()
+    espejo.session = rest
+    stream = StreamPrueba()
+    espejo.suscribir(stream)
+    assert espejo.cargar() and rest.llamadas == 2
+    return espejo, rest, stream
+
+def tamaños(espejo, symbol=None):
+    return {p['symbol']: p['size'] for p in espejo.get_positions(symbol=symbol)['result']['list']}
+
+# ========== LECTURAS Y EVENTOS ==========
+
+def test_lecturas_desde_la_copia(cuenta):
+    espejo, rest, stream = cuenta
+    assert tamaños(espejo, 'BTCUSDT') == {'BTCUSDT': '0.01'}
+    assert len(espejo.get_open_orders(category="linear", symbol="BTCUSDT")['result']['list']) == 1
+    assert espejo.get_positions(symbol='ETHUSDT')['result']['list'] == []
+    assert rest.llamadas == 2 and espejo.lecturas_espejo == 3
+
+    # Las respuestas son copias
+    espejo.get_positions()['result']['list'][0]['size'] = '5'
+    assert tamaños(espejo) == {'BTCUSDT': '0.01'}
+
+def test_eventos_de_posicion_y_orden(cuenta):
+    espejo, rest, stream = cuenta
+    stream.emitir('position', posicion('ETHUSDT', '1', idx=2, avgPrice='', entryPrice='2000'))
+    stream.emitir('position', posicion('BTCUSDT', '3', category='inverse'))
+    stream.emitir('order', orden('a', 'Filled'), orden('b', 'PartiallyFilled'))
+    stream.emitir('execution', {'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': 'a', 'execQty': '0.01'})
+
+    assert espejo.get_positions(symbol="ETHUSDT")['result']['list'][0]['avgPrice'] == '2000'  # El stream usa entryPrice
+    assert tamaños(espejo) == {'BTCUSDT': '0.01', 'ETHUSDT': '1'}
+    assert [o['orderId'] for o in espejo.get_open_orders()['result']['list']] == ['b']
+    assert espejo.ordenes_recientes['a']['orderStatus'] == 'Filled' and len(espejo.ejecuciones['a']) == 1
+    assert rest.llamadas == 2
+
+def test_cierre_externo_y_evento_viejo(cuenta):
+    espejo, rest, stream = cuenta
+    assert not espejo.esperar_cierre(0)
+    stream.emitir('position', posicion('BTCUSDT', '0', momento=ms() + 2))
+    assert espejo.esperar_cierre(0) and not espejo.esperar_cierre(0)
+
+    stream.emitir('position', posicion('BTCUSDT', '0.01', momento=ms() - 1000))  # Llega tarde: se ignora
+    assert tamaños(espejo) == {'BTCUSDT': '0'}
+
+    stream.emitir('position', posicion('BTCUSDT', '0.02', momento=ms() + 5))
+    espejo.descartar_cierres()
+    assert not espejo.esperar_cierre(0)
+
+def test_recientes_acotados():
+    espejo = EspejoCuenta(max_recientes=3)
+    espejo.suscribir(StreamPrueba())
+    for i in range(5):
+        espejo._on_order({'data': [orden(str(i), 'Filled')]})
+        espejo._on_execution({'data': [{'orderId': str(i), 'execQty': '1'}]})
+    assert list(espejo.ordenes_recientes) == ['2', '3', '4'] and list(espejo.ejecuciones) == ['2', '3', '4']
+
+# ========== RESINCRONIZACIÓN ==========
+
+def test_resincronizacion_elimina_posiciones_cerradas(cuenta):
+    espejo, rest, stream = cuenta
+    stream.emitir('position', posicion('ETHUSDT', '1', idx=2, momento=ms() - 1000))
+
+    # Se perdió el evento de cierre de ETHUSDT y BTCUSDT cambió: manda REST
+    rest.posiciones = [posicion('BTCUSDT', '0.03')]
+    rest.ordenes = []
+    assert espejo.cargar()
+    assert tamaños(espejo) == {'BTCUSDT': '0.03'} and espejo.get_open_orders()['result']['list'] == []
+    assert espejo.esperar_cierre(0)
+
+def test_resincronizacion_conserva_eventos_posteriores(cuenta):
+    espejo, rest, stream = cuenta
+    rest.posiciones = []
+
+    def evento_en_vuelo():
+        rest.antes_de_responder = None
+        stream.emitir('position', posicion('SOLUSDT', '5', momento=ms() + 1000))
+        stream.emitir('order', orden('z', symbol='SOLUSDT', momento=ms() + 1000))
+    rest.antes_de_responder = evento_en_vuelo
+
+    assert espejo.cargar()
+    assert tamaños(espejo) == {'SOLUSDT': '5'}
+    assert {o['orderId'] for o in espejo.get_open_orders()['result']['list']} == {'a', 'z'}
+
+def test_resincronizacion_periodica(cuenta):
+    espejo, rest, stream = cuenta
+    espejo.resincronizar = 60
+    espejo.get_positions()
+    assert rest.llamadas == 2
+
+    espejo.sincronizado -= 61
+    rest.posiciones = []
+    assert tamaños(espejo) == {} and rest.llamadas == 4 and espejo.lecturas_rest == 0
+
+def test_reconexion_fuerza_recarga(cuenta):
+    espejo, rest, stream = cuenta
+
+    # Caído: REST directo, y la copia no se vuelve a usar sin recargar
+    stream.conectado = False
+    rest.posiciones = []
+    assert tamaños(espejo) == {} and espejo.lecturas_rest == 1 and rest.llamadas == 3
+    stream.conectado = True
+    assert tamaños(espejo) == {} and espejo.lecturas_espejo == 1 and rest.llamadas == 5
+    espejo.get_positions()
+    assert rest.llamadas == 5
+
+    # Reconexión entre dos lecturas (nueva conexión subyacente): también recarga
+    stream.reconectar()
+    rest.posiciones = [posicion('ETHUSDT', '2')]
+    assert tamaños(espejo) == {'ETHUSDT': '2'} and rest.llamadas == 7
+
+def test_recarga_fallida_usa_rest(cuenta, capsys):
+    espejo, rest, stream = cuenta
+    stream.reconectar()
+    rest.error = True
+    assert espejo.get_positions()['retCode'] != 0 and espejo.lecturas_rest == 1
+    assert 'timeout' in capsys.readouterr().out
+
+    rest.error = False
+    assert tamaños(espejo) == {'BTCUSDT': '0.01'} and espejo.lecturas_espejo == 1
+
+def test_sin_stream_ni_credenciales():
+    rest = SesionRESTPrueba([posicion('BTCUSDT', '0.01')], [])
+    espejo = EspejoCuenta()
+    assert not espejo.iniciar(rest, api_key='', api_secret='')
+    assert tamaños(espejo) == {'BTCUSDT': '0.01'} and espejo.lecturas_rest == 1
+
+# ========== EJECUCIÓN DE ÓRDENES ==========
+
+def test_ejecucion_por_stream_mientras_se_espera(cuenta):
+    espejo, rest, stream = cuenta
+
+    def ejecutar():
+        time.sleep(0.05)
+        for precio, cantidad, pendiente in (('2010', '0.4', '0.6'), ('2020', '0.6', '0')):
+            stream.emitir('execution', {'category': 'linear', 'symbol': 'ETHUSDT', 'orderId': 'c',
+                                        'orderLinkId': 'cierre-1', 'execPrice': precio, 'execQty': cantidad,
+                                        'execFee': str(float(cantidad)), 'leavesQty': pendiente})
+    hilo = threading.Thread(target=ejecutar)
+    inicio = time.time()
+    hilo.start()
+    ejecucion = espejo.esperar_ejecucion("ETHUSDT", order_link_id='cierre-1', timeout=2)
+    espera = time.time() - inicio
+    hilo.join()
+
+    assert ejecucion['origen'] == 'stream' and ejecucion['order_id'] == 'c' and espera < 1
+    assert ejecucion['cantidad'] == 1.0 and ejecucion['precio'] == pytest.approx(2016) and ejecucion['comision'] == 1.0
+    assert espejo.ejecuciones_stream == 1 and rest.llamadas == 2
+
+def test_ejecucion_terminada_por_el_stream_de_ordenes(cuenta):
+    espejo, rest, stream = cuenta
+    stream.emitir('order', orden('a', 'Filled', avgPrice='101', cumExecQty='0.01', cumExecFee='0.001'))
+    stream.emitir('execution', {'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': 'a', 'execQty': '0.01'})
+    ejecucion = espejo.esperar_ejecucion("BTCUSDT", order_id='a', timeout=0)  # Sin leavesQty: manda el acumulado
+    assert ejecucion['estado'] == 'Filled' and ejecucion['precio'] == 101.0 and ejecucion['cantidad'] == 0.01
+
+def test_ejecucion_por_rest(cuenta):
+    espejo, rest, stream = cuenta
+    rest.historial.append({'orderId': 'd', 'orderStatus': 'Filled', 'avgPrice': '99.5', 'cumExecQty': '2',
+                           'cumExecFee': '0.1'})
+    rest.historial.append({'orderId': 'e', 'orderStatus': 'Cancelled', 'cumExecQty': '0'})
+
+    # El evento no llega a tiempo
+    ejecucion = espejo.esperar_ejecucion("BTCUSDT", order_id='d', timeout=0.05)
+    assert ejecucion['origen'] == 'rest' and ejecucion['precio'] == 99.5 and rest.llamadas == 3
+
+    # Sin stream se consulta directamente
+    stream.conectado = False
+    assert espejo.esperar_ejecucion("BTCUSDT", order_id='d')['cantidad'] == 2.0
+    assert espejo.esperar_ejecucion("BTCUSDT", order_id='e') is None
+    assert espejo.ejecuciones_rest == 2 and rest.llamadas == 5
+
+def test_ejecucion_por_rest_espera_a_que_se_ejecute():
+    rest = SesionRESTPrueba([], [])
+    rest.historial.append({'orderId': 'f', 'orderStatus': 'New', 'cumExecQty': '0'})
+    espejo = EspejoCuenta()
+    espejo.session = rest  # Sin stream (simulador, o el privado nunca conectó)
+
+    def ejecutar_en_la_tercera():
+        if rest.llamadas == 2:  # La respuesta en curso ya está calculada: se ve en la siguiente
+            rest.historial[0] = {'orderId': 'f', 'orderStatus': 'Filled', 'avgPrice': '50', 'cumExecQty': '3',
+                                 'cumExecFee': '0.2'}
+    rest.antes_de_responder = ejecutar_en_la_tercera
+
+    inicio = time.time()
+    ejecucion = espejo.esperar_ejecucion("BTCUSDT", order_id='f', timeout=2)
+    assert ejecucion['origen'] == 'rest' and ejecucion['cantidad'] == 3.0 and ejecucion['precio'] == 50.0
+    assert rest.llamadas == 3 and time.time() - inicio < 1
+
+def test_ejecucion_por_rest_agota_el_timeout():
+    rest = SesionRESTPrueba([], [])
+    rest.historial.append({'orderId': 'g', 'orderStatus': 'New', 'cumExecQty': '0'})
+    espejo = EspejoCuenta()
+    espejo.session = rest
+
+    inicio = time.time()
+    assert espejo.esperar_ejecucion("BTCUSDT", order_id='g', timeout=0.5) is None
+    assert 0.5 <= time.time() - inicio < 0.8 and rest.llamadas >= 3 and espejo.ejecuciones_rest == 0
+
+def test_esperar_posicion_cerrada():
+    rest = SesionRESTPrueba([posicion('BTCUSDT', '0.01')], [])
+    espejo = EspejoCuenta()
+    espejo.session = rest
+
+    def cerrar_en_la_segunda():
+        if rest.llamadas == 1:
+            rest.posiciones = [posicion('BTCUSDT', '0')]
+    rest.antes_de_responder = cerrar_en_la_segunda
+    assert espejo.esperar_posicion_cerrada('BTCUSDT', timeout=2) and rest.llamadas == 2
+
+    rest.posiciones = [posicion('BTCUSDT', '0.01')]
+    rest.antes_de_responder = None
+    assert not espejo.esperar_posicion_cerrada('BTCUSDT', timeout=0.3)
+    assert espejo.esperar_posicion_cerrada('BTCUSDT', side='Sell', timeout=0)
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from eventos_velas import BusVelas, parsear_vela_stream
+
+def kline(inicio, confirm, interval='5', close='1.5'):
+    return {'start': inicio, 'end': inicio + 299999, 'interval': interval, 'open': '1', 'close': close,
+            'high': '2', 'low': '0.5', 'volume': '10', 'turnover': '15', 'confirm': confirm}
+
+def mensaje(symbol, *klines, interval='5'):
+    return {'topic': f'kline.{interval}.{symbol}', 'data': list(klines)}
+
+class StreamPrueba:
+    """Sustituto del WebSocket público de pybit: registra las suscripciones de kline_stream"""
+
+    def __init__(self, fallar=False):
+        self.suscripciones = []
+        self.fallar = fallar
+
+    def kline_stream(self, interval, symbol, callback):
+        if self.fallar:
+            raise ConnectionError("sin conexión")
+        self.suscripciones.append((interval, list(symbol)))
+
+@pytest.fixture
+def bus():
+    bus = BusVelas()
+    bus.recibidas = []
+    bus.al_cerrar_vela(lambda symbol, intervalo, vela: bus.recibidas.append((symbol, intervalo, vela)))
+    return bus
+
+def test_parsear_vela_stream():
+    vela = parsear_vela_stream(dict(kline(300000, True), volume=''))
+    assert vela == {'timestamp': 300000, 'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5,
+                    'volume': 0.0, 'turnover': 15.0}
+
+def test_solo_velas_confirmadas(bus):
+    assert not bus.esperar(0)
+    bus._on_kline(mensaje('BTCUSDT', kline(0, False)))
+    assert not bus.esperar(0)
+
+    bus._on_kline(mensaje('BTCUSDT', kline(0, True)))
+    bus._on_kline(mensaje('ETHUSDT', kline(0, True), kline(300000, False)))
+    assert bus.esperar(0)
+    assert bus.despachar() == 2 and not bus.esperar(0)
+    assert [(s, i) for s, i, _ in bus.recibidas] == [('BTCUSDT', '5'), ('ETHUSDT', '5')]
+    assert bus.recibidas[0][2] == parsear_vela_stream(kline(0, True))
+    assert bus.despachar() == 0 and bus.velas_cerradas == 2
+
+def test_repetidas_y_atrasadas(bus):
+    bus.recibir(mensaje('BTCUSDT', kline(300000, True)))
+    bus.recibir(mensaje('BTCUSDT', kline(300000, True, close='9')))  # Repetida al reconectar
+    bus.recibir(mensaje('BTCUSDT', kline(0, True)))                  # Anterior a la ya emitida
+    bus.recibir(mensaje('BTCUSDT', kline(0, True, interval='1'), interval='1'))  # Otro intervalo
+    bus.despachar()
+    assert [(s, i, v['timestamp'], v['close']) for s, i, v in bus.recibidas] == \
+        [('BTCUSDT', '5', 300000, 1.5), ('BTCUSDT', '1', 0, 1.5)]
+
+def test_manejador_con_error_no_corta_el_despacho(capsys):
+    def fallar(symbol, intervalo, vela):
+        raise ValueError("manejador de prueba")
+
+    bus = BusVelas()
+    recibidas = []
+    bus.al_cerrar_vela(fallar)
+    bus.al_cerrar_vela(fallar)  # Suscrito una sola vez
+    bus.al_cerrar_vela(lambda symbol, intervalo, vela: recibidas.append(vela['timestamp']))
+    bus.recibir(mensaje('BTCUSDT', kline(0, True), kline(300000, True)))
+    assert bus.despachar() == 2 and recibidas == [0, 300000]
+    assert capsys.readouterr().out.count('manejador de prueba') == 2
+
+def test_esperar_despierta_con_el_cierre(bus):
+    hilo = threading.Timer(0.05, bus.recibir, args=(mensaje('BTCUSDT', kline(0, True)),))
+    hilo.start()
+    assert bus.esperar(2)
+    hilo.join()
+    assert bus.despachar() == 1
+
+def test_seguir_suscribe_una_vez(bus):
+    bus.seguir(['BTCUSDT'])  # Sin stream no hace nada
+    stream = bus._ws = StreamPrueba()
+    bus.seguir(['BTCUSDT', 'ETHUSDT'])
+    bus.seguir(['ETHUSDT', 'SOLUSDT'], intervalo=5)
+    bus.seguir(['BTCUSDT'], intervalo='15')
+    assert stream.suscripciones == [('5', ['BTCUSDT', 'ETHUSDT']), ('5', ['SOLUSDT']), ('15', ['BTCUSDT'])]
+
+def test_seguir_reintenta_tras_fallo(bus, capsys):
+    bus._ws = StreamPrueba(fallar=True)
+    bus.seguir(['BTCUSDT'])
+    assert 'sin conexión' in capsys.readouterr().out
+
+    stream = bus._ws = StreamPrueba()
+    bus.seguir(['BTCUSDT'])
+    assert stream.suscripciones == [('5', ['BTCUSDT'])]
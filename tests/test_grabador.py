@@ -0,0 +1,126 @@
+import gzip
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import eventos_velas
+import tickers
+import velas
+from grabador import (CABECERA_REGISTRO, MAGIA, GrabadorMercado, ReproductorMercado, leer_segmento,
+                      registro_a_tabla, tabla_a_registro)
+
+LISTA_TICKERS = [{'symbol': 'BTCUSDT', 'lastPrice': '100', 'markPrice': '100', 'turnover24h': '1',
+                  'fundingRate': '0.0001', 'nextFundingTime': '0'}]
+KLINES = {'symbol': 'BTCUSDT', 'interval': '5', 'list': [['300000', '1', '2', '0.5', '1.5', '10', '15']]}
+
+@pytest.fixture
+def grabacion(tmp_path):
+    """Diez snapshots de tickers (1 s de grabación) en segmentos de ~400 bytes y una lista de klines"""
+    directorio = str(tmp_path / 'grabaciones')
+    grabador = GrabadorMercado()
+    grabador.activar(directorio, max_bytes=400)
+    for i in range(10):
+        grabador.grabar('tickers', {'snapshot': LISTA_TICKERS}, timestamp_ms=1000 + i * 100)
+    grabador.grabar('klines', KLINES, timestamp_ms=1050)
+    grabador.cerrar()
+    grabador.esperar_compresiones(5)
+    assert grabador.registros == 11 and not grabador.activo
+    return ReproductorMercado(directorio)
+
+def test_inactivo_no_graba(tmp_path):
+    grabador = GrabadorMercado()
+    grabador.grabar('tickers', {'snapshot': []})
+    grabador.grabar_tabla('coinalyze', pd.DataFrame({'COIN': ['Bitcoin BTC']}))
+    assert grabador.registros == 0 and not grabador.activo
+
+def test_rotacion_y_compresion(grabacion):
+    segmentos = grabacion.segmentos('tickers')
+    assert len(segmentos) > 1
+    assert all(ruta.endswith('.rec.gz') for ruta in segmentos[:-1])  # Los cerrados por rotación
+    assert segmentos[-1].endswith('.rec')                            # El cerrado al final, sin comprimir
+    assert not any(nombre.endswith('.tmp') for nombre in os.listdir(grabacion.directorio))
+    with gzip.open(segmentos[0], 'rb') as archivo:
+        assert archivo.read(len(MAGIA)) == MAGIA
+
+def test_rotacion_por_tiempo(tmp_path):
+    grabador = GrabadorMercado()
+    grabador.activar(str(tmp_path), max_segundos=0.05, comprimir=False)
+    grabador.grabar('klines', KLINES)
+    time.sleep(0.1)
+    grabador.grabar('klines', KLINES)
+    grabador.cerrar()
+    segmentos = ReproductorMercado(str(tmp_path)).segmentos('klines')
+    assert len(segmentos) == 2 and all(ruta.endswith('.rec') for ruta in segmentos)
+
+def test_registro_incompleto_se_ignora(grabacion):
+    ruta = grabacion.segmentos('klines')[-1]
+    with open(ruta, 'ab') as archivo:  # Corte de luz a mitad de un registro
+        archivo.write(CABECERA_REGISTRO.pack(2000, 100) + b'{"sym')
+    assert list(leer_segmento(ruta)) == [(1050, KLINES)]
+
+def test_segmento_comprimido_mientras_se_lee_y_gzip_truncado(grabacion):
+    ruta = grabacion.segmentos('tickers')[-1]
+    registros = list(leer_segmento(ruta))
+    with open(ruta, 'rb') as origen, gzip.open(ruta + '.gz', 'wb') as destino:
+        destino.write(origen.read())
+    os.remove(ruta)
+    assert list(leer_segmento(ruta)) == registros  # Se lee el .gz que lo sustituyó
+
+    os.truncate(ruta + '.gz', os.path.getsize(ruta + '.gz') - 10)
+    leidos = list(leer_segmento(ruta + '.gz'))  # Hasta donde llegue, sin fallar
+    assert leidos == registros[:len(leidos)]
+
+def test_eventos_mezclados_por_tiempo(grabacion):
+    eventos = list(grabacion.eventos())
+    assert [e[0] for e in eventos] == sorted(e[0] for e in eventos) and len(eventos) == 11
+    assert eventos[1] == (1050, 'klines', KLINES)
+    assert eventos[0] == (1000, 'tickers', {'snapshot': LISTA_TICKERS})
+
+def test_reproducir_a_su_ritmo_y_sin_esperas(grabacion):
+    inicio = time.time()
+    grabacion.reproducir({'tickers': lambda contenido: None}, velocidad=1.0, streams=('tickers',))
+    assert time.time() - inicio >= 0.85
+
+    recibidos = []
+    inicio = time.time()
+    entregados = grabacion.reproducir({'tickers': recibidos.append}, velocidad=None)
+    assert time.time() - inicio < 0.5
+    assert entregados == {'tickers': 10, 'klines': 0, 'coinalyze': 0} and len(recibidos) == 10
+
+def test_reproducir_en_la_capa_de_mercado(grabacion, monkeypatch):
+    snapshot = tickers.SnapshotTickers()
+    stream = tickers.StreamTickers(snapshot=snapshot)
+    cache = velas.CacheVelas()
+    bus = eventos_velas.BusVelas()
+    monkeypatch.setattr(tickers, 'snapshot_tickers', snapshot)
+    monkeypatch.setattr(tickers, 'stream_tickers', stream)
+    monkeypatch.setattr(velas, 'cache_velas', cache)
+    monkeypatch.setattr(eventos_velas, 'bus_velas', bus)
+
+    grabador = GrabadorMercado()
+    grabador.activar(grabacion.directorio, comprimir=False)
+    grabador.grabar('tickers', {'tabla': {'symbol': 'ETHUSDT', 'lastPrice': '2000'}}, timestamp_ms=3000)
+    kline = dict(zip(['start', 'open', 'high', 'low', 'close', 'volume', 'turnover'], KLINES['list'][0]),
+                 interval='5', confirm=True)
+    grabador.grabar('klines', {'stream': {'topic': 'kline.5.BTCUSDT', 'data': [kline]}}, timestamp_ms=3000)
+    grabador.cerrar()
+
+    entregados = ReproductorMercado(grabacion.directorio).reproducir(velocidad=None)
+    assert entregados == {'tickers': 11, 'klines': 2, 'coinalyze': 0}
+    assert snapshot.obtener('BTCUSDT')['lastPrice'] == 100.0
+    assert stream.tabla.obtener('ETHUSDT')['lastPrice'] == 2000.0
+    assert cache.estadisticas()['claves'] == 1
+    assert bus.despachar() == 1
+
+def test_tabla_de_coinalyze(tmp_path):
+    df = pd.DataFrame({'COIN': ['Bitcoin BTC', 'Ether ETH'], 'PRICE': ['$1', '$2']})
+    assert registro_a_tabla(tabla_a_registro(df)).equals(df)
+
+    grabador = GrabadorMercado()
+    grabador.activar(str(tmp_path), comprimir=False)
+    grabador.grabar_tabla('coinalyze', df)
+    grabador.cerrar()
+    (_, _, contenido), = ReproductorMercado(str(tmp_path)).eventos(('coinalyze',))
+    assert registro_a_tabla(contenido).equals(df)
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicadores import (ATRIncremental, VolumeRegressionIncremental, apilar_velas, calcular_metricas_lote,
+                         calcular_rate_velas, pendiente_movil, volume_regression_ultimo)
+
+# ========== IMPLEMENTACIÓN ORIGINAL (REFERENCIA) ==========
+
+def volume_regression_original(df, short_len=7, long_len=50, source='close'):
+    """calcular_volume_regression tal como estaba antes del motor vectorizado"""
+    df = df.copy()
+
+    def calcular_slope(series, length):
+        if len(series) < length:
+            return np.nan
+        x = np.arange(len(series))
+        return np.polyfit(x, series, 1)[0]
+
+    df['slope_price'] = df[source].rolling(short_len).apply(lambda x: calcular_slope(x, short_len), raw=True)
+
+    def calcular_rate(row):
+        try:
+            high, low, open_, close = row['high'], row['low'], row['open'], row['close']
+            tw = high - max(open_, close)
+            bw = min(open_, close) - low
+            body = abs(close - open_)
+            if open_ <= close:
+                ret = 0.5 * (tw + bw + (2 * body)) / (tw + bw + body)
+            else:
+                ret = 0.5 * (tw + bw + 0) / (tw + bw + body)
+            return ret if not np.isnan(ret) else 0.5
+        except:
+            return 0.5
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['rate'] = df.apply(calcular_rate, axis=1)
+    df['volume_up'] = df['volume'] * df['rate']
+    df['volume_down'] = df['volume'] * (1 - df['rate'])
+    df['slope_volume_up'] = df['volume_up'].rolling(long_len).apply(lambda x: calcular_slope(x, long_len), raw=True)
+    df['slope_volume_down'] = df['volume_down'].rolling(long_len).apply(lambda x: calcular_slope(x, long_len), raw=True)
+    return df
+
+def tendencia_volumen_original(datos):
+    if len(datos) < 10:
+        return 0
+    tercio = len(datos) // 3
+    volumen_inicial = datos['volume'].iloc[:tercio].mean()
+    volumen_final = datos['volume'].iloc[-tercio:].mean()
+    if volumen_inicial == 0:
+        return 0
+    return (volumen_final - volumen_inicial) / volumen_inicial
+
+def fuerza_tendencia_original(datos):
+    if len(datos) < 14:
+        return 0
+    high_low = datos['high'] - datos['low']
+    high_close_prev = abs(datos['high'] - datos['close'].shift(1))
+    low_close_prev = abs(datos['low'] - datos['close'].shift(1))
+    true_range = pd.concat([high_low, high_close_prev, low_close_prev], axis=1).max(axis=1)
+    atr = true_range.rolling(window=14).mean()
+    return ((atr / datos['close']) * 100).iloc[-1]
+
+def rango_original(datos):
+    high_max = datos['high'].max()
+    low_min = datos['low'].min()
+    return ((high_max - low_min) / ((high_max + low_min) / 2)) * 100
+
+def velas_aleatorias(cantidad, semilla=0):
+    rng = np.random.default_rng(semilla)
+    open_ = 100 + np.cumsum(rng.normal(0, 1, cantidad))
+    close = open_ + rng.normal(0, 1, cantidad)
+    high = np.maximum(open_, close) + rng.uniform(0, 1, cantidad)
+    low = np.minimum(open_, close) - rng.uniform(0, 1, cantidad)
+    volume = rng.uniform(1_000, 5_000_000, cantidad)
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume})
+
+def iguales(obtenido, esperado, tolerancia=1e-9):
+    return np.allclose(obtenido, esperado, rtol=tolerancia, atol=tolerancia, equal_nan=True)
+
+# ========== PENDIENTE MÓVIL ==========
+
+@pytest.mark.parametrize('semilla', range(5))
+@pytest.mark.parametrize('longitud', [2, 7, 50])
+def test_pendiente_movil_igual_a_polyfit(semilla, longitud):
+    serie = velas_aleatorias(300, semilla)['close']
+    esperado = volume_regression_original(velas_aleatorias(300, semilla), short_len=longitud)['slope_price']
+    assert iguales(pendiente_movil(serie, longitud), esperado)
+
+@pytest.mark.parametrize('huecos', [[0], [150], [299], [10, 11, 200]])
+def test_pendiente_movil_con_nan(huecos):
+    serie = velas_aleatorias(300, 3)['volume']
+    serie.iloc[huecos] = np.nan
+    esperado = serie.rolling(50).apply(lambda x: np.polyfit(np.arange(len(x)), x, 1)[0], raw=True)
+    obtenido = pendiente_movil(serie, 50)
+    assert iguales(obtenido, esperado)
+    assert np.isnan(obtenido[huecos[0]:huecos[0] + 50]).all()
+
+@pytest.mark.parametrize('cantidad', [0, 1, 6, 7, 8, 49, 50])
+def test_pendiente_movil_serie_corta(cantidad):
+    datos = velas_aleatorias(cantidad, 4)
+    esperado = volume_regression_original(datos)
+    assert iguales(pendiente_movil(datos['close'], 7), esperado['slope_price'])
+    assert iguales(pendiente_movil(datos['volume'] * esperado['rate'], 50), esperado['slope_volume_up'])
+
+def test_calcular_rate_velas_igual_a_calcular_rate():
+    df = velas_aleatorias(500, 5)
+    df.loc[10, ['open', 'high', 'low', 'close']] = 50.0  # Vela sin rango
+    df.loc[20, 'close'] = np.nan
+    esperado = volume_regression_original(df)['rate']
+    assert iguales(calcular_rate_velas(df['open'], df['high'], df['low'], df['close']), esperado, 1e-12)
+
+# ========== ÚLTIMA VELA E INCREMENTAL ==========
+
+@pytest.mark.parametrize('fin', [5, 7, 30, 49, 50, 51, 100, 400])
+def test_volume_regression_ultimo_igual_a_ultima_fila(fin):
+    df = velas_aleatorias(400, 6).iloc[:fin]
+    esperado = volume_regression_original(df).iloc[-1]
+    ultimo = volume_regression_ultimo(df)
+    for columna in ('slope_price', 'slope_volume_up', 'slope_volume_down'):
+        assert iguales(ultimo[columna], esperado[columna])
+
+def test_volume_regression_incremental_vela_a_vela():
+    df = velas_aleatorias(400, 7)
+    esperado = volume_regression_original(df)
+    estado = VolumeRegressionIncremental()
+    for i, vela in enumerate(df.to_dict('records')):
+        previa = estado.ultimo(vela_en_curso=vela)
+        estado.actualizar(vela)
+        fila = esperado.iloc[i]
+        for señales in (previa, estado.ultimo()):
+            assert iguales([señales['slope_price'], señales['slope_volume_up'], señales['slope_volume_down']],
+                           [fila['slope_price'], fila['slope_volume_up'], fila['slope_volume_down']], 1e-7)
+
+def test_atr_incremental_igual_a_calcular_fuerza_tendencia():
+    df = velas_aleatorias(200, 8)
+    atr = ATRIncremental()
+    for i, vela in enumerate(df.to_dict('records')):
+        previa = atr.atr_normalizado(vela_en_curso=vela)
+        atr.actualizar(vela)
+        esperado = fuerza_tendencia_original(df.iloc[:i + 1])
+        assert iguales([previa, atr.atr_normalizado()], esperado)
+
+@pytest.mark.parametrize('fin', [13, 14, 15, 200])
+def test_atr_incremental_arranque_en_frio(fin):
+    df = velas_aleatorias(200, 9)
+    atr = ATRIncremental()
+    atr.cargar_historial(df.iloc[:fin - 1])
+    assert iguales(atr.atr_normalizado(vela_en_curso=df.iloc[fin - 1]), fuerza_tendencia_original(df.iloc[:fin]))
+
+# ========== MÉTRICAS POR LOTE ==========
+
+@pytest.mark.parametrize('velas', [8, 14, 36, 60])
+@pytest.mark.parametrize('semilla', range(3))
+def test_metricas_lote_igual_a_funciones_por_simbolo(velas, semilla):
+    simbolos = [velas_aleatorias(velas + 5, semilla * 100 + i) for i in range(8)]
+    simbolos[3].loc[simbolos[3].index[-2], 'volume'] = np.nan  # Hueco en un símbolo
+    lote = calcular_metricas_lote(**apilar_velas(simbolos, velas))
+
+    for i, datos in enumerate(simbolos):
+        datos = datos.iloc[-velas:]
+        original = volume_regression_original(datos).iloc[-1]
+        esperado = {
+            'rango_porcentual': rango_original(datos),
+            'tendencia_volumen': tendencia_volumen_original(datos),
+            'fuerza_tendencia': fuerza_tendencia_original(datos),
+            'slope_price': original['slope_price'],
+            'slope_volume_up': original['slope_volume_up'],
+            'slope_volume_down': original['slope_volume_down'],
+        }
+        for columna, valor in esperado.items():
+            assert iguales(lote[columna][i], valor), f"{columna} difiere en el símbolo {i}"
@@ -0,0 +1,105 @@
+import pytest
+
+from instrumentos import CacheInstrumentos, parsear_instrumento
+
+def instrumento(symbol, qty_step='0.01', tick_size='0.001'):
+    return {'symbol': symbol, 'status': 'Trading', 'minOrderAmt': '5',
+            'lotSizeFilter': {'minOrderQty': qty_step, 'qtyStep': qty_step, 'maxOrderQty': '1000',
+                              'minNotionalValue': '5'},
+            'priceFilter': {'tickSize': tick_size}}
+
+class SesionInstrumentosPrueba:
+    """
+    Sustituto de pybit.HTTP para get_instruments_info: sirve `paginas` (listas de
+    instrumentos) encadenadas con nextPageCursor. `fallar_en`: número de llamada
+    (desde 1) que responde con error.
+    """
+
+    def __init__(self, paginas, fallar_en=None):
+        self.paginas = paginas
+        self.fallar_en = fallar_en
+        self.cursores = []
+
+    def get_instruments_info(self, category, limit, cursor=None):
+        self.cursores.append(cursor)
+        if len(self.cursores) == self.fallar_en:
+            return {'retCode': 10006, 'retMsg': 'Too many visits'}
+        pagina = int(cursor[len('pagina-'):]) if cursor else 0
+        siguiente = f'pagina-{pagina + 1}' if pagina + 1 < len(self.paginas) else ''
+        return {'retCode': 0, 'result': {'category': 'linear', 'list': self.paginas[pagina],
+                                         'nextPageCursor': siguiente}}
+
+PAGINAS = [[instrumento('BTCUSDT', '0.001', '0.1'), instrumento('ETHUSDT')],
+           [instrumento('SOLUSDT', '0.1')],
+           [instrumento('1000PEPEUSDT', '100', '0.0000001')]]
+
+# ========== PARSEO ==========
+
+def test_parsear_instrumento():
+    assert parsear_instrumento(instrumento('BTCUSDT', '0.001', '0.1')) == {
+        'min_order_qty': 0.001, 'qty_step': 0.001, 'max_order_qty': 1000.0, 'min_order_value': 5.0,
+        'min_notional': 5.0, 'tick_size': 0.1, 'status': 'Trading'}
+
+def test_parsear_instrumento_valores_por_defecto():
+    assert parsear_instrumento({'symbol': 'NUEVOUSDT'}) == {
+        'min_order_qty': 0.001, 'qty_step': 0.001, 'max_order_qty': float('inf'), 'min_order_value': 5.0,
+        'min_notional': 5.0, 'tick_size': 0.0001, 'status': ''}
+
+    # Campos presentes pero vacíos o con texto no numérico: también el valor por defecto
+    incompleto = {'symbol': 'NUEVOUSDT', 'minOrderAmt': '',
+                  'lotSizeFilter': {'qtyStep': '', 'minOrderQty': None, 'minNotionalValue': 'n/a'},
+                  'priceFilter': {'tickSize': '0.5'}}
+    tabla = parsear_instrumento(incompleto)
+    assert tabla['qty_step'] == 0.001 and tabla['min_order_qty'] == 0.001 and tabla['min_notional'] == 5.0
+    assert tabla['min_order_value'] == 5.0 and tabla['tick_size'] == 0.5
+
+# ========== DESCARGA PAGINADA ==========
+
+def test_actualizar_sigue_el_cursor_hasta_el_final():
+    sesion = SesionInstrumentosPrueba(PAGINAS)
+    cache = CacheInstrumentos()
+    assert not cache.vigente() and len(cache) == 0
+
+    assert cache.actualizar(sesion)
+    assert sesion.cursores == [None, 'pagina-1', 'pagina-2']
+    assert cache.simbolos == {'BTCUSDT', 'ETHUSDT', 'SOLUSDT', '1000PEPEUSDT'} and len(cache) == 4
+    assert 'SOLUSDT' in cache and 'XRPUSDT' not in cache
+    assert cache.obtener('1000PEPEUSDT')['qty_step'] == 100.0 and cache.obtener('BTCUSDT')['tick_size'] == 0.1
+    assert cache.obtener('XRPUSDT') is None and cache.vigente()
+
+def test_error_a_mitad_de_paginas_conserva_la_tabla_anterior(capsys):
+    cache = CacheInstrumentos()
+    cache.actualizar(SesionInstrumentosPrueba(PAGINAS[:1]))
+    anterior = cache.info
+
+    sesion = SesionInstrumentosPrueba(PAGINAS, fallar_en=2)
+    assert not cache.actualizar(sesion) and sesion.cursores == [None, 'pagina-1']
+    assert cache.info is anterior and cache.simbolos == {'BTCUSDT', 'ETHUSDT'}  # Sin tabla a medias
+    assert 'Too many visits' in capsys.readouterr().out
+
+# ========== CADUCIDAD ==========
+
+def test_asegurar_solo_descarga_al_caducar():
+    sesion = SesionInstrumentosPrueba(PAGINAS)
+    cache = CacheInstrumentos(intervalo=60)
+    assert cache.asegurar(sesion) and len(sesion.cursores) == 3
+    assert cache.asegurar(sesion) and len(sesion.cursores) == 3
+
+    cache.actualizado -= 61
+    sesion.paginas = [[instrumento('BTCUSDT')]]
+    assert cache.asegurar(sesion) and cache.simbolos == {'BTCUSDT'} and len(sesion.cursores) == 4
+
+def test_asegurar_con_fallo_mantiene_la_tabla_anterior():
+    cache = CacheInstrumentos(intervalo=60)
+    cache.asegurar(SesionInstrumentosPrueba(PAGINAS))
+    cache.actualizado -= 61
+
+    caida = SesionInstrumentosPrueba(PAGINAS, fallar_en=1)
+    assert cache.asegurar(caida) and len(cache) == 4 and not cache.vigente()
+    assert cache.obtener('SOLUSDT')['qty_step'] == pytest.approx(0.1)
+
+    # Vuelve a intentarlo en la siguiente llamada mientras siga caducada
+    assert cache.asegurar(SesionInstrumentosPrueba(PAGINAS[:1])) and len(cache) == 2 and cache.vigente()
+
+def test_asegurar_sin_tabla_y_con_fallo():
+    assert not CacheInstrumentos().asegurar(SesionInstrumentosPrueba(PAGINAS, fallar_en=1))
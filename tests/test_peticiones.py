@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from peticiones import SesionAgrupada, VueloUnico
+
+class SesionLentaPrueba:
+    """Sustituto de pybit.HTTP cuyas lecturas tardan `latencia` s, con contador de llamadas"""
+
+    def __init__(self, latencia=0.1):
+        self.latencia = latencia
+        self.llamadas = 0
+        self.saldo = 1000.0
+
+    def get_wallet_balance(self, accountType):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        return {'retCode': 0, 'result': {'list': [{'coin': [{'coin': 'USDT', 'walletBalance': str(self.saldo)}]}]}}
+
+    def get_positions(self, category, settleCoin=None, symbol=None):
+        self.llamadas += 1
+        time.sleep(self.latencia)
+        if symbol == 'FALLO':
+            raise ConnectionError("fallo de red de prueba")
+        return {'retCode': 0, 'result': {'list': []}}
+
+    def get_tickers(self, category, symbol=None):
+        self.llamadas += 1
+        return {'retCode': 0, 'result': {'list': list(symbol or [])}}
+
+    def place_order(self, **kwargs):
+        self.saldo -= 10
+        if kwargs.get('symbol') == 'FALLO':
+            raise ConnectionError("orden rechazada")
+        return {'retCode': 0, 'result': {'orderId': '1'}}
+
+def en_paralelo(funcion, hilos, **kwargs):
+    hilos = [threading.Thread(target=funcion, kwargs=kwargs) for _ in range(hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+def saldo(respuesta):
+    return float(respuesta['result']['list'][0]['coin'][0]['walletBalance'])
+
+def test_lecturas_simultaneas_comparten_llamada():
+    sesion = SesionLentaPrueba()
+    agrupada = SesionAgrupada(sesion)
+    respuestas = []
+
+    def leer(**kwargs):
+        respuestas.append(agrupada.get_positions(category="linear", **kwargs))
+
+    hilos = [threading.Thread(target=leer, kwargs={'settleCoin': 'USDT'}) for _ in range(8)]
+    hilos.append(threading.Thread(target=leer, kwargs={'symbol': 'BTCUSDT'}))  # Otra clave
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sesion.llamadas == 2 and len(respuestas) == 9
+    assert agrupada.vuelos.agrupadas == 7 and agrupada.vuelos.ejecuciones == 2
+
+    # Sin TTL, una lectura posterior vuelve a la red
+    agrupada.get_positions(category="linear", settleCoin="USDT")
+    assert sesion.llamadas == 3
+
+def test_errores_llegan_a_todos_y_no_se_guardan():
+    sesion = SesionLentaPrueba()
+    agrupada = SesionAgrupada(sesion, ttl=10)
+    errores = []
+
+    def fallar():
+        try:
+            agrupada.get_positions(category="linear", symbol='FALLO')
+        except ConnectionError as e:
+            errores.append(e)
+
+    en_paralelo(fallar, 3)
+    assert len(errores) == 3 and sesion.llamadas == 1
+    with pytest.raises(ConnectionError):
+        agrupada.get_positions(category="linear", symbol='FALLO')
+    assert sesion.llamadas == 2
+
+def test_micro_ttl_e_invalidacion_por_escrituras():
+    sesion = SesionLentaPrueba(latencia=0.01)
+    agrupada = SesionAgrupada(sesion, ttl=0.5)
+    for _ in range(3):
+        agrupada.get_wallet_balance(accountType="UNIFIED")
+    assert sesion.llamadas == 1
+
+    agrupada.place_order(symbol="BTCUSDT")
+    assert saldo(agrupada.get_wallet_balance(accountType="UNIFIED")) == 990.0 and sesion.llamadas == 2
+
+    with pytest.raises(ConnectionError):  # Una escritura fallida también invalida
+        agrupada.place_order(symbol="FALLO")
+    assert saldo(agrupada.get_wallet_balance(accountType="UNIFIED")) == 980.0 and sesion.llamadas == 3
+
+    time.sleep(0.6)
+    agrupada.get_wallet_balance(accountType="UNIFIED")
+    assert sesion.llamadas == 4
+
+def test_argumentos_no_comparables_y_atributos():
+    sesion = SesionLentaPrueba()
+    agrupada = SesionAgrupada(sesion, ttl=10)
+    assert agrupada.get_tickers(category="linear", symbol=['BTCUSDT'])['result']['list'] == ['BTCUSDT']
+    agrupada.get_tickers(category="linear", symbol=['BTCUSDT'])
+    assert sesion.llamadas == 2 and agrupada.vuelos.ejecuciones == 0
+    assert agrupada.latencia == 0.1  # Los atributos pasan tal cual
+
+def test_invalidar_no_une_llamadas_nuevas_a_la_ejecucion_en_curso():
+    vuelos = VueloUnico()
+    empezada, soltar = threading.Event(), threading.Event()
+    resultados = []
+
+    def lenta():
+        empezada.set()
+        soltar.wait(2)
+        return 'vieja'
+
+    hilo = threading.Thread(target=lambda: resultados.append(vuelos.hacer('clave', lenta)))
+    hilo.start()
+    empezada.wait(2)
+    vuelos.invalidar()
+    assert vuelos.hacer('clave', lambda: 'nueva') == 'nueva'
+    soltar.set()
+    hilo.join()
+    assert resultados == ['vieja'] and vuelos.ejecuciones == 2 and vuelos.agrupadas == 0
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicadores import apilar_velas, calcular_metricas_lote, volume_regression_ultimo
+from puertas import (FUNDING_MAXIMO, MOTIVO_FUNDING_ALTO, MOTIVO_LATERAL, MOTIVO_SIN_FUNDING, MOTIVO_TENDENCIA,
+                     evaluar_puertas)
+from scripts import cargar_funciones
+
+ACTIVO = {'simbolo_bybit': 'BTCUSDT', 'moneda': 'Bitcoin BTC'}
+
+class Puertas:
+    """Funciones de las puertas de un script, con las llamadas que reciben"""
+
+    def __init__(self, lateral=False, funding=0.01, tendencia=True):
+        self.lateral = lateral
+        self.funding = funding
+        self.tendencia = tendencia
+        self.llamadas = []
+
+    def es_lateral(self, symbol, metricas):
+        self.llamadas.append('lateral')
+        return self.lateral
+
+    def obtener_funding(self, symbol):
+        self.llamadas.append('funding')
+        return self.funding
+
+    def tendencia_sin_metricas(self, symbol):
+        self.llamadas.append('tendencia')
+        return self.tendencia
+
+    def evaluar(self, metricas, con_tendencia=True):
+        return evaluar_puertas(dict(ACTIVO), metricas, self.es_lateral, self.obtener_funding,
+                               self.tendencia_sin_metricas if con_tendencia else None, tiempo_datos=12.0)
+
+def metricas(slope_price=0.5):
+    return {'rango_porcentual': 5.0, 'tendencia_volumen': 0.2, 'fuerza_tendencia': 1.0, 'slope_price': slope_price}
+
+# ========== ORDEN DE LAS PUERTAS ==========
+
+def test_apto():
+    puertas = Puertas()
+    veredicto = puertas.evaluar(metricas())
+    assert veredicto['apto'] and veredicto['motivo'] is None and veredicto['funding_rate'] == 0.01
+    assert veredicto['symbol'] == 'BTCUSDT' and veredicto['moneda'] == 'Bitcoin BTC'
+    assert puertas.llamadas == ['lateral', 'funding']  # Con métricas la tendencia sale de slope_price
+    assert set(veredicto['tiempos']) == {'datos', 'lateral', 'tendencia', 'funding'}
+    assert veredicto['tiempos']['datos'] == 12.0
+
+def test_lateral_descarta_sin_consultar_el_resto():
+    puertas = Puertas(lateral=True, funding=None)
+    veredicto = puertas.evaluar(metricas(slope_price=-1.0))
+    assert not veredicto['apto'] and veredicto['motivo'] == MOTIVO_LATERAL
+    assert puertas.llamadas == ['lateral'] and veredicto['funding_rate'] is None
+    assert set(veredicto['tiempos']) == {'datos', 'lateral'}
+
+def test_tendencia_negativa_antes_del_funding():
+    puertas = Puertas(funding=None)
+    veredicto = puertas.evaluar(metricas(slope_price=-1e-9))
+    assert veredicto['motivo'] == MOTIVO_TENDENCIA and puertas.llamadas == ['lateral']
+
+    veredicto = puertas.evaluar(metricas(slope_price=0.0))  # Pendiente nula: no es positiva
+    assert veredicto['motivo'] == MOTIVO_TENDENCIA
+
+def test_sin_metricas_no_se_descarta_por_lateral():
+    puertas = Puertas(lateral=True)
+    veredicto = puertas.evaluar(None)
+    assert veredicto['apto'] and puertas.llamadas == ['tendencia', 'funding']
+
+    puertas = Puertas(tendencia=False)
+    assert puertas.evaluar(None)['motivo'] == MOTIVO_TENDENCIA and puertas.llamadas == ['tendencia']
+
+def test_sin_funding_se_descarta():
+    puertas = Puertas(funding=None)
+    veredicto = puertas.evaluar(metricas())
+    assert not veredicto['apto'] and veredicto['motivo'] == MOTIVO_SIN_FUNDING and veredicto['funding_rate'] is None
+
+@pytest.mark.parametrize('funding, motivo', [(FUNDING_MAXIMO, MOTIVO_FUNDING_ALTO), (0.5, MOTIVO_FUNDING_ALTO),
+                                             (0.0599, None), (-0.2, None)])
+def test_limite_de_funding(funding, motivo):
+    veredicto = Puertas(funding=funding).evaluar(metricas())
+    assert veredicto['motivo'] == motivo and veredicto['apto'] == (motivo is None)
+    assert veredicto['funding_rate'] == funding
+
+def test_scripts_sin_puerta_de_tendencia():
+    puertas = Puertas(tendencia=False)
+    veredicto = puertas.evaluar(metricas(slope_price=-1.0), con_tendencia=False)
+    assert veredicto['apto'] and puertas.llamadas == ['lateral', 'funding']
+    assert 'tendencia' not in veredicto['tiempos']
+
+# ========== FUERZA TENDENCIAL IGUAL QUE verificar_fuerza_tendencial_positiva ==========
+
+def velas_aleatorias(cantidad, semilla):
+    rng = np.random.default_rng(semilla)
+    open_ = 100 + np.cumsum(rng.normal(0, 1, cantidad))
+    close = open_ + rng.normal(0, 1, cantidad)
+    return pd.DataFrame({'open': open_, 'high': np.maximum(open_, close) + rng.uniform(0, 1, cantidad),
+                         'low': np.minimum(open_, close) - rng.uniform(0, 1, cantidad), 'close': close,
+                         'volume': rng.uniform(1_000, 5_000_000, cantidad)})
+
+@pytest.mark.parametrize('script', ['bot_serv.py', 'bot_servidor.py'])
+@pytest.mark.parametrize('semilla', range(6))
+def test_slope_price_del_lote_igual_que_la_verificacion_por_simbolo(script, semilla, capsys):
+    datos = velas_aleatorias(100, semilla)
+    original = cargar_funciones(script, ['verificar_fuerza_tendencial_positiva'],
+                                obtener_datos_para_volume_regression=lambda symbol, periodo, velas: datos.tail(velas),
+                                volume_regression_ultimo=volume_regression_ultimo)
+
+    # Mismas velas que calcular_metricas_lateralizacion: 36 velas de 5 m, sin ATR
+    lote = calcular_metricas_lote(**apilar_velas([datos], 36), periodo_atr=None)
+    slope_price = float(lote['slope_price'][0])
+    esperada = original.verificar_fuerza_tendencial_positiva('BTCUSDT')
+    linea_original = capsys.readouterr().out.splitlines()[0]
+
+    veredicto = Puertas(funding=0.01).evaluar(dict(metricas(), slope_price=slope_price))
+    assert (veredicto['motivo'] != MOTIVO_TENDENCIA) == esperada
+    assert capsys.readouterr().out.splitlines()[0] == linea_original  # Misma pendiente impresa
+    assert slope_price == pytest.approx(volume_regression_ultimo(datos.tail(30))['slope_price'], rel=1e-9)
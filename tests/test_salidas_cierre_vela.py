@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicadores import VolumeRegressionIncremental, volume_regression_ultimo
+from scripts import SCRIPTS, cargar_funciones
+from velas import intervalo_a_ms
+
+ESTADOS = {"SIN_OPERAR": 0, "LONG_ABIERTO": 1, "ESPERANDO_SHORT": 2, "AMBOS_ABIERTOS": 3, "ADD_FUNDS_ACTIVO": 4}
+INTERVALO_MS = intervalo_a_ms('5')
+FUNCIONES = ['obtener_señales_volume_regression', 'salida_volume_regression', 'salida_cierre_vela',
+             'verificar_salidas_cierre_vela', 'salida_ultima_vela_cerrada', 'actualizar_indicadores_vela']
+SCRIPTS_CON_TP = [script for script in SCRIPTS if script != 'crypto_test.py']
+
+def velas_cerradas(cantidad, semilla, pendiente):
+    """Velas de 5 m cerradas con tendencia `pendiente` por vela en las últimas 10 (y alcista antes)"""
+    rng = np.random.default_rng(semilla)
+    pasos = np.where(np.arange(cantidad) < cantidad - 10, 0.5, pendiente) + rng.normal(0, 0.05, cantidad)
+    close = 100 + np.cumsum(pasos)
+    open_ = close - pasos
+    return pd.DataFrame({'timestamp': np.arange(cantidad, dtype=np.int64) * INTERVALO_MS, 'open': open_,
+                         'high': np.maximum(open_, close) + 0.1, 'low': np.minimum(open_, close) - 0.1,
+                         'close': close, 'volume': rng.uniform(1_000, 5_000, cantidad)})
+
+def con_vela_en_curso(cerradas, movimiento):
+    """Añade la vela en curso (la última fila de la API) con el cierre provisional desplazado `movimiento`"""
+    ultima = cerradas.iloc[-1]
+    close = ultima['close'] + movimiento
+    en_curso = {'timestamp': int(ultima['timestamp']) + INTERVALO_MS, 'open': ultima['close'],
+                'high': max(ultima['close'], close), 'low': min(ultima['close'], close), 'close': close,
+                'volume': 500.0}
+    return pd.concat([cerradas, pd.DataFrame([en_curso])], ignore_index=True)
+
+class BotPrueba:
+    """Funciones de salida de un script sobre velas REST fijadas por la prueba, con los cierres pedidos"""
+
+    def __init__(self, script, operacion):
+        self.operacion = operacion
+        self.velas = None
+        self.cierres = []
+        funciones = FUNCIONES + (['tp_avanzado_alcanzado'] if script in SCRIPTS_CON_TP else [])
+        self.f = cargar_funciones(
+            script, funciones, ESTADOS=ESTADOS, estados_volume_regression={},
+            operaciones_activas={'BTCUSDT': operacion}, intervalo_a_ms=intervalo_a_ms,
+            VolumeRegressionIncremental=VolumeRegressionIncremental, volume_regression_ultimo=volume_regression_ultimo,
+            obtener_datos_para_volume_regression=lambda symbol, periodo, limite: self.velas.tail(limite),
+            cerrar_posicion_long_real=lambda symbol, motivo: self.cierres.append(motivo) or True,
+            cerrar_ambas_posiciones_con_registro=lambda symbol, motivo: self.cierres.append(motivo) or True)
+
+    def calentar(self, velas):
+        """Estado incremental cargado en un ciclo anterior (con velas hasta la anterior a la evaluada)"""
+        self.velas = velas
+        self.f.obtener_señales_volume_regression('BTCUSDT')
+
+def decisiones(script, operacion, cerradas, movimiento, calentar):
+    """
+    (cierres por el stream, motivo del monitoreo sin stream) para la última vela de
+    `cerradas`, con la API devolviendo además una vela en curso desplazada `movimiento`
+    """
+    anterior = con_vela_en_curso(cerradas.iloc[:-1], -movimiento)
+    ahora = con_vela_en_curso(cerradas, movimiento)
+    stream, monitoreo = BotPrueba(script, dict(operacion)), BotPrueba(script, dict(operacion))
+    if calentar:
+        stream.calentar(anterior)
+        monitoreo.calentar(anterior)
+
+    # Stream: llega la vela cerrada y se despacha a los manejadores del bot
+    stream.velas = ahora
+    vela = cerradas.to_dict('records')[-1]
+    stream.f.actualizar_indicadores_vela('BTCUSDT', '5', vela)
+    stream.f.verificar_salidas_cierre_vela('BTCUSDT', '5', vela)
+
+    # Sin stream: el ciclo de 30 s solo tiene las velas por REST
+    monitoreo.velas = ahora
+    return stream.cierres, monitoreo.f.salida_ultima_vela_cerrada('BTCUSDT', monitoreo.operacion)
+
+# ========== VOLUME REGRESSION ==========
+
+@pytest.mark.parametrize('script', SCRIPTS)
+@pytest.mark.parametrize('pendiente, movimiento', [(0.5, -40.0), (-0.5, 40.0), (0.5, 0.0), (-0.5, 0.0)])
+@pytest.mark.parametrize('calentar', [False, True])
+@pytest.mark.parametrize('semilla', range(2))
+def test_volume_regression_misma_decision_con_y_sin_stream(script, pendiente, movimiento, calentar, semilla, capsys):
+    cerradas = velas_cerradas(80, semilla, pendiente)
+    operacion = {'estado': ESTADOS["LONG_ABIERTO"], 'precio_long': 100.0}  # Muy en ganancias: se evalúa VR
+    cierres, motivo = decisiones(script, operacion, cerradas, movimiento, calentar)
+
+    assert cierres == ([motivo] if motivo else [])
+    assert (motivo == "Volume Regression") == (pendiente < 0)  # Decide la vela cerrada, no la vela en curso
+
+def test_la_vela_en_curso_invertiria_la_decision(capsys):
+    """Sin evaluar la vela cerrada, la vela en curso daría la decisión contraria a la del stream"""
+    for pendiente, movimiento in [(0.5, -40.0), (-0.5, 40.0)]:
+        bot = BotPrueba('bot_serv.py', {'estado': ESTADOS["LONG_ABIERTO"], 'precio_long': 100.0})
+        bot.velas = con_vela_en_curso(velas_cerradas(80, 0, pendiente), movimiento)
+        señales = bot.f.obtener_señales_volume_regression
+        en_curso = bot.f.salida_volume_regression('BTCUSDT', señales('BTCUSDT'))
+        cerrada = bot.f.salida_volume_regression('BTCUSDT', señales('BTCUSDT', vela_en_curso=False))
+        assert en_curso != cerrada and cerrada == (pendiente < 0)
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_volume_regression_solo_con_ganancias_al_cierre(script, capsys):
+    cerradas = velas_cerradas(80, 0, -0.5)
+    precio_long = cerradas['close'].iloc[-1]  # Cierre sin el +1%; la vela en curso sí lo superaría
+    cierres, motivo = decisiones(script, {'estado': ESTADOS["LONG_ABIERTO"], 'precio_long': precio_long},
+                                 cerradas, 20.0, calentar=True)
+    assert cierres == [] and motivo is None
+
+# ========== TP AVANZADO ==========
+
+@pytest.mark.parametrize('script', SCRIPTS_CON_TP)
+@pytest.mark.parametrize('tp_long, tp_short, movimiento, esperado', [
+    (1.01, 0.90, 0.02, None),                  # Solo la vela en curso llega al TP Long
+    (0.99, 0.90, -0.02, "TP_LONG_AVANZADO"),   # El cierre lo alcanzó aunque la vela en curso retroceda
+    (1.10, 0.99, -0.02, None),                 # Solo la vela en curso llega al TP Short
+    (1.10, 1.01, 0.02, "TP_SHORT_AVANZADO"),
+])
+def test_tp_avanzado_misma_decision_con_y_sin_stream(script, tp_long, tp_short, movimiento, esperado, capsys):
+    cerradas = velas_cerradas(80, 0, 0.5)
+    close = cerradas['close'].iloc[-1]
+    operacion = {'estado': ESTADOS["AMBOS_ABIERTOS"], 'precio_long': close * 0.98, 'precio_short': close * 0.97,
+                 'tp_long_avanzado': close * tp_long, 'tp_short_avanzado': close * tp_short}
+    cierres, motivo = decisiones(script, operacion, cerradas, close * movimiento, calentar=True)
+    assert motivo == esperado and cierres == ([motivo] if motivo else [])
@@ -0,0 +1,244 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from coinalyze import MetricasConversion, convertir_tabla_coinalyze, tabla_a_dataframe
+from scripts import SCRIPTS, cargar_funciones
+
+CSV_GUARDADO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'coinalyze_data.csv')
+COLUMNAS = ['COIN', 'PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H',
+            'OI SHARE', 'OI / VOL24H', 'FR AVG', 'PFR AVG', 'LIQS. 24H']
+# Sexto criterio de cada script: bot_serv exige OI CHG 24H > 0, el resto CHG 24H > 0
+SEXTO_CRITERIO = {'bot_serv.py': 'oi_chg_24h', 'bot_servidor.py': 'chg_24h',
+                  'crypto_test.py': 'chg_24h', 'estadisticas.py': 'chg_24h'}
+
+# ========== IMPLEMENTACIÓN ORIGINAL (REFERENCIA) ==========
+
+def limpiar_y_convertir_valor(valor):
+    """Convierte valores como '$40.6m' a numérico"""
+    if not valor or valor == 'n/a' or valor == 'ERROR' or valor == '':
+        return 0
+
+    try:
+        valor_limpio = str(valor).replace('$', '').replace(',', '').replace(' ', '').strip()
+        if 'b' in valor_limpio.lower():
+            return float(valor_limpio.lower().replace('b', '')) * 1_000_000_000
+        elif 'm' in valor_limpio.lower():
+            return float(valor_limpio.lower().replace('m', '')) * 1_000_000
+        elif 'k' in valor_limpio.lower():
+            return float(valor_limpio.lower().replace('k', '')) * 1_000
+        else:
+            return float(valor_limpio)
+    except:
+        return 0
+
+def limpiar_porcentaje(valor):
+    """Convierte porcentajes como '+14.52%' a numérico"""
+    if not valor or valor == 'n/a' or valor == 'ERROR' or valor == '':
+        return 0
+
+    try:
+        valor_limpio = str(valor).replace('%', '').replace('+', '').replace(' ', '').strip()
+        return float(valor_limpio)
+    except:
+        return 0
+
+def comparar_original(df_actual, df_anterior, extraer_simbolo_de_moneda, sexto='oi_chg_24h'):
+    """
+    comparar_y_seleccionar_activos tal como estaba antes del cruce por símbolo
+    (bucle por filas con búsqueda lineal en la tabla anterior). Sobre tablas ya
+    convertidas las funciones limpiar_* devuelven el número tal cual.
+    """
+    activos_seleccionados = []
+
+    for idx_actual, fila_actual in df_actual.iterrows():
+        try:
+            moneda_completa = str(fila_actual['COIN'])
+            if not moneda_completa or moneda_completa == '' or moneda_completa == 'nan':
+                continue
+
+            simbolo = extraer_simbolo_de_moneda(moneda_completa)
+            if not simbolo:
+                continue
+
+            fila_anterior = None
+            for idx_ant, fila_ant in df_anterior.iterrows():
+                moneda_anterior_completa = str(fila_ant['COIN'])
+                simbolo_anterior = extraer_simbolo_de_moneda(moneda_anterior_completa)
+                if simbolo_anterior and simbolo_anterior == simbolo:
+                    fila_anterior = fila_ant
+                    break
+
+            if fila_anterior is None:
+                continue
+
+            price_actual = limpiar_y_convertir_valor(fila_actual['PRICE'])
+            chg_24h_actual = limpiar_porcentaje(fila_actual['CHG 24H'])
+            mkt_cap_actual = limpiar_y_convertir_valor(fila_actual['MKT CAP'])
+            vol_24h_actual = limpiar_y_convertir_valor(fila_actual['VOL 24H'])
+            open_interest_actual = limpiar_y_convertir_valor(fila_actual['OPEN INTEREST'])
+            oi_chg_24h_actual = limpiar_porcentaje(fila_actual['OI CHG 24H'])
+
+            price_anterior = limpiar_y_convertir_valor(fila_anterior['PRICE'])
+            oi_chg_24h_anterior = limpiar_porcentaje(fila_anterior['OI CHG 24H'])
+
+            oi_vol_ratio = open_interest_actual / vol_24h_actual if vol_24h_actual > 0 else float('inf')
+
+            criterios = [
+                price_actual > price_anterior,
+                oi_chg_24h_actual > oi_chg_24h_anterior,
+                oi_vol_ratio < 0.30,
+                mkt_cap_actual > 50_000_000,
+                chg_24h_actual > 3,
+                (oi_chg_24h_actual if sexto == 'oi_chg_24h' else chg_24h_actual) > 0
+            ]
+
+            if all(criterios):
+                activos_seleccionados.append({
+                    'moneda': moneda_completa,
+                    'simbolo': simbolo,
+                    'price': price_actual,
+                    'chg_24h': chg_24h_actual,
+                    'mkt_cap': mkt_cap_actual,
+                    'oi_chg_24h': oi_chg_24h_actual,
+                    'oi_vol_ratio': oi_vol_ratio,
+                    'open_interest': open_interest_actual,
+                    'vol_24h': vol_24h_actual
+                })
+
+        except Exception as e:
+            continue
+
+    return activos_seleccionados
+
+# ========== DATOS ==========
+
+@pytest.fixture(scope='module', params=SCRIPTS)
+def script(request):
+    funciones = cargar_funciones(request.param, ['comparar_y_seleccionar_activos', 'extraer_simbolo_de_moneda'],
+                                 np=np)
+    funciones.nombre = request.param
+    return funciones
+
+@pytest.fixture(scope='module')
+def tabla_cruda():
+    guardado = pd.read_csv(CSV_GUARDADO, dtype=str, keep_default_na=False)
+    return tabla_a_dataframe(COLUMNAS, guardado.values.tolist())
+
+@pytest.fixture(scope='module')
+def tabla(tabla_cruda):
+    return convertir_tabla_coinalyze(tabla_cruda, metricas=MetricasConversion())
+
+def par_aleatorio(tabla, semilla):
+    """
+    Snapshot actual y anterior a partir de la tabla guardada: precios y cambios
+    movidos al azar, filas repetidas y desordenadas, volumen 0, celdas sin dato y
+    monedas vacías o sin símbolo
+    """
+    rng = np.random.default_rng(semilla)
+    actual = tabla.copy()
+    actual['PRICE'] *= rng.uniform(0.97, 1.03, len(actual))
+    actual['CHG 24H'] += rng.normal(0, 3, len(actual))
+    actual['OI CHG 24H'] += rng.normal(0, 5, len(actual))
+    actual.loc[rng.choice(len(actual), 6, replace=False), 'VOL 24H'] = 0.0
+    actual.loc[rng.choice(len(actual), 4, replace=False), 'PRICE'] = np.nan
+    actual = pd.concat([actual, actual.sample(10, random_state=semilla)])
+    actual = actual.sample(frac=1, random_state=semilla).reset_index(drop=True)
+    actual.loc[rng.choice(len(actual), 3, replace=False), 'COIN'] = ['', 'nan', '???']
+
+    anterior = tabla.sample(90, replace=True, random_state=semilla + 1).reset_index(drop=True)
+    anterior['PRICE'] *= rng.uniform(0.95, 1.02, len(anterior))
+    anterior['OI CHG 24H'] += rng.normal(-3, 5, len(anterior))
+    anterior.loc[rng.choice(len(anterior), 4, replace=False), 'OI CHG 24H'] = np.nan
+    return actual, anterior
+
+def fila(coin, price=10.0, chg=5.0, mkt_cap=1e8, vol=1e6, oi=1e5, oi_chg=10.0):
+    return {'COIN': coin, 'PRICE': price, 'CHG 24H': chg, 'MKT CAP': mkt_cap, 'VOL 24H': vol,
+            'OPEN INTEREST': oi, 'OI CHG 24H': oi_chg}
+
+def simbolos(seleccion):
+    return [activo['simbolo'] for activo in seleccion]
+
+# ========== IGUAL QUE EL BUCLE ORIGINAL ==========
+
+@pytest.mark.parametrize('semilla', range(8))
+def test_igual_que_el_bucle_original(script, tabla, semilla):
+    actual, anterior = par_aleatorio(tabla, semilla)
+    esperado = comparar_original(actual, anterior, script.extraer_simbolo_de_moneda, SEXTO_CRITERIO[script.nombre])
+    assert script.comparar_y_seleccionar_activos(actual, anterior) == esperado
+
+def test_los_pares_aleatorios_seleccionan_activos(script, tabla):
+    seleccionados = sum(len(script.comparar_y_seleccionar_activos(*par_aleatorio(tabla, semilla)))
+                        for semilla in range(8))
+    assert seleccionados >= 8  # Las comparaciones con el bucle original no son triviales
+
+def test_primera_fila_por_simbolo_anterior(script):
+    actual = pd.DataFrame([fila('Bitcoin BTC', price=10.0)])
+    anterior = pd.DataFrame([fila('Bitcoin BTC', price=9.0, oi_chg=1.0), fila('Wrapped BTC', price=11.0, oi_chg=1.0)])
+    assert simbolos(script.comparar_y_seleccionar_activos(actual, anterior)) == ['BTC']
+    assert script.comparar_y_seleccionar_activos(actual, anterior.iloc[::-1]) == []
+
+def test_orden_de_la_tabla_actual(script):
+    actual = pd.DataFrame([fila('Solana SOL'), fila('Bitcoin BTC'), fila('Ether ETH'), fila('Solana SOL')])
+    anterior = pd.DataFrame([fila(coin, price=5.0, oi_chg=1.0) for coin in ('Ether ETH', 'Bitcoin BTC', 'Solana SOL')])
+    assert simbolos(script.comparar_y_seleccionar_activos(actual, anterior)) == ['SOL', 'BTC', 'ETH', 'SOL']
+
+def test_volumen_cero_es_ratio_infinito(script):
+    anterior = pd.DataFrame([fila('Bitcoin BTC', price=5.0, oi_chg=1.0)])
+    assert script.comparar_y_seleccionar_activos(pd.DataFrame([fila('Bitcoin BTC', vol=0.0)]), anterior) == []
+    activo, = script.comparar_y_seleccionar_activos(pd.DataFrame([fila('Bitcoin BTC', vol=1e6, oi=2e5)]), anterior)
+    assert activo['oi_vol_ratio'] == pytest.approx(0.2)
+
+def test_sexto_criterio_de_cada_script(script):
+    # OI CHG 24H sube pero sigue negativo: solo bot_serv lo descarta
+    actual = pd.DataFrame([fila('Bitcoin BTC', oi_chg=-1.0)])
+    anterior = pd.DataFrame([fila('Bitcoin BTC', price=5.0, oi_chg=-5.0)])
+    seleccion = simbolos(script.comparar_y_seleccionar_activos(actual, anterior))
+    assert seleccion == ([] if SEXTO_CRITERIO[script.nombre] == 'oi_chg_24h' else ['BTC'])
+
+def test_faltan_columnas(script, capsys):
+    actual = pd.DataFrame([fila('Bitcoin BTC')]).drop(columns=['VOL 24H'])
+    anterior = pd.DataFrame([fila('Bitcoin BTC')]).drop(columns=['OI CHG 24H'])
+    assert script.comparar_y_seleccionar_activos(actual, anterior) == []
+    assert "Faltan columnas para comparar: ['VOL 24H', 'OI CHG 24H']" in capsys.readouterr().out
+
+def test_sin_datos_anteriores(script, capsys):
+    actual = pd.DataFrame([fila('Bitcoin BTC')])
+    assert script.comparar_y_seleccionar_activos(actual, None) == []
+    assert script.comparar_y_seleccionar_activos(actual, pd.DataFrame()) == []
+    assert 'Primera ejecución' in capsys.readouterr().out
+
+# ========== CELDAS SIN DATO (CONVERSIÓN POR COLUMNAS) ==========
+
+COMPARADAS = ['PRICE', 'CHG 24H', 'MKT CAP', 'VOL 24H', 'OPEN INTEREST', 'OI CHG 24H']
+
+def convertir(df):
+    return convertir_tabla_coinalyze(df, metricas=MetricasConversion())
+
+def test_precio_anterior_sin_dato_no_cuenta_como_subida(script):
+    actual = pd.DataFrame([{'COIN': 'Bitcoin BTC', 'PRICE': '$10', 'CHG 24H': '+5%', 'MKT CAP': '$100m',
+                            'VOL 24H': '$1m', 'OPEN INTEREST': '$100k', 'OI CHG 24H': '+10%'}])
+    anterior = pd.DataFrame([{'COIN': 'Bitcoin BTC', 'PRICE': 'n/a', 'OI CHG 24H': '+1%'}])
+    assert script.comparar_y_seleccionar_activos(convertir(actual), convertir(anterior)) == []
+
+    # Con el parseo por celda 'n/a' era 0 y el precio "subía"
+    original = comparar_original(actual, anterior, script.extraer_simbolo_de_moneda, SEXTO_CRITERIO[script.nombre])
+    assert simbolos(original) == ['BTC']
+
+@pytest.mark.parametrize('semilla', range(4))
+def test_igual_que_el_parseo_por_celda_sin_celdas_sin_dato(script, tabla_cruda, semilla):
+    """Sin celdas n/a, vacías o ERROR en las columnas comparadas la selección no cambia"""
+    completa = tabla_cruda[~tabla_cruda[COMPARADAS].isin(['', 'n/a', 'ERROR']).any(axis=1)].reset_index(drop=True)
+    rng = np.random.default_rng(semilla)
+    anterior = completa.copy()
+    for columna in ('PRICE', 'OI CHG 24H'):  # Valores de otras monedas, como textos de CoinAlyze
+        anterior[columna] = completa[columna].to_numpy()[rng.permutation(len(completa))]
+
+    esperado = comparar_original(completa, anterior, script.extraer_simbolo_de_moneda,
+                                 SEXTO_CRITERIO[script.nombre])
+    obtenido = script.comparar_y_seleccionar_activos(convertir(completa), convertir(anterior))
+    assert simbolos(obtenido) == simbolos(esperado) and len(esperado) > 0
+    for nuevo, original in zip(obtenido, esperado):
+        assert nuevo == pytest.approx(original, rel=1e-12)
@@ -0,0 +1,185 @@
+import time
+
+import numpy as np
+import pytest
+
+from instrumentos import CacheInstrumentos
+from simulador import (MINUTO_MS, ExchangeSimulado, InvalidRequestError, crear_exchange_simulado,
+                       trayectoria_sintetica)
+from velas import ArchivoVelas, CacheVelas
+
+def trayectoria_conocida(minutos=600):
+    """Precio que sube 0.1 por minuto desde 100 y luego baja: TP, SL y límites predecibles"""
+    subida = 100 + 0.1 * np.arange(minutos + 1)
+    cierres = np.concatenate((subida[1:], subida[-2::-1][:minutos]))
+    aperturas = np.concatenate(([100.0], cierres[:-1]))
+    valores = np.column_stack([aperturas, np.maximum(aperturas, cierres), np.minimum(aperturas, cierres),
+                               cierres, np.full(len(cierres), 10.0), cierres * 10])
+    return np.arange(len(cierres), dtype=np.int64) * MINUTO_MS, valores
+
+@pytest.fixture
+def exchange():
+    trayectorias = {'TESTUSDT': trayectoria_conocida(), 'OTROUSDT': trayectoria_sintetica(20.0, 1200, semilla=1)}
+    return ExchangeSimulado(trayectorias, velocidad=0, inicio_ms=300 * MINUTO_MS, saldo_inicial=1000)
+
+def precio(exchange, symbol='TESTUSDT'):
+    return float(exchange.get_tickers(category="linear", symbol=symbol)['result']['list'][0]['lastPrice'])
+
+def posicion(exchange, symbol='TESTUSDT'):
+    return exchange.get_positions(category="linear", symbol=symbol)['result']['list']
+
+# ========== MERCADO ==========
+
+def test_klines_agregadas(exchange):
+    velas = exchange.get_kline(category="linear", symbol="TESTUSDT", interval="5", limit=3)['result']['list']
+    inicios = [int(v[0]) for v in velas]
+    assert len(velas) == 3 and inicios[0] > inicios[1] > inicios[2] and inicios[0] % (5 * MINUTO_MS) == 0
+    assert float(velas[1][4]) - float(velas[2][4]) == pytest.approx(0.5)
+    assert float(velas[1][5]) == 50.0  # Volumen de 5 velas base
+
+    desde = exchange.get_kline(category="linear", symbol="TESTUSDT", interval="5", limit=100,
+                               start=inicios[1])['result']['list']
+    assert [int(v[0]) for v in desde] == inicios[:2]
+    hasta = exchange.get_kline(category="linear", symbol="TESTUSDT", interval="5", limit=100,
+                               start=inicios[2], end=inicios[1])['result']['list']
+    assert [int(v[0]) for v in hasta] == inicios[1:]
+
+def test_klines_con_la_cache_de_velas(exchange):
+    datos = CacheVelas(limite_minimo=50).obtener(exchange, "TESTUSDT", "5", 50)
+    assert len(datos) == 50 and datos['close'].is_monotonic_increasing
+    assert datos['close'].iloc[-1] == pytest.approx(precio(exchange))
+
+def test_klines_rechazos(exchange):
+    with pytest.raises(InvalidRequestError, match="symbol invalid"):
+        exchange.get_kline(category="linear", symbol="NOEXISTE", interval="5")
+    with pytest.raises(InvalidRequestError, match="not supported"):
+        exchange.get_kline(category="linear", symbol="TESTUSDT", interval="M")
+
+def test_tickers_y_reloj(exchange):
+    tickers = exchange.get_tickers(category="linear")['result']['list']
+    assert {t['symbol'] for t in tickers} == {'TESTUSDT', 'OTROUSDT'}
+    inicial = precio(exchange)
+    assert precio(exchange) == inicial  # Reloj parado
+    exchange.avanzar(10 * 60)
+    assert precio(exchange) == pytest.approx(inicial + 1)
+    assert int(tickers[0]['nextFundingTime']) > exchange.ahora_ms()
+
+def test_instrumentos_paginados(exchange):
+    paginado = exchange.get_instruments_info
+    exchange.get_instruments_info = lambda **kw: paginado(**{**kw, 'limit': 1})
+    cache = CacheInstrumentos()
+    assert cache.actualizar(exchange) and cache.simbolos == {'TESTUSDT', 'OTROUSDT'}
+    assert exchange.llamadas['consulta'] == 2
+
+# ========== ÓRDENES Y POSICIONES ==========
+
+def test_take_profit_en_hedge_mode(exchange):
+    exchange.switch_position_mode(category="linear", coin="USDT", mode=3)
+    entrada = precio(exchange)
+    orden = exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", orderType="Market",
+                                 qty="1", positionIdx=1)['result']['orderId']
+    historial = exchange.get_order_history(category="linear", symbol="TESTUSDT", orderId=orden)['result']['list']
+    assert historial[0]['orderStatus'] == 'Filled' and float(historial[0]['avgPrice']) == entrada
+
+    exchange.set_trading_stop(category="linear", symbol="TESTUSDT", takeProfit=str(entrada + 1), positionIdx=1)
+    exchange.avanzar(15 * 60)
+    assert [float(p['size']) for p in posicion(exchange)] == [0, 0]
+    assert 1000 < exchange.resumen()['saldo'] < 1001  # +1 USDT menos comisiones
+    tp = exchange.get_order_history(category="linear", symbol="TESTUSDT", limit=1)['result']['list'][0]
+    assert tp['stopOrderType'] == 'TakeProfit' and float(tp['avgPrice']) == entrada + 1
+
+    # Cerrar sin posición se rechaza igual que en Bybit
+    with pytest.raises(InvalidRequestError, match="position is zero"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Sell", orderType="Market",
+                             qty="1", positionIdx=1)
+
+def test_stop_loss_en_one_way(exchange):
+    exchange.avanzar(300 * 60)  # Pasado el máximo, el precio baja 0.1 por minuto
+    entrada = precio(exchange)
+    exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", orderType="Market", qty="2")
+    with pytest.raises(InvalidRequestError, match="higher than base_price"):
+        exchange.set_trading_stop(category="linear", symbol="TESTUSDT", takeProfit=str(entrada - 1))
+    exchange.set_trading_stop(category="linear", symbol="TESTUSDT", stopLoss=str(entrada - 1))
+    exchange.avanzar(20 * 60)
+
+    assert float(posicion(exchange)[0]['size']) == 0
+    assert exchange.resumen()['saldo'] == pytest.approx(1000 - 2 - 2 * (entrada + entrada - 1) * 0.00055)
+
+def test_orden_limite_y_cancelacion(exchange):
+    exchange.switch_position_mode(category="linear", coin="USDT", mode=3)
+    exchange.avanzar(300 * 60)
+    actual = precio(exchange)
+    exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", orderType="Limit",
+                         qty="1", price=str(actual - 2), positionIdx=1)
+    cancelada = exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", orderType="Limit",
+                                     qty="1", price=str(actual - 50), positionIdx=1,
+                                     orderLinkId='lejana')['result']['orderId']
+    assert len(exchange.get_open_orders(category="linear", symbol="TESTUSDT")['result']['list']) == 2
+    exchange.cancel_order(category="linear", symbol="TESTUSDT", orderLinkId='lejana')
+    with pytest.raises(InvalidRequestError, match="not exists"):
+        exchange.cancel_order(category="linear", symbol="TESTUSDT", orderId=cancelada)
+
+    exchange.avanzar(30 * 60)
+    assert exchange.get_open_orders(category="linear", symbol="TESTUSDT")['result']['list'] == []
+    abierta = exchange.get_positions(category="linear", settleCoin="USDT")['result']['list'][0]
+    assert float(abierta['avgPrice']) == actual - 2 and float(abierta['unrealisedPnl']) < 0
+
+def test_rechazos_de_ordenes(exchange):
+    with pytest.raises(InvalidRequestError, match="position idx"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="1", positionIdx=1)
+    with pytest.raises(InvalidRequestError, match="minimum order value"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="0.01")
+    with pytest.raises(InvalidRequestError, match="too many decimals"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="1.0001")
+    with pytest.raises(InvalidRequestError, match="ab not enough"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="100")
+    with pytest.raises(InvalidRequestError, match="symbol or settleCoin"):
+        exchange.get_positions(category="linear")
+
+    exchange.set_leverage(category="linear", symbol="TESTUSDT", buyLeverage="5", sellLeverage="5")
+    with pytest.raises(InvalidRequestError, match="leverage not modified"):
+        exchange.set_leverage(category="linear", symbol="TESTUSDT", buyLeverage="5", sellLeverage="5")
+
+    exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="1")
+    with pytest.raises(InvalidRequestError, match="not modified"):
+        exchange.switch_position_mode(category="linear", coin="USDT", mode=3)
+    with pytest.raises(InvalidRequestError, match="same side"):
+        exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="1", reduceOnly=True)
+    assert exchange.resumen()['posiciones'] == 1
+
+def test_saldo_de_la_cartera(exchange):
+    exchange.place_order(category="linear", symbol="TESTUSDT", side="Buy", qty="1")
+    exchange.avanzar(10 * 60)
+    cartera = exchange.get_wallet_balance(accountType="UNIFIED")['result']['list'][0]
+    moneda = cartera['coin'][0]
+    assert float(moneda['unrealisedPnl']) == pytest.approx(1.0)
+    assert float(moneda['equity']) == pytest.approx(float(moneda['walletBalance']) + 1)
+    assert float(cartera['totalAvailableBalance']) < float(moneda['walletBalance'])
+
+# ========== LÍMITES, ARCHIVO Y CONFIGURACIÓN ==========
+
+def test_limite_de_peticiones():
+    limitado = ExchangeSimulado({'TESTUSDT': trayectoria_conocida()}, limites={'consulta': 20})
+    inicio = time.time()
+    for _ in range(30):
+        limitado.get_tickers(category="linear")
+    assert limitado.esperas_limite == 10 and time.time() - inicio >= 0.45
+
+def test_desde_archivo(tmp_path):
+    archivo = ArchivoVelas(str(tmp_path))
+    archivo.agregar('TESTUSDT', '1', *trayectoria_conocida())
+    exchange = ExchangeSimulado.desde_archivo(archivo, ['TESTUSDT', 'SINDATOS'], velocidad=0, inicio_ms=0)
+    assert list(exchange.instrumentos) == ['TESTUSDT']
+    assert 100 <= precio(exchange) < 106  # El reloj arranca dentro de la primera hora grabada
+    with pytest.raises(ValueError):
+        ExchangeSimulado.desde_archivo(archivo, ['SINDATOS'])
+
+def test_crear_exchange_simulado(monkeypatch):
+    monkeypatch.setenv("SIMULADOR_SYMBOLS", "BTCUSDT:60000, ETHUSDT:3000")
+    monkeypatch.setenv("SIMULADOR_SEMILLA", "7")
+    monkeypatch.setenv("SIMULADOR_SALDO", "250")
+    monkeypatch.setenv("SIMULADOR_LIMITE_ORDENES", "5")
+    exchange = crear_exchange_simulado()
+    assert set(exchange.instrumentos) == {'BTCUSDT', 'ETHUSDT'} and exchange.saldo == 250
+    assert exchange.limites == {'consulta': 120, 'orden': 5}
+    assert 50000 < precio(exchange, 'BTCUSDT') < 70000
@@ -0,0 +1,189 @@
+import time
+
+import numpy as np
+import pytest
+
+from servidor_ws import ServidorTickersLocal
+from tickers import PYBIT_WEBSOCKET, AlmacenFunding, SnapshotTickers, StreamTickers, TablaPrecios
+
+class SesionRESTPrueba:
+    """Sustituto de pybit.HTTP con solo get_tickers; los símbolos que no están en `precios` no existen"""
+
+    def __init__(self, precios, proximo_funding=1700000000000):
+        self.precios = precios
+        self.funding = {}
+        self.proximo_funding = proximo_funding
+        self.llamadas = []
+
+    def get_tickers(self, category, symbol=None):
+        self.llamadas.append(symbol)
+        symbols = [symbol] if symbol else list(self.precios)
+        return {'retCode': 0, 'result': {'list': [
+            {'symbol': s, 'lastPrice': str(self.precios[s]), 'markPrice': str(self.precios[s]),
+             'turnover24h': '1000000', 'fundingRate': self.funding.get(s, '0.0001'),
+             'nextFundingTime': str(self.proximo_funding)}
+            for s in symbols if s in self.precios
+        ]}}
+
+def esperar(condicion, limite=5.0):
+    fin = time.time() + limite
+    while time.time() < fin:
+        if condicion():
+            return True
+        time.sleep(0.05)
+    return False
+
+def en_un_minuto():
+    return int(time.time() * 1000) + 60_000
+
+# ========== TABLA DE PRECIOS Y SNAPSHOT ==========
+
+def test_tabla_precios():
+    tabla = TablaPrecios()
+    tabla.actualizar({'symbol': 'BTCUSDT', 'lastPrice': '100', 'markPrice': '100.5'})
+    tabla.actualizar({'symbol': 'BTCUSDT', 'lastPrice': '', 'markPrice': '101'})  # Delta sin lastPrice
+    tabla.actualizar({'lastPrice': '5'})
+    entrada = tabla.obtener('BTCUSDT')
+    assert entrada['lastPrice'] == 100.0 and entrada['markPrice'] == 101.0
+    assert tabla.obtener('ETHUSDT') is None
+
+    entrada['lastPrice'] = 0  # Es una copia
+    assert tabla.obtener('BTCUSDT')['lastPrice'] == 100.0
+    time.sleep(0.05)
+    assert tabla.obtener('BTCUSDT', max_edad=0.01) is None
+
+def test_snapshot_tickers():
+    rest = SesionRESTPrueba({'BTCUSDT': 100.0, 'ETHUSDT': 2000.0})
+    rest.funding['ETHUSDT'] = ''
+    snapshot = SnapshotTickers(max_edad=0.2)
+    assert snapshot.obtener('BTCUSDT') is None
+    assert snapshot.actualizar(rest) and rest.llamadas == [None] and snapshot.descargas == 1
+
+    btc = snapshot.obtener('BTCUSDT')
+    assert btc['lastPrice'] == 100.0 and btc['turnover24h'] == 1e6 and btc['fundingRate'] == 0.0001
+    assert btc['nextFundingTime'] == 1700000000000
+    assert np.isnan(snapshot.obtener('ETHUSDT')['fundingRate'])
+    assert snapshot.obtener('NOEXISTE') is None
+
+    time.sleep(0.25)
+    assert snapshot.obtener('BTCUSDT') is None
+
+def test_snapshot_error_de_bybit(capsys):
+    class SesionConError:
+        def get_tickers(self, category, symbol=None):
+            return {'retCode': 10006, 'retMsg': 'Too many visits'}
+
+    snapshot = SnapshotTickers()
+    assert not snapshot.actualizar(SesionConError()) and snapshot.descargas == 0
+    assert 'Too many visits' in capsys.readouterr().out
+
+# ========== FUNDING ==========
+
+def test_funding_del_snapshot_sin_llamadas():
+    rest = SesionRESTPrueba({'BTCUSDT': 100.0, 'ETHUSDT': 2000.0}, proximo_funding=en_un_minuto())
+    rest.funding['ETHUSDT'] = '-0.00025'
+    snapshot = SnapshotTickers()
+    funding = AlmacenFunding(snapshot)
+    assert funding.funding_rate('BTCUSDT') is None
+
+    snapshot.actualizar(rest)
+    assert funding.funding_rate('BTCUSDT', rest) == pytest.approx(0.01, abs=1e-12)
+    assert funding.funding_rate('ETHUSDT', rest) == pytest.approx(-0.025, abs=1e-12)
+    assert rest.llamadas == [None] and funding.recargas == 0
+
+def test_funding_vencido_recarga_una_vez_por_snapshot():
+    rest = SesionRESTPrueba({'BTCUSDT': 100.0, 'ETHUSDT': 2000.0})  # Hora de funding ya pasada
+    snapshot = SnapshotTickers()
+    funding = AlmacenFunding(snapshot)
+    snapshot.actualizar(rest)
+
+    # El snapshot nuevo trae la misma hora (Bybit aún no la ha movido): no se recarga por cada símbolo
+    for symbol in ('BTCUSDT', 'ETHUSDT', 'BTCUSDT'):
+        assert funding.funding_rate(symbol, rest) == pytest.approx(0.01, abs=1e-12)
+    assert rest.llamadas == [None, None] and funding.recargas == 1
+
+    rest.proximo_funding = en_un_minuto()
+    rest.funding['BTCUSDT'] = '0.0003'
+    snapshot.actualizar(rest)  # Snapshot del ciclo siguiente
+    assert funding.funding_rate('BTCUSDT', rest) == pytest.approx(0.03, abs=1e-12)
+    assert funding.funding_rate('ETHUSDT', rest) == pytest.approx(0.01, abs=1e-12)
+    assert len(rest.llamadas) == 3 and funding.recargas == 1
+
+def test_funding_simbolo_fuera_del_snapshot():
+    rest = SesionRESTPrueba({'BTCUSDT': 100.0}, proximo_funding=en_un_minuto())
+    snapshot = SnapshotTickers()
+    funding = AlmacenFunding(snapshot)
+    snapshot.actualizar(rest)
+
+    # Deslistado: una sola consulta individual, sin recargar el snapshot completo
+    for _ in range(3):
+        assert funding.funding_rate('NOEXISTE', rest) is None
+    assert rest.llamadas == [None, 'NOEXISTE'] and funding.recargas == 0
+    assert funding.consultas_individuales == 1 and funding.ausentes == {'NOEXISTE'}
+
+    # Listado después del snapshot: se consulta solo y queda guardado
+    rest.precios['NUEVOUSDT'] = 1.0
+    assert funding.funding_rate('NUEVOUSDT', rest) == pytest.approx(0.01, abs=1e-12)
+    assert funding.funding_rate('NUEVOUSDT', rest) == pytest.approx(0.01, abs=1e-12)
+    assert rest.llamadas[-1] == 'NUEVOUSDT' and funding.consultas_individuales == 2
+
+    # Con el snapshot siguiente se vuelve a intentar el ausente
+    snapshot.actualizar(rest)
+    assert funding.funding_rate('NOEXISTE', rest) is None and funding.consultas_individuales == 3
+
+def test_funding_consulta_individual_con_error(capsys):
+    class SesionCaida:
+        def get_tickers(self, category, symbol=None):
+            raise ConnectionError("sin red")
+
+    funding = AlmacenFunding(SnapshotTickers())
+    assert funding.funding_rate('BTCUSDT', SesionCaida()) is None and funding.ausentes == {'BTCUSDT'}
+    assert 'sin red' in capsys.readouterr().out
+
+# ========== STREAM CONTRA EL SERVIDOR LOCAL ==========
+
+@pytest.fixture
+def servidor():
+    servidor = ServidorTickersLocal().iniciar()
+    yield servidor
+    servidor.detener()
+
+@pytest.mark.skipif(not PYBIT_WEBSOCKET, reason="pybit no instalado")
+def test_stream_contra_servidor_local(servidor):
+    servidor.publicar('BTCUSDT', 100.0, 100.5)
+    rest = SesionRESTPrueba({'BTCUSDT': 99.0})
+    stream = StreamTickers(max_edad=1.0)
+
+    try:
+        assert stream.iniciar(url=servidor.url), "No se pudo conectar al servidor local"
+        assert stream.conectado()
+
+        # Primera lectura: aún sin dato del stream -> REST y suscripción
+        assert stream.precio('BTCUSDT', rest) == 99.0 and len(rest.llamadas) == 1
+        assert esperar(lambda: (stream.tabla.obtener('BTCUSDT') or {}).get('lastPrice') == 100.0), \
+            "El stream no actualizó la tabla"
+
+        # Con dato fresco no hay llamadas REST y los cambios llegan por el stream
+        servidor.publicar('BTCUSDT', 101.0, 101.2)
+        assert esperar(lambda: stream.precio('BTCUSDT', rest) == 101.0), "El stream no reflejó el nuevo precio"
+        assert stream.tabla.obtener('BTCUSDT')['markPrice'] == 101.2
+        assert len(rest.llamadas) == 1 and stream.lecturas_ws >= 1
+
+        # Sin emisiones el dato envejece y se recurre a REST
+        servidor.retirar('BTCUSDT')
+        time.sleep(stream.max_edad + 0.3)
+        assert stream.precio('BTCUSDT', rest) == 99.0 and len(rest.llamadas) == 2
+        assert stream.lecturas_rest == 2
+    finally:
+        stream.detener()
+    assert not stream.conectado()
+
+def test_stream_lee_del_snapshot_antes_que_rest():
+    rest = SesionRESTPrueba({'BTCUSDT': 100.0, 'ETHUSDT': 2000.0})
+    stream = StreamTickers(snapshot=SnapshotTickers())  # Sin iniciar: no hay WebSocket
+    assert stream.precio('ETHUSDT') is None
+
+    stream.snapshot.actualizar(rest)
+    assert stream.precio('ETHUSDT', rest) == 2000.0 and stream.precio('BTCUSDT', rest) == 100.0
+    assert rest.llamadas == [None] and stream.lecturas_snapshot == 2
+    assert stream.precio('NOEXISTE', rest) is None and rest.llamadas == [None, 'NOEXISTE']
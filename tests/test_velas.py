@@ -0,0 +1,296 @@
+import os
+import types
+
+import numpy as np
+import pytest
+
+import velas
+from velas import (COLUMNAS_VELA, DIRECTORIO_ARCHIVO, DTYPE_ARCHIVO, ArchivoVelas, BufferVelas, CacheVelas,
+                   archivo_de_sesion, intervalo_a_ms, parsear_klines)
+
+MINUTO = 60 * 1000
+DURACION = 5 * MINUTO
+INICIO = 1_700_000_100_000 // DURACION * DURACION  # Apertura de una vela de 5 minutos
+
+class Reloj:
+    def __init__(self, ms):
+        self.ms = ms
+
+    def __call__(self):
+        return self.ms / 1000
+
+    def avanzar(self, ms):
+        self.ms += ms
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj(INICIO + 2 * MINUTO)  # 2 minutos dentro de la vela en curso
+    monkeypatch.setattr(velas, 'time', types.SimpleNamespace(time=reloj))
+    return reloj
+
+def vela(timestamp, ahora_ms):
+    """Vela determinista; la vela en curso cambia de cierre y volumen a medida que avanza"""
+    base = 100 + (timestamp // DURACION) % 97
+    avance = min(ahora_ms - timestamp, DURACION) / DURACION
+    close = base + avance
+    return [str(timestamp), str(base), str(base + 2), str(base - 1), str(close), str(1000 * avance), str(base * 1000)]
+
+class SesionVelasPrueba:
+    """
+    Sustituto de HTTP de pybit para get_kline: velas desde `INICIO - 2000` velas
+    hasta la que está en curso según el reloj, más recientes primero. `sin_velas`:
+    timestamps que el exchange no tiene (pausa de trading); `perdidas`: timestamps
+    que faltan solo en la próxima respuesta.
+    """
+
+    def __init__(self, reloj, sin_velas=(), error=False):
+        self.reloj = reloj
+        self.sin_velas = set(sin_velas)
+        self.perdidas = set()
+        self.error = error
+        self.peticiones = []
+
+    def get_kline(self, category, symbol, interval, limit, start=None, end=None):
+        self.peticiones.append({'limit': limit, 'start': start, 'end': end})
+        if self.error:
+            return {'retCode': 10001, 'retMsg': 'params error'}
+        ahora = self.reloj.ms
+        en_curso = ahora // DURACION * DURACION
+        desde = start if start is not None else INICIO - 2000 * DURACION
+        hasta = min(end if end is not None else en_curso, en_curso)
+        timestamps = [t for t in range(desde, hasta + 1, DURACION)
+                      if t not in self.sin_velas and t not in self.perdidas][-limit:]
+        self.perdidas = set()
+        return {'retCode': 0, 'result': {'list': [vela(t, ahora) for t in reversed(timestamps)]}}
+
+def esperadas(desde, hasta, ahora_ms):
+    return np.array([[float(valor) for valor in vela(t, ahora_ms)[1:]] for t in range(desde, hasta + 1, DURACION)])
+
+def iguales(df, valores):
+    """pd.to_numeric puede diferir de float() en el último bit"""
+    return np.allclose(df[COLUMNAS_VELA[1:]].to_numpy(), valores, rtol=1e-12, atol=0)
+
+# ========== UTILIDADES ==========
+
+def test_intervalo_a_ms():
+    assert intervalo_a_ms('5') == DURACION and intervalo_a_ms(60) == 60 * MINUTO
+    assert intervalo_a_ms('D') == 24 * 60 * MINUTO and intervalo_a_ms('W') == 7 * 24 * 60 * MINUTO
+    assert intervalo_a_ms('M') is None
+
+def test_parsear_klines_cronologico():
+    lista = [vela(INICIO + i * DURACION, INICIO) for i in (2, 1, 0)]
+    lista[1][5] = ''
+    timestamps, valores = parsear_klines(lista)
+    assert timestamps.tolist() == [INICIO, INICIO + DURACION, INICIO + 2 * DURACION]
+    assert valores.shape == (3, len(COLUMNAS_VELA) - 1) and np.isnan(valores[1, 4])
+    assert parsear_klines([])[0].shape == (0,)
+
+# ========== BUFFER CIRCULAR ==========
+
+def test_buffer_velas_circular():
+    buffer = BufferVelas(capacidad=5)
+    assert buffer.ultimo_timestamp() is None and len(buffer.ultimas(3)) == 0
+    timestamps = np.arange(8, dtype=np.int64) * DURACION
+    valores = np.arange(8 * 6, dtype=float).reshape(8, 6)
+
+    assert buffer.fusionar(timestamps[:3], valores[:3], DURACION) is None
+    assert buffer.fusionar(timestamps[2:], valores[2:] + 0.5, DURACION) is None  # La 2 estaba en curso
+    assert len(buffer) == 5 and buffer.ultimo_timestamp() == timestamps[-1]
+    df = buffer.ultimas(10)
+    assert df['timestamp'].tolist() == timestamps[3:].tolist()
+    assert np.array_equal(df[COLUMNAS_VELA[1:]].to_numpy(), valores[3:] + 0.5)
+    assert buffer.ultimas(2)['timestamp'].tolist() == timestamps[-2:].tolist()
+
+def test_buffer_velas_huecos():
+    buffer = BufferVelas(capacidad=10)
+    buffer.reemplazar(np.array([0, DURACION]), np.zeros((2, 6)))
+    assert buffer.fusionar(np.array([0, 2 * DURACION, 4 * DURACION]), np.ones((3, 6)), DURACION) == 2
+    assert buffer.ultimo_timestamp() == 2 * DURACION
+    assert buffer.fusionar(np.array([4 * DURACION]), np.ones((1, 6)), DURACION, forzar=True) is None
+    assert buffer.ultimas(10)['timestamp'].tolist() == [0, DURACION, 2 * DURACION, 4 * DURACION]
+
+# ========== CACHE ==========
+
+def test_cache_reutiliza_y_sirve_limites_menores(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas(limite_minimo=200)
+
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert len(df) == 50 and df['timestamp'].iloc[-1] == INICIO
+    assert iguales(df, esperadas(INICIO - 49 * DURACION, INICIO, reloj.ms))
+    assert sesion.peticiones == [{'limit': 200, 'start': None, 'end': None}]
+
+    assert cache.obtener(sesion, 'BTCUSDT', '5', 200)['timestamp'].iloc[0] == INICIO - 199 * DURACION
+    assert len(sesion.peticiones) == 1 and cache.estadisticas()['aciertos'] == 1
+
+    cache.obtener(sesion, 'BTCUSDT', '5', 300)  # Más de lo guardado: descarga completa
+    cache.obtener(sesion, 'ETHUSDT', '5', 50)
+    stats = cache.estadisticas()
+    assert stats['descargas_completas'] == 3 and stats['claves'] == 2 and len(sesion.peticiones) == 3
+
+def test_cache_refresca_la_vela_en_curso(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas(vida_maxima=30)
+    cierre_inicial = cache.obtener(sesion, 'BTCUSDT', '5', 50)['close'].iloc[-1]
+
+    reloj.avanzar(29_000)
+    assert cache.obtener(sesion, 'BTCUSDT', '5', 50)['close'].iloc[-1] == cierre_inicial
+
+    reloj.avanzar(2_000)  # Pasada la vida máxima, aunque la vela no haya cerrado
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert df['timestamp'].iloc[-1] == INICIO and df['close'].iloc[-1] > cierre_inicial
+    assert df['close'].iloc[-1] == pytest.approx(float(vela(INICIO, reloj.ms)[4]), rel=1e-12)
+    assert sesion.peticiones[-1] == {'limit': 2, 'start': INICIO, 'end': None}
+    assert cache.estadisticas()['descargas_delta'] == 1
+
+def test_cache_caduca_al_cerrar_la_vela(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas(vida_maxima=10 * 60)
+    cache.obtener(sesion, 'BTCUSDT', '5', 50)
+
+    reloj.avanzar(3 * MINUTO - 1)
+    cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert len(sesion.peticiones) == 1
+
+    reloj.avanzar(1)  # Abre la siguiente vela
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert df['timestamp'].iloc[-1] == INICIO + DURACION and df['timestamp'].iloc[0] == INICIO - 48 * DURACION
+    cerrada = float(vela(INICIO, INICIO + DURACION)[4])
+    assert df['close'].iloc[-2] == pytest.approx(cerrada, rel=1e-12)  # La anterior, ya cerrada
+
+def test_cache_delta_tras_varias_velas(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas()
+    cache.obtener(sesion, 'BTCUSDT', '5', 200)
+
+    reloj.avanzar(10 * DURACION)
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 200)
+    fin = INICIO + 10 * DURACION
+    assert sesion.peticiones[-1] == {'limit': 12, 'start': INICIO, 'end': None}
+    assert iguales(df, esperadas(fin - 199 * DURACION, fin, reloj.ms))
+
+def test_cache_rellena_huecos_del_delta(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas()
+    cache.obtener(sesion, 'BTCUSDT', '5', 200)
+
+    reloj.avanzar(10 * DURACION)
+    sesion.perdidas = {INICIO + 3 * DURACION, INICIO + 4 * DURACION}
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 200)
+    fin = INICIO + 10 * DURACION
+    assert sesion.peticiones[-1] == {'limit': 2, 'start': INICIO + 3 * DURACION, 'end': INICIO + 4 * DURACION}
+    assert iguales(df, esperadas(fin - 199 * DURACION, fin, reloj.ms))
+    assert cache.estadisticas()['rellenos'] == 1
+
+def test_cache_acepta_huecos_del_exchange(reloj):
+    pausa = {INICIO + 3 * DURACION, INICIO + 4 * DURACION}
+    sesion = SesionVelasPrueba(reloj, sin_velas=pausa)
+    cache = CacheVelas()
+    cache.obtener(sesion, 'BTCUSDT', '5', 200)
+
+    reloj.avanzar(10 * DURACION)
+    df = cache.obtener(sesion, 'BTCUSDT', '5', 200)
+    assert len(df) == 200 and not pausa & set(df['timestamp'])
+    assert df['timestamp'].iloc[-1] == INICIO + 10 * DURACION
+    assert cache.estadisticas()['rellenos'] == 1 and cache.estadisticas()['descargas_completas'] == 1
+
+def test_cache_intervalo_sin_duracion_fija_e_invalidar(reloj):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas()
+    cache.obtener(sesion, 'BTCUSDT', 'M', 10)
+    cache.obtener(sesion, 'BTCUSDT', 'M', 10)
+    assert cache.estadisticas()['descargas_completas'] == 2
+
+    cache.obtener(sesion, 'BTCUSDT', '5', 10)
+    cache.obtener(sesion, 'ETHUSDT', '5', 10)
+    cache.invalidar('BTCUSDT')
+    cache.obtener(sesion, 'ETHUSDT', '5', 10)
+    cache.obtener(sesion, 'BTCUSDT', '5', 10)
+    assert cache.estadisticas()['aciertos'] == 1 and cache.estadisticas()['descargas_delta'] == 1
+
+def test_cache_error_de_bybit(reloj, capsys):
+    assert CacheVelas().obtener(SesionVelasPrueba(reloj, error=True), 'BTCUSDT', '5', 10) is None
+    assert 'params error' in capsys.readouterr().out
+
+def test_cargar_lista_ya_obtenida(reloj):
+    cache = CacheVelas()
+    cache.cargar('BTCUSDT', '5', [vela(INICIO - i * DURACION, reloj.ms) for i in range(60)])
+    sesion = SesionVelasPrueba(reloj)
+    assert len(cache.obtener(sesion, 'BTCUSDT', '5', 60)) == 60 and not sesion.peticiones
+
+    cache.cargar('BTCUSDT', '5', [vela(INICIO + 20 * DURACION, reloj.ms)])  # No continúa: sustituye
+    assert cache.obtener(sesion, 'BTCUSDT', '5', 1)['timestamp'].tolist() == [INICIO + 20 * DURACION]
+
+# ========== ARCHIVO EN DISCO ==========
+
+def test_archivo_solo_agrega_velas_nuevas(tmp_path):
+    archivo = ArchivoVelas(str(tmp_path))
+    timestamps = np.arange(10, dtype=np.int64) * DURACION
+    valores = np.arange(60, dtype=float).reshape(10, 6)
+    assert archivo.leer('BTCUSDT', '5').shape == (0,)
+
+    assert archivo.agregar('BTCUSDT', '5', timestamps[:6], valores[:6]) == 6
+    assert archivo.agregar('BTCUSDT', '5', timestamps[4:], valores[4:]) == 4
+    assert archivo.agregar('BTCUSDT', '5', timestamps, valores) == 0
+
+    datos = archivo.leer('BTCUSDT', '5')
+    assert isinstance(datos, np.memmap) and datos['timestamp'].tolist() == timestamps.tolist()
+    assert datos['close'].tolist() == valores[:, 3].tolist()
+    assert archivo.leer('BTCUSDT', '5', 3)['timestamp'].tolist() == timestamps[-3:].tolist()
+
+def test_archivo_descarta_registro_incompleto(tmp_path):
+    archivo = ArchivoVelas(str(tmp_path))
+    timestamps = np.arange(4, dtype=np.int64) * DURACION
+    archivo.agregar('BTCUSDT', '5', timestamps[:2], np.ones((2, 6)))
+    with open(archivo.ruta('BTCUSDT', '5'), 'ab') as f:
+        f.write(b'\0' * 10)  # Corte a mitad de un registro
+
+    otro = ArchivoVelas(str(tmp_path))
+    assert len(otro.leer('BTCUSDT', '5')) == 2
+    assert otro.agregar('BTCUSDT', '5', timestamps, np.ones((4, 6))) == 2
+    assert os.path.getsize(otro.ruta('BTCUSDT', '5')) == 4 * DTYPE_ARCHIVO.itemsize
+
+def test_cache_con_archivo_tras_reiniciar(reloj, tmp_path):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas(archivo=ArchivoVelas(str(tmp_path)))
+    cache.obtener(sesion, 'BTCUSDT', '5', 200)
+    archivadas = cache.archivo.leer('BTCUSDT', '5')
+    assert len(archivadas) == 199 and archivadas['timestamp'][-1] == INICIO - DURACION  # Sin la vela en curso
+
+    reloj.avanzar(3 * DURACION)
+    reiniciada = CacheVelas(archivo=ArchivoVelas(str(tmp_path)))
+    df = reiniciada.obtener(sesion, 'BTCUSDT', '5', 150)
+    fin = INICIO + 3 * DURACION
+    assert sesion.peticiones[-1] == {'limit': 6, 'start': INICIO - DURACION, 'end': None}
+    assert iguales(df, esperadas(fin - 149 * DURACION, fin, reloj.ms))
+    assert reiniciada.estadisticas()['descargas_completas'] == 0
+    assert len(reiniciada.archivo.leer('BTCUSDT', '5')) == 202
+
+def test_precarga_solo_el_tramo_final_sin_huecos(reloj, tmp_path):
+    archivo = ArchivoVelas(str(tmp_path))
+    timestamps = np.array([INICIO - i * DURACION for i in (30, 29, 10, 3, 2, 1)], dtype=np.int64)
+    archivo.agregar('BTCUSDT', '5', timestamps, np.ones((6, 6)))
+
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas(archivo=archivo)
+    assert len(cache.obtener(sesion, 'BTCUSDT', '5', 3)) == 3
+    assert sesion.peticiones == [{'limit': 3, 'start': INICIO - DURACION, 'end': None}]
+
+def test_archivo_de_sesion_separa_redes():
+    mainnet, testnet = archivo_de_sesion('mainnet'), archivo_de_sesion('testnet')
+    assert os.path.isabs(DIRECTORIO_ARCHIVO)
+    assert os.path.dirname(DIRECTORIO_ARCHIVO) == os.path.dirname(os.path.abspath(velas.__file__))
+    assert mainnet.ruta('BTCUSDT', '5') == os.path.join(DIRECTORIO_ARCHIVO, 'mainnet', 'BTCUSDT_5.velas')
+    assert mainnet.directorio != testnet.directorio
+
+def test_usar_archivo_descarta_lo_cargado(reloj, tmp_path):
+    sesion = SesionVelasPrueba(reloj)
+    cache = CacheVelas()
+    cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert cache.archivo is None
+
+    archivo = ArchivoVelas(str(tmp_path))
+    cache.usar_archivo(archivo)
+    assert cache.archivo is archivo and cache.estadisticas()['claves'] == 0
+    cache.obtener(sesion, 'BTCUSDT', '5', 50)
+    assert cache.estadisticas()['descargas_completas'] == 2 and len(archivo.leer('BTCUSDT', '5')) == 199
@@ -0,0 +1,304 @@
+import threading
+import time
+
+import numpy as np
+
+from grabador import grabador_mercado
+
+try:
+    from pybit.unified_trading import WebSocket
+    PYBIT_WEBSOCKET = True
+except ImportError:
+    PYBIT_WEBSOCKET = False
+
+# ========== TABLA LOCAL DE PRECIOS (TICKERS LINEALES) ==========
+
+class TablaPrecios:
+    """Último precio y mark price por símbolo, con la hora de cada actualización"""
+
+    def __init__(self):
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def actualizar(self, ticker):
+        """Incorpora un ticker de Bybit (dict con symbol y lastPrice/markPrice como strings)"""
+        symbol = ticker.get('symbol')
+        if not symbol:
+            return
+        with self._lock:
+            entrada = self._datos.setdefault(symbol, {})
+            for campo in ('lastPrice', 'markPrice'):
+                if ticker.get(campo):
+                    entrada[campo] = float(ticker[campo])
+            entrada['actualizado'] = time.time()
+
+    def obtener(self, symbol, max_edad=None):
+        """Copia de la entrada del símbolo, o None si no existe o tiene más de `max_edad` segundos"""
+        with self._lock:
+            entrada = self._datos.get(symbol)
+            if entrada is None:
+                return None
+            if max_edad is not None and time.time() - entrada['actualizado'] > max_edad:
+                return None
+            return dict(entrada)
+
+def _a_float(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+class SnapshotTickers:
+    """
+    Tabla completa de tickers lineales obtenida con UNA llamada
+    get_tickers(category="linear") por ciclo: índice símbolo -> fila y columnas
+    numpy con precio, mark price, turnover 24h, funding rate y próximo funding.
+    """
+
+    CAMPOS = ['lastPrice', 'markPrice', 'turnover24h', 'fundingRate']
+
+    def __init__(self, max_edad=30.0):
+        self.max_edad = max_edad
+        self.indice = {}
+        self.columnas = {campo: np.empty(0) for campo in self.CAMPOS}
+        self.proximo_funding = np.empty(0, dtype=np.int64)
+        self.actualizado = 0.0
+        self._lock = threading.Lock()
+        self.descargas = 0
+
+    def actualizar(self, session):
+        """Descarga todos los tickers lineales. Devuelve False si Bybit responde con error"""
+        response = session.get_tickers(category="linear")
+        if response['retCode'] != 0:
+            print(f"❌ Error obteniendo tickers: {response.get('retMsg')}")
+            return False
+
+        lista = response['result']['list']
+        grabador_mercado.grabar('tickers', {'snapshot': lista})
+        self.cargar(lista)
+        self.descargas += 1
+        return True
+
+    def cargar(self, lista):
+        """Sustituye la tabla por la lista de tickers de get_tickers (descargada o reproducida)"""
+        indice = {ticker['symbol']: i for i, ticker in enumerate(lista)}
+        columnas = {campo: np.array([_a_float(ticker.get(campo)) for ticker in lista]) for campo in self.CAMPOS}
+        proximo_funding = np.array([int(ticker['nextFundingTime']) if str(ticker.get('nextFundingTime', '')).isdigit()
+                                    else 0 for ticker in lista], dtype=np.int64)
+
+        # Sustituir la tabla de una vez para que los lectores nunca vean una mezcla
+        with self._lock:
+            self.indice, self.columnas, self.proximo_funding = indice, columnas, proximo_funding
+            self.actualizado = time.time()
+
+    def vigente(self):
+        return time.time() - self.actualizado <= self.max_edad
+
+    def obtener(self, symbol):
+        """Fila del símbolo con los nombres de campo de Bybit, o None si no está o la tabla es vieja"""
+        with self._lock:
+            if not self.vigente():
+                return None
+            fila = self.indice.get(symbol)
+            if fila is None:
+                return None
+            entrada = {campo: float(valores[fila]) for campo, valores in self.columnas.items()}
+            entrada['nextFundingTime'] = int(self.proximo_funding[fila])
+            entrada['actualizado'] = self.actualizado
+            return entrada
+
+class AlmacenFunding:
+    """
+    Funding rate previsto (%) y hora del próximo cobro de cada símbolo, copiados
+    en bloque de cada SnapshotTickers. Un dato vale hasta su `nextFundingTime`:
+    solo entonces se pide un snapshot nuevo (uno por snapshot, sirve para todos).
+    Un símbolo que no está en el snapshot se consulta solo, y si tampoco existe
+    no se vuelve a pedir hasta el siguiente snapshot.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.tasas = {}
+        self.proximo = {}
+        self.ausentes = set()
+        self._version = 0
+        self._version_recargada = None
+        self.recargas = 0
+        self.consultas_individuales = 0
+
+    def _sincronizar(self):
+        """Copia el funding del último snapshot si llegó uno nuevo"""
+        snapshot = self.snapshot
+        with snapshot._lock:
+            if snapshot.descargas == self._version:
+                return
+            simbolos = list(snapshot.indice)
+            tasas = (snapshot.columnas['fundingRate'] * 100).tolist()
+            proximo = snapshot.proximo_funding.tolist()
+            self._version = snapshot.descargas
+
+        self.tasas = {symbol: tasa for symbol, tasa in zip(simbolos, tasas) if tasa == tasa}  # sin NaN
+        self.proximo = dict(zip(simbolos, proximo))
+        self.ausentes = set()
+
+    def vigente(self, symbol):
+        return symbol in self.tasas and int(time.time() * 1000) < self.proximo.get(symbol, 0)
+
+    def _consultar(self, session, symbol):
+        """Funding de un solo símbolo con get_tickers(symbol=...), o None si no existe"""
+        self.consultas_individuales += 1
+        try:
+            response = session.get_tickers(category="linear", symbol=symbol)
+        except Exception as e:
+            print(f"⚠️  Error obteniendo funding de {symbol}: {e}")
+            return None
+        lista = response['result']['list'] if response.get('retCode') == 0 else []
+        tasa = _a_float(lista[0].get('fundingRate')) * 100 if lista else np.nan
+        if tasa != tasa:
+            return None
+        proximo = str(lista[0].get('nextFundingTime', ''))
+        self.tasas[symbol] = tasa
+        self.proximo[symbol] = int(proximo) if proximo.isdigit() else 0
+        return tasa
+
+    def funding_rate(self, symbol, session=None):
+        """Funding rate previsto en %, o None si no hay dato (ni recargando con `session`)"""
+        self._sincronizar()
+        if self.vigente(symbol) or session is None:
+            return self.tasas.get(symbol)
+
+        if symbol in self.tasas:
+            # Pasó la hora de funding: un snapshot nuevo sirve para todos (como mucho uno por snapshot)
+            if self._version_recargada != self._version:
+                self.recargas += 1
+                if self.snapshot.actualizar(session):
+                    self._sincronizar()
+                self._version_recargada = self._version
+            return self.tasas.get(symbol)
+
+        # No está en el snapshot (p.ej. deslistado): una consulta individual por snapshot
+        if symbol in self.ausentes:
+            return None
+        tasa = self._consultar(session, symbol)
+        if tasa is None:
+            self.ausentes.add(symbol)
+        return tasa
+
+if PYBIT_WEBSOCKET:
+    class _WebSocketEndpoint(WebSocket):
+        """WebSocket de pybit conectado a una URL fija (p.ej. el servidor local de pruebas)"""
+
+        def __init__(self, url, **kwargs):
+            self._url = url
+            super().__init__(**kwargs)
+
+        def _connect(self, url):
+            super()._connect(self._url)
+
+class StreamTickers:
+    """
+    Suscriptor WebSocket de tickers lineales en segundo plano que mantiene una
+    TablaPrecios. Los símbolos se suscriben la primera vez que se piden; si el dato
+    tiene más de `max_edad` segundos se usa el `snapshot` del ciclo y solo en
+    último caso REST.
+    """
+
+    def __init__(self, max_edad=5.0, snapshot=None):
+        self.max_edad = max_edad
+        self.snapshot = snapshot
+        self.tabla = TablaPrecios()
+        self._ws = None
+        self._suscritos = set()
+        self._lock = threading.Lock()
+        self.lecturas_ws = 0
+        self.lecturas_snapshot = 0
+        self.lecturas_rest = 0
+
+    def iniciar(self, testnet=False, url=None):
+        """Abre la conexión pública lineal. Devuelve False si no se pudo (se usará solo REST)"""
+        if not PYBIT_WEBSOCKET:
+            return False
+        try:
+            if url:
+                self._ws = _WebSocketEndpoint(url, channel_type="linear", testnet=testnet, retries=3,
+                                              ping_interval=1, ping_timeout=0.5)
+            else:
+                self._ws = WebSocket(channel_type="linear", testnet=testnet)
+            print("✅ Stream de tickers WebSocket conectado")
+            return True
+        except Exception as e:
+            print(f"⚠️  No se pudo conectar el stream de tickers ({e}) - Usando REST")
+            self._ws = None
+            return False
+
+    def detener(self):
+        if self._ws is not None:
+            try:
+                self._ws.exit()
+            except Exception:
+                pass
+            self._ws = None
+        with self._lock:
+            self._suscritos.clear()
+
+    def conectado(self):
+        return self._ws is not None and self._ws.is_connected()
+
+    def _on_ticker(self, mensaje):
+        ticker = mensaje.get('data', {})
+        grabador_mercado.grabar('tickers', {'tabla': ticker})
+        self.tabla.actualizar(ticker)
+
+    def suscribir(self, symbols):
+        """Suscribe los símbolos que aún no lo estén"""
+        if self._ws is None:
+            return
+        with self._lock:
+            nuevos = [symbol for symbol in symbols if symbol not in self._suscritos]
+            self._suscritos.update(nuevos)
+        if nuevos:
+            try:
+                self._ws.ticker_stream(symbol=nuevos, callback=self._on_ticker)
+            except Exception as e:
+                print(f"⚠️  Error suscribiendo tickers {nuevos}: {e}")
+                with self._lock:
+                    self._suscritos.difference_update(nuevos)
+
+    def ticker(self, symbol, session=None):
+        """
+        Entrada de la tabla (lastPrice, markPrice, actualizado) del símbolo. Si falta
+        o está vieja se pide por REST con `session`. None si no hay dato.
+        """
+        entrada = self.tabla.obtener(symbol, self.max_edad)
+        if entrada is not None and 'lastPrice' in entrada:
+            self.lecturas_ws += 1
+            return entrada
+
+        self.suscribir([symbol])
+        if self.snapshot is not None:
+            entrada = self.snapshot.obtener(symbol)
+            if entrada is not None and not np.isnan(entrada['lastPrice']):
+                self.lecturas_snapshot += 1
+                return entrada
+
+        if session is None:
+            return None
+
+        response = session.get_tickers(category="linear", symbol=symbol)
+        if response['retCode'] != 0 or not response['result']['list']:
+            return None
+
+        self.lecturas_rest += 1
+        grabador_mercado.grabar('tickers', {'tabla': response['result']['list'][0]})
+        self.tabla.actualizar(response['result']['list'][0])
+        return self.tabla.obtener(symbol)
+
+    def precio(self, symbol, session=None):
+        """Último precio del símbolo (dict en memoria; REST solo si está viejo) o None"""
+        entrada = self.ticker(symbol, session)
+        return entrada.get('lastPrice') if entrada else None
+
+# Snapshot y stream únicos para todo el proceso (hilo principal y monitoreo)
+snapshot_tickers = SnapshotTickers()
+stream_tickers = StreamTickers(snapshot=snapshot_tickers)
+almacen_funding = AlmacenFunding(snapshot_tickers)
@@ -0,0 +1,403 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from grabador import grabador_mercado
+
+# ========== CACHE COMPARTIDA DE VELAS (KLINES) ==========
+
+COLUMNAS_VELA = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover']
+MAX_VELAS_POR_PETICION = 1000  # Límite de get_kline en Bybit
+
+def intervalo_a_ms(intervalo):
+    """Duración de una vela en milisegundos ('5' -> 300000). None si no es fija (mensual)"""
+    intervalo = str(intervalo)
+    if intervalo.isdigit():
+        return int(intervalo) * 60 * 1000
+    if intervalo == 'D':
+        return 24 * 60 * 60 * 1000
+    if intervalo == 'W':
+        return 7 * 24 * 60 * 60 * 1000
+    return None
+
+def parsear_klines(lista):
+    """Convierte la lista de get_kline (más reciente primero, strings) en arrays cronológicos"""
+    filas = np.array(lista[::-1], dtype=object).reshape(-1, len(COLUMNAS_VELA))
+    timestamps = filas[:, 0].astype(np.int64)
+    valores = pd.DataFrame(filas[:, 1:]).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return timestamps, valores
+
+class BufferVelas:
+    """Ring buffer de velas de un (símbolo, intervalo) en columnas numpy de ancho fijo"""
+
+    def __init__(self, capacidad=1000):
+        self.capacidad = capacidad
+        self.timestamps = np.zeros(capacidad, dtype=np.int64)
+        self.valores = np.full((capacidad, len(COLUMNAS_VELA) - 1), np.nan)
+        self.inicio = 0
+        self.cantidad = 0
+
+    def __len__(self):
+        return self.cantidad
+
+    def reemplazar(self, timestamps, valores):
+        """Sustituye todo el contenido por las velas dadas (orden cronológico)"""
+        timestamps = timestamps[-self.capacidad:]
+        valores = valores[-self.capacidad:]
+        n = len(timestamps)
+        self.timestamps[:n] = timestamps
+        self.valores[:n] = valores
+        self.inicio = 0
+        self.cantidad = n
+
+    def _agregar(self, timestamp, fila):
+        """Añade una vela al final; con el buffer lleno sobrescribe la más antigua"""
+        posicion = (self.inicio + self.cantidad) % self.capacidad
+        if self.cantidad == self.capacidad:
+            self.inicio = (self.inicio + 1) % self.capacidad
+        else:
+            self.cantidad += 1
+        self.timestamps[posicion] = timestamp
+        self.valores[posicion] = fila
+
+    def fusionar(self, timestamps, valores, duracion, forzar=False):
+        """
+        Incorpora velas iguales o más recientes que la última guardada (esa se
+        sobrescribe, ya que estaba en curso). Devuelve el índice de la primera vela
+        que dejaría un hueco sin incorporarla, o None si se fusionaron todas.
+        Con `forzar` se aceptan los huecos.
+        """
+        for i, (timestamp, fila) in enumerate(zip(timestamps, valores)):
+            ultimo = self.ultimo_timestamp()
+            if ultimo is not None and timestamp < ultimo:
+                continue
+            if ultimo is not None and timestamp == ultimo:
+                self.valores[(self.inicio + self.cantidad - 1) % self.capacidad] = fila
+                continue
+            if ultimo is not None and timestamp != ultimo + duracion and not forzar:
+                return i
+            self._agregar(timestamp, fila)
+        return None
+
+    def _indices(self, n):
+        n = min(n, self.cantidad)
+        return (self.inicio + self.cantidad - n + np.arange(n)) % self.capacidad
+
+    def ultimo_timestamp(self):
+        """Timestamp (ms) de la vela más reciente, o None si está vacío"""
+        if self.cantidad == 0:
+            return None
+        return int(self.timestamps[(self.inicio + self.cantidad - 1) % self.capacidad])
+
+    def ultimas(self, n):
+        """Las últimas `n` velas como DataFrame con el formato de obtener_datos_para_volume_regression"""
+        indices = self._indices(n)
+        df = pd.DataFrame(self.valores[indices], columns=COLUMNAS_VELA[1:])
+        df.insert(0, 'timestamp', self.timestamps[indices])
+        return df
+
+# ========== ARCHIVO EN DISCO DE VELAS CERRADAS ==========
+
+DTYPE_ARCHIVO = np.dtype([('timestamp', '<i8')] + [(columna, '<f8') for columna in COLUMNAS_VELA[1:]])
+DIRECTORIO_ARCHIVO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archivo_velas')
+
+class ArchivoVelas:
+    """
+    Archivo de velas cerradas en disco, solo de añadido: un fichero binario por
+    (símbolo, intervalo) con registros de ancho fijo (timestamp int64 + columnas
+    float64) que se lee con np.memmap sin copiar. Permite reiniciar el bot con el
+    historial ya cargado. Cada origen de datos necesita su propio directorio
+    (ver archivo_de_sesion): las velas se fusionan solo por timestamp.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._ultimos = {}
+        self._lock = threading.Lock()
+
+    def ruta(self, symbol, intervalo):
+        return os.path.join(self.directorio, f"{symbol}_{intervalo}.velas")
+
+    def leer(self, symbol, intervalo, n=None):
+        """
+        Últimas `n` velas archivadas como array estructurado en memoria mapeada
+        (`arr['close']` es una vista sin copia). Array vacío si no hay archivo.
+        """
+        ruta = self.ruta(symbol, intervalo)
+        registros = os.path.getsize(ruta) // DTYPE_ARCHIVO.itemsize if os.path.exists(ruta) else 0
+        if registros == 0:
+            return np.empty(0, dtype=DTYPE_ARCHIVO)
+        # Un registro a medio escribir (corte de luz) queda fuera al redondear
+        datos = np.memmap(ruta, dtype=DTYPE_ARCHIVO, mode='r', shape=(registros,))
+        return datos if n is None else datos[-n:]
+
+    def _ultimo_timestamp(self, symbol, intervalo):
+        clave = (symbol, str(intervalo))
+        if clave not in self._ultimos:
+            datos = self.leer(symbol, intervalo, 1)
+            self._ultimos[clave] = int(datos['timestamp'][-1]) if len(datos) else None
+        return self._ultimos[clave]
+
+    def agregar(self, symbol, intervalo, timestamps, valores):
+        """Añade al final las velas posteriores a la última archivada. Devuelve cuántas"""
+        with self._lock:
+            ultimo = self._ultimo_timestamp(symbol, intervalo)
+            nuevas = timestamps > ultimo if ultimo is not None else np.ones(len(timestamps), dtype=bool)
+            if not nuevas.any():
+                return 0
+
+            registros = np.empty(int(nuevas.sum()), dtype=DTYPE_ARCHIVO)
+            registros['timestamp'] = timestamps[nuevas]
+            for i, columna in enumerate(COLUMNAS_VELA[1:]):
+                registros[columna] = valores[nuevas, i]
+
+            ruta = self.ruta(symbol, intervalo)
+            os.makedirs(self.directorio, exist_ok=True)
+            if os.path.exists(ruta):
+                # Descartar un registro incompleto antes de seguir añadiendo
+                sobrante = os.path.getsize(ruta) % DTYPE_ARCHIVO.itemsize
+                if sobrante:
+                    os.truncate(ruta, os.path.getsize(ruta) - sobrante)
+            with open(ruta, 'ab') as archivo:
+                archivo.write(registros.tobytes())
+
+            self._ultimos[(symbol, str(intervalo))] = int(registros['timestamp'][-1])
+            return len(registros)
+
+def archivo_de_sesion(sesion):
+    """ArchivoVelas de una red de Bybit ('mainnet' o 'testnet') junto a este módulo"""
+    return ArchivoVelas(os.path.join(DIRECTORIO_ARCHIVO, sesion))
+
+def registros_a_columnas(registros):
+    """Separa un array de ArchivoVelas en (timestamps, valores) como parsear_klines"""
+    valores = np.column_stack([registros[columna] for columna in COLUMNAS_VELA[1:]])
+    return np.asarray(registros['timestamp'], dtype=np.int64), valores
+
+class CacheVelas:
+    """
+    Cache de velas compartida por todo el proceso, por (símbolo, intervalo).
+    Una sola descarga sirve cualquier `limite` menor o igual a lo guardado y la
+    entrada caduca cuando cierra la vela que estaba en curso al descargarla o, si
+    es antes, a los `vida_maxima` segundos, para que la vela en curso no se quede
+    congelada. Al caducar solo se piden las velas nuevas (`start` = última vela
+    guardada, que así se refresca) y los huecos se rellenan antes de fusionarlas.
+    Con un `archivo` las velas cerradas se guardan en disco y un buffer nuevo se
+    precarga desde él, así que tras reiniciar solo se descargan las velas nuevas.
+    """
+
+    def __init__(self, capacidad=1000, limite_minimo=200, archivo=None, vida_maxima=30):
+        self.capacidad = capacidad
+        self.limite_minimo = limite_minimo  # Descargar al menos esto para servir a todos los consumidores
+        self.vida_maxima = vida_maxima      # Segundos que se sirve la vela en curso sin refrescarla (ciclo de monitoreo)
+        self.archivo = archivo
+        self._buffers = {}
+        self._expira = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.descargas_completas = 0
+        self.descargas_delta = 0
+        self.rellenos = 0
+
+    def _vigente(self, clave, limite, ahora_ms):
+        buffer = self._buffers.get(clave)
+        expira = self._expira.get(clave)
+        return (buffer is not None and expira is not None and
+                len(buffer) >= limite and ahora_ms < expira)
+
+    def _descargar(self, session, symbol, intervalo, limite, **rango):
+        """Descarga velas (arrays cronológicos) o None si Bybit devuelve error"""
+        response = session.get_kline(
+            category="linear",
+            symbol=symbol,
+            interval=str(intervalo),
+            limit=limite,
+            **rango
+        )
+
+        if response['retCode'] != 0:
+            print(f"❌ Error obteniendo datos para {symbol}: {response.get('retMsg')}")
+            return None
+
+        grabador_mercado.grabar('klines', {'symbol': symbol, 'interval': str(intervalo),
+                                           'list': response['result']['list']})
+        return parsear_klines(response['result']['list'])
+
+    def cargar(self, symbol, intervalo, lista):
+        """
+        Incorpora una lista de get_kline ya obtenida (p.ej. reproducida de una
+        grabación): se fusiona si continúa lo guardado y si no sustituye el buffer.
+        """
+        clave = (symbol, str(intervalo))
+        timestamps, valores = parsear_klines(lista)
+        if len(timestamps) == 0:
+            return
+        with self._lock:
+            buffer = self._buffers.get(clave)
+            if buffer is None:
+                buffer = self._buffers[clave] = BufferVelas(self.capacidad)
+            duracion = intervalo_a_ms(intervalo)
+            if not duracion or buffer.fusionar(timestamps, valores, duracion) is not None:
+                buffer.reemplazar(timestamps, valores)
+            self._marcar_expiracion(clave, buffer, intervalo)
+
+    def _marcar_expiracion(self, clave, buffer, intervalo):
+        """Caduca al cerrar la vela en curso o a los `vida_maxima` s (sin duración fija, no se reutiliza)"""
+        duracion = intervalo_a_ms(intervalo)
+        ultimo = buffer.ultimo_timestamp()
+        if not duracion or ultimo is None:
+            self._expira[clave] = 0
+            return
+        self._expira[clave] = min(ultimo + duracion, int((time.time() + self.vida_maxima) * 1000))
+
+    def _precargar(self, clave):
+        """Crea el buffer de una clave desde el archivo en disco (si lo hay)"""
+        registros = self.archivo.leer(*clave, self.capacidad)
+        if len(registros) == 0:
+            return None
+        # Solo el tramo final sin huecos (una descarga completa pudo dejar uno en el archivo)
+        duracion = intervalo_a_ms(clave[1])
+        if duracion:
+            cortes = np.flatnonzero(np.diff(registros['timestamp']) != duracion)
+            if len(cortes):
+                registros = registros[cortes[-1] + 1:]
+        buffer = self._buffers[clave] = BufferVelas(self.capacidad)
+        buffer.reemplazar(*registros_a_columnas(registros))
+        return buffer
+
+    def _archivar(self, clave, buffer):
+        """Guarda en disco las velas cerradas del buffer (todas menos la que está en curso)"""
+        if self.archivo is None or len(buffer) < 2:
+            return
+        indices = buffer._indices(len(buffer))[:-1]
+        self.archivo.agregar(*clave, buffer.timestamps[indices], buffer.valores[indices])
+
+    def _actualizar_delta(self, session, clave, buffer, desde, duracion, ahora_ms):
+        """
+        Pide solo las velas desde la última guardada y las fusiona, rellenando huecos.
+        Devuelve False si hay que recurrir a una descarga completa.
+        """
+        symbol, intervalo = clave
+        faltan = (ahora_ms - desde) // duracion + 1
+        if faltan > self.capacidad:
+            return False
+
+        descarga = self._descargar(session, symbol, intervalo, min(faltan + 1, MAX_VELAS_POR_PETICION), start=desde)
+        if descarga is None:
+            return False
+        timestamps, valores = descarga
+
+        with self._lock:
+            self.descargas_delta += 1
+
+        while len(timestamps):
+            with self._lock:
+                hueco = buffer.fusionar(timestamps, valores, duracion)
+                if hueco is None:
+                    break
+                esperado = buffer.ultimo_timestamp() + duracion
+
+            # Hueco entre lo guardado y lo recibido: rellenar antes de continuar
+            fin = int(timestamps[hueco]) - duracion
+            cantidad = (fin - esperado) // duracion + 1
+            if cantidad > self.capacidad:
+                return False
+
+            relleno = self._descargar(session, symbol, intervalo, min(cantidad, MAX_VELAS_POR_PETICION),
+                                      start=esperado, end=fin)
+            with self._lock:
+                self.rellenos += 1
+                if relleno is not None and len(relleno[0]) and relleno[0][0] == esperado:
+                    buffer.fusionar(relleno[0], relleno[1], duracion)
+                else:
+                    # El exchange no tiene esas velas (p.ej. pausa de trading): aceptar el hueco
+                    buffer.fusionar(timestamps[hueco:hueco + 1], valores[hueco:hueco + 1], duracion, forzar=True)
+                    hueco += 1
+            timestamps, valores = timestamps[hueco:], valores[hueco:]
+
+        return True
+
+    def obtener(self, session, symbol, intervalo, limite):
+        """Últimas `limite` velas (la última es la vela en curso) o None si falla la descarga"""
+        clave = (symbol, str(intervalo))
+        ahora_ms = int(time.time() * 1000)
+        duracion = intervalo_a_ms(intervalo)
+
+        with self._lock:
+            if self._vigente(clave, limite, ahora_ms):
+                self.aciertos += 1
+                return self._buffers[clave].ultimas(limite)
+
+            buffer = self._buffers.get(clave)
+            if buffer is None and self.archivo is not None:
+                buffer = self._precargar(clave)
+            desde = buffer.ultimo_timestamp() if buffer is not None and len(buffer) >= limite else None
+
+        # Con historial suficiente basta con pedir las velas nuevas
+        if desde is not None and duracion:
+            if self._actualizar_delta(session, clave, buffer, desde, duracion, ahora_ms):
+                with self._lock:
+                    self._marcar_expiracion(clave, buffer, intervalo)
+                    self._archivar(clave, buffer)
+                    return buffer.ultimas(limite)
+
+        descarga = min(max(limite, self.limite_minimo), self.capacidad, MAX_VELAS_POR_PETICION)
+        resultado = self._descargar(session, symbol, intervalo, descarga)
+        if resultado is None:
+            return None
+
+        with self._lock:
+            self.descargas_completas += 1
+            buffer = self._buffers.get(clave)
+            if buffer is None:
+                buffer = self._buffers[clave] = BufferVelas(self.capacidad)
+            buffer.reemplazar(*resultado)
+            self._marcar_expiracion(clave, buffer, intervalo)
+            self._archivar(clave, buffer)
+            return buffer.ultimas(limite)
+
+    def usar_archivo(self, archivo):
+        """
+        Cambia el archivo en disco (None = sin archivo) y descarta lo cargado en
+        memoria, que podría venir de otro origen de datos.
+        """
+        with self._lock:
+            self.archivo = archivo
+            self._buffers.clear()
+            self._expira.clear()
+
+    def invalidar(self, symbol=None):
+        """Fuerza la siguiente descarga de un símbolo (o de todos)"""
+        with self._lock:
+            for clave in list(self._expira):
+                if symbol is None or clave[0] == symbol:
+                    self._expira[clave] = 0
+
+    def estadisticas(self):
+        """Contadores de aciertos/fallos de la cache"""
+        with self._lock:
+            descargas = self.descargas_completas + self.descargas_delta
+            total = self.aciertos + descargas
+            return {
+                'aciertos': self.aciertos,
+                'fallos': descargas,
+                'descargas_completas': self.descargas_completas,
+                'descargas_delta': self.descargas_delta,
+                'rellenos': self.rellenos,
+                'tasa_aciertos': (self.aciertos / total * 100) if total else 0.0,
+                'claves': len(self._buffers)
+            }
+
+    def mostrar_estadisticas(self):
+        """Muestra el uso de la cache de velas"""
+        stats = self.estadisticas()
+        print(f"📦 Cache de velas: {stats['aciertos']} aciertos / {stats['fallos']} descargas "
+              f"({stats['tasa_aciertos']:.1f}% aciertos) en {stats['claves']} símbolos")
+        print(f"   📥 Completas: {stats['descargas_completas']} | Delta: {stats['descargas_delta']} | "
+              f"Rellenos de huecos: {stats['rellenos']}")
+
+# Cache única para todo el proceso (hilo principal y monitoreo). El archivo en disco
+# lo activa cada script según la red a la que se conecta (usar_archivo)
+cache_velas = CacheVelas()